@@ -0,0 +1,301 @@
+# coding utf-8
+"""
+Benchmarks of the hot paths of sqlcollection, on a synthetic SQLite database.
+
+The schema reproduces the client / project / hour foreign key chain (with a
+team table above client, so lookups can go 3 levels deep). Each benchmark is
+repeated and the min / median durations are written as JSON, to be compared
+between commits:
+
+    python -m benchmarks.run --sizes 1000 10000 --output before.json
+    python -m benchmarks.run --sizes 1000 10000 --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.schema import Column, Table, MetaData, ForeignKey
+from sqlalchemy.types import Integer, String, DateTime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlcollection import Client
+from sqlcollection.decoder import RowDecoder
+from sqlcollection.utils import json_set, json_to_one_level
+
+
+def create_database(directory, size):
+    """
+    Create the synthetic database: size hours, size / 10 projects, size / 100 clients and 10 teams.
+    Args:
+        directory (unicode): The directory of the SQLite files.
+        size (int): The number of rows of the hour table.
+
+    Returns:
+        (DB): The database.
+    """
+    engine = create_engine(u"sqlite:///{}".format(os.path.join(directory, u"benchmark")))
+    metadata = MetaData()
+    team = Table(u"team", metadata,
+                 Column(u"id", Integer(), primary_key=True),
+                 Column(u"name", String(50)))
+    client = Table(u"client", metadata,
+                   Column(u"id", Integer(), primary_key=True),
+                   Column(u"name", String(50)),
+                   Column(u"team", Integer(), ForeignKey(u"team.id")))
+    project = Table(u"project", metadata,
+                    Column(u"id", Integer(), primary_key=True),
+                    Column(u"name", String(50)),
+                    Column(u"client", Integer(), ForeignKey(u"client.id")))
+    hour = Table(u"hour", metadata,
+                 Column(u"id", Integer(), primary_key=True),
+                 Column(u"project", Integer(), ForeignKey(u"project.id")),
+                 Column(u"minutes", Integer()),
+                 Column(u"comment", String(200)),
+                 Column(u"started_at", DateTime()))
+    metadata.create_all(engine)
+
+    clients, projects = max(size // 100, 1), max(size // 10, 1)
+    start = datetime.datetime(2017, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(team.insert(), [{u"id": index, u"name": u"Team {}".format(index)} for index in range(1, 11)])
+        connection.execute(client.insert(), [
+            {u"id": index, u"name": u"Client {}".format(index), u"team": index % 10 + 1}
+            for index in range(1, clients + 1)
+        ])
+        connection.execute(project.insert(), [
+            {u"id": index, u"name": u"Project {}".format(index), u"client": index % clients + 1}
+            for index in range(1, projects + 1)
+        ])
+        connection.execute(hour.insert(), [
+            {u"id": index, u"project": index % projects + 1, u"minutes": index % 480,
+             u"comment": u"Work on item {}".format(index), u"started_at": start + datetime.timedelta(minutes=index)}
+            for index in range(1, size + 1)
+        ])
+    engine.dispose()
+
+    return Client(url=u"sqlite:///{}".format(directory)).benchmark
+
+
+def measure(function, repeat, setup=None):
+    """
+    Time a function.
+    Args:
+        function (function): The function to time, given the result of setup.
+        repeat (int): Number of runs.
+        setup (function): Called before each run, not timed.
+
+    Returns:
+        (dict): The min and median durations in seconds, with the value returned by the last run.
+    """
+    durations = []
+    value = None
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        started_at = time.perf_counter()
+        value = function(argument)
+        durations.append(time.perf_counter() - started_at)
+
+    durations.sort()
+    return OrderedDict([
+        (u"min", durations[0]),
+        (u"median", durations[len(durations) // 2]),
+        (u"value", value)
+    ])
+
+
+def get_benchmarks(db, size):
+    """
+    Build the benchmarks for a database.
+    Args:
+        db (DB): The synthetic database.
+        size (int): The number of rows of the hour table.
+
+    Returns:
+        (list of tuple): The (name, function, setup) of each benchmark, functions returning the number of items.
+    """
+    hour = db.hour
+    query = {
+        u"minutes": {u"$gte": 30, u"$lt": 300},
+        u"$or": [{u"project.name": {u"$like": u"Project 1%"}}, {u"project.client.name": u"Client 2"}]
+    }
+    fields_mapping = hour.get_plan(auto_lookup=2).fields_mapping
+    rows_cursor = hour.find(auto_lookup=3)
+    with db.get_engine().connect() as connection:
+        rows = [tuple(row) for row in connection.execute(rows_cursor._serialize())]
+    # Built once, like the decoder of a cursor: the benchmark times the decoding, not the compilation.
+    decoder = RowDecoder(rows_cursor._fields)
+    documents = [decoder.decode(row) for row in rows[:10000]]
+    labels = [label.name for label in rows_cursor._fields]
+    last_page = max(size - 100, 0)
+
+    def insert_rows(_):
+        return len(hour.insert_many([
+            {u"project": 1, u"minutes": -1, u"comment": u"Inserted", u"started_at": datetime.datetime(2018, 1, 1)}
+            for _ in range(1000)
+        ]).inserted_ids)
+
+    def insert_one(_):
+        for _ in range(100):
+            hour.insert_one({u"project": 1, u"minutes": -2, u"comment": u"Inserted"})
+        return 100
+
+    def build_nested(_):
+        for row in rows[:10000]:
+            nested = {}
+            for label, value in zip(labels, row):
+                json_set(nested, label, value)
+        return len(rows[:10000])
+
+    benchmarks = [
+        (u"plan.generate_select_dependencies[auto_lookup=3]",
+         lambda _: len(hour.generate_select_dependencies(hour.generate_lookup(hour._table, 3))[0]), None),
+        (u"plan.get_plan[cached]", lambda _: len(hour.get_plan(auto_lookup=3).labels), None),
+        (u"query._parse_query", lambda _: len(hour._parse_query(query, fields_mapping).clauses), None),
+        (u"query._get_where[template]", lambda _: len(hour._get_where(query, hour.get_plan(auto_lookup=2))[1]), None),
+        (u"decode.RowDecoder", lambda _: len([decoder.decode(row) for row in rows[:10000]]), None),
+        (u"decode.json_set", build_nested, None),
+        (u"decode.json_to_one_level", lambda _: len([json_to_one_level(document) for document in documents]), None),
+    ]
+
+    for auto_lookup in range(4):
+        benchmarks.append((
+            u"find[auto_lookup={}]".format(auto_lookup),
+            lambda _, auto_lookup=auto_lookup: len(list(hour.find(auto_lookup=auto_lookup))),
+            None
+        ))
+
+    benchmarks += [
+        (u"find.filtered[auto_lookup=2]", lambda _: len(list(hour.find(query, auto_lookup=2))), None),
+        (u"find.count", lambda _: hour.find({u"minutes": {u"$gte": 30}}).count(), None),
+        (u"find.deep_skip", lambda _: len(list(hour.find().sort(u"id").skip(last_page).limit(100))), None),
+        (u"find.keyset", lambda _: len(list(hour.find().sort(u"id").after({u"id": last_page}).limit(100))), None),
+        (u"find.to_columns", lambda _: len(hour.find().to_columns()[u"id"]), None),
+        (u"read.next_find[100]", lambda _: len([
+            next(iter(hour.find({u"id": key}, auto_lookup=1))) for key in range(1, 101)
+        ]), None),
+        (u"read.find_one[100]", lambda _: len([
+            hour.find_one({u"id": key}, auto_lookup=1) for key in range(1, 101)
+        ]), None),
+        (u"read.get[100]", lambda _: len([hour.get(key, auto_lookup=1) for key in range(1, 101)]), None),
+        (u"read.get_many[100]", lambda _: len(hour.get_many(list(range(1, 101)), auto_lookup=1)), None),
+        (u"write.insert_one[100]", insert_one, None),
+        (u"write.insert_many[1000]", insert_rows, None),
+        (u"write.update_many", lambda _: hour.update_many(
+            {u"minutes": {u"$lt": 0}}, {u"$set": {u"comment": u"Updated"}}
+        ).matched_count, None),
+        (u"write.delete_many", lambda _: hour.delete_many({u"minutes": {u"$lt": 0}}).deleted_count,
+         lambda: insert_rows(None)),
+    ]
+
+    return benchmarks
+
+
+def get_commit():
+    """
+    Get the current git commit, if any.
+    Returns:
+        (unicode): The commit hash, None outside of a git repository.
+    """
+    try:
+        return subprocess.check_output(
+            [u"git", u"rev-parse", u"HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode(u"ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat, selection=None):
+    """
+    Run the benchmarks for each database size.
+    Args:
+        sizes (list of int): The numbers of rows of the hour table.
+        repeat (int): Number of runs of each benchmark.
+        selection (unicode): Only run the benchmarks the name of which contains this string.
+
+    Returns:
+        (dict): The results and the environment they were measured in.
+    """
+    results = []
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            db = create_database(directory, size)
+            for name, function, setup in get_benchmarks(db, size):
+                if selection and selection not in name:
+                    continue
+                result = measure(function, repeat, setup)
+                result[u"items"] = result.pop(u"value")
+                result[u"name"] = name
+                result[u"size"] = size
+                results.append(result)
+                print(u"{:<50} {:>8} {:>12.6f}s".format(name, size, result[u"median"]))
+            db.get_engine().dispose()
+        finally:
+            shutil.rmtree(directory)
+
+    return OrderedDict([
+        (u"commit", get_commit()),
+        (u"date", datetime.datetime.utcnow().isoformat()),
+        (u"python", platform.python_version()),
+        (u"sqlalchemy", sqlalchemy.__version__),
+        (u"sqlite", sqlite3.sqlite_version),
+        (u"repeat", repeat),
+        (u"results", results)
+    ])
+
+
+def compare(results, baseline):
+    """
+    Print the median durations of a run next to the ones of a previous run.
+    Args:
+        results (dict): The results of the run.
+        baseline (dict): The results of the previous run.
+    """
+    previous = dict(((result[u"name"], result[u"size"]), result) for result in baseline[u"results"])
+    print(u"\n{:<50} {:>8} {:>12} {:>12} {:>8}".format(u"benchmark", u"size", u"before", u"after", u"speedup"))
+    for result in results[u"results"]:
+        before = previous.get((result[u"name"], result[u"size"]))
+        if before is None:
+            continue
+        print(u"{:<50} {:>8} {:>11.6f}s {:>11.6f}s {:>7.2f}x".format(
+            result[u"name"], result[u"size"], before[u"median"], result[u"median"],
+            before[u"median"] / result[u"median"] if result[u"median"] else float(u"inf")
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u"Benchmarks of sqlcollection on SQLite.")
+    parser.add_argument(u"--sizes", type=int, nargs=u"+", default=[1000, 10000],
+                        help=u"Numbers of rows of the hour table.")
+    parser.add_argument(u"--repeat", type=int, default=5, help=u"Number of runs of each benchmark.")
+    parser.add_argument(u"--filter", default=None, help=u"Only run the benchmarks containing this string.")
+    parser.add_argument(u"--output", default=None, help=u"File where the JSON results are written.")
+    parser.add_argument(u"--compare", default=None, help=u"JSON results of a previous run to compare with.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.filter)
+
+    if args.output:
+        with open(args.output, u"w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == u"__main__":
+    main()
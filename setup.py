@@ -8,7 +8,11 @@ setup(
     name='sqlcollection',
     version='0.3.0',
     packages=['sqlcollection', 'sqlcollection.results'],
-    install_requires=["SQLAlchemy>=1.2,<2"],
+    install_requires=["SQLAlchemy>=1.4,<2"],
+    extras_require={
+        "asyncio": ["SQLAlchemy[asyncio]>=1.4,<2"],
+        "numpy": ["numpy"]
+    },
     url='https://github.com/knlambert/sql-collection.git',
     keywords=[]
 )
\ No newline at end of file
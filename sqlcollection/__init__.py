@@ -1,5 +1,6 @@
 import sys
 from .client import Client
+from .operations import InsertOne, UpdateMany, DeleteMany
 
 # Ascending sort order.
 ASCENDING = 1
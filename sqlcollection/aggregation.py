@@ -0,0 +1,264 @@
+# coding utf-8
+"""
+Contains AggregationPipeline Class.
+"""
+
+from collections import OrderedDict
+from sqlalchemy import func, literal
+from sqlalchemy.sql import and_
+from .cursor import Cursor
+from .compatibility import UNICODE_TYPE
+
+
+class AggregationPipeline(object):
+    """
+    Compiles a MongoDB like aggregation pipeline into a single select, executed by a cursor.
+    Supported stages: $lookup, $match, $group, $sort, $project, $skip and $limit.
+    """
+    accumulators = {
+        u"$sum": func.sum,
+        u"$avg": func.avg,
+        u"$min": func.min,
+        u"$max": func.max
+    }
+
+    def __init__(self, collection, pipeline, auto_lookup=0):
+        """
+        Construct the object.
+        Args:
+            collection (Collection): The collection the pipeline runs on.
+            pipeline (list of dict): The stages.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+        """
+        self._collection = collection
+        self._pipeline = pipeline
+        self._auto_lookup = auto_lookup
+
+    @staticmethod
+    def _get_stage(stage):
+        """
+        Split a stage into its operator and its specification.
+        Args:
+            stage (dict): The stage, like {"$limit": 10}.
+
+        Returns:
+            (unicode, object): The operator and the specification.
+        """
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise ValueError(u"A pipeline stage must be a dict with a single operator.")
+        return list(stage.items())[0]
+
+    def _convert_lookup(self, spec):
+        """
+        Convert a $lookup stage into the lookup format of the collections.
+        The local field can be a path through a previous lookup (e.g. "project.client").
+        Args:
+            spec (dict): The $lookup specification (from, localField, foreignField, as).
+
+        Returns:
+            (dict): The lookup relation.
+        """
+        local_path = spec[u"localField"].split(u".")
+        return {
+            u"to": spec.get(u"to", u".".join(local_path[:-1]) or self._collection._table.name),
+            u"localField": local_path[-1],
+            u"from": spec[u"from"],
+            u"foreignField": spec[u"foreignField"],
+            u"as": spec[u"as"]
+        }
+
+    @staticmethod
+    def _expression(value, fields):
+        """
+        Convert a pipeline expression: a "$field.path" reference or a constant.
+        Args:
+            value (object): The expression.
+            fields (OrderedDict): The fields available at this stage (unicode: expression).
+
+        Returns:
+            (sqlalchemy.sql.elements.ColumnElement): The SQL expression.
+        """
+        if isinstance(value, UNICODE_TYPE) and value.startswith(u"$"):
+            if value[1:] not in fields:
+                raise ValueError(u"Unknown field {}.".format(value))
+            return fields[value[1:]]
+        return literal(value)
+
+    def _check_query(self, query, fields):
+        """
+        Check a $match stage only filters on the fields available at its stage.
+        Args:
+            query (dict): The $match specification.
+            fields (OrderedDict): The fields available at this stage (unicode: expression).
+        """
+        queries = [query]
+        while queries:
+            filt = queries.pop()
+            if isinstance(filt, list):
+                queries.extend(filt)
+                continue
+
+            for key, value in filt.items():
+                if key in self._collection._conjunctions and isinstance(value, list):
+                    queries.extend(value)
+                elif key not in fields:
+                    raise ValueError(u"Unknown field {}.".format(key))
+
+    def _group(self, spec, fields):
+        """
+        Compile a $group stage.
+        Args:
+            spec (dict): The $group specification, with an _id and accumulators.
+            fields (OrderedDict): The fields available at this stage (unicode: expression).
+
+        Returns:
+            (OrderedDict, list): The fields after the stage and the GROUP BY clauses.
+        """
+        output = OrderedDict()
+        group_by = []
+
+        group_id = spec.get(u"_id")
+        if isinstance(group_id, dict):
+            for key, value in group_id.items():
+                output[u"_id.{}".format(key)] = self._expression(value, fields)
+                group_by.append(output[u"_id.{}".format(key)])
+        elif group_id is not None:
+            output[u"_id"] = self._expression(group_id, fields)
+            group_by.append(output[u"_id"])
+
+        for name, accumulator in spec.items():
+            if name == u"_id":
+                continue
+
+            operator, argument = self._get_stage(accumulator)
+            if operator == u"$count" or (operator == u"$sum" and argument == 1):
+                output[name] = func.count()
+            elif operator in self.accumulators:
+                output[name] = self.accumulators[operator](self._expression(argument, fields))
+            else:
+                raise ValueError(u"Unsupported accumulator {}.".format(operator))
+
+        return output, group_by
+
+    def _project(self, spec, fields):
+        """
+        Compile a $project stage: inclusions (1), exclusions (0) and computed fields ("$field.path").
+        Args:
+            spec (dict): The $project specification.
+            fields (OrderedDict): The fields available at this stage (unicode: expression).
+
+        Returns:
+            (OrderedDict): The fields after the stage.
+        """
+        def matches(key, name):
+            return key == name or key.startswith(name + u".")
+
+        if all(value in (0, False) for value in spec.values()):
+            return OrderedDict(
+                (key, expression) for key, expression in fields.items()
+                if not any(matches(key, name) for name in spec)
+            )
+
+        output = OrderedDict()
+        for name, value in spec.items():
+            if value is True or value == 1:
+                for key, expression in fields.items():
+                    if matches(key, name):
+                        output[key] = expression
+            elif value is not False and value != 0:
+                output[name] = self._expression(value, fields)
+
+        return output
+
+    def compile(self, stats=None):
+        """
+        Compile the pipeline.
+        Args:
+            stats (OperationStats): The statistics of the compilation, when the database is profiled.
+
+        Returns:
+            (Cursor): The cursor executing the select.
+        """
+        collection = self._collection
+        stages = [self._get_stage(stage) for stage in self._pipeline]
+
+        lookup = [] if self._auto_lookup == 0 else collection.generate_lookup(collection._table, self._auto_lookup)
+        lookup += [self._convert_lookup(spec) for operator, spec in stages if operator == u"$lookup"]
+        plan = collection.get_plan(lookup)
+
+        fields = OrderedDict(plan.fields_mapping)
+        where, having, group_by = [], [], None
+        sort, skip, limit = None, None, None
+
+        for operator, spec in stages:
+            if (skip is not None or limit is not None) and operator in (u"$lookup", u"$match", u"$group", u"$sort"):
+                raise ValueError(u"The {} stage must come before $skip and $limit.".format(operator))
+
+            if operator == u"$lookup":
+                if group_by is not None:
+                    raise ValueError(u"The $lookup stage must come before $group.")
+
+            elif operator == u"$match":
+                self._check_query(spec, fields)
+                clause = collection._parse_query(spec, fields)
+                if clause is not None:
+                    (having if group_by is not None else where).append(clause)
+
+            elif operator == u"$group":
+                if group_by is not None:
+                    raise ValueError(u"Only one $group stage is supported.")
+                fields, group_by = self._group(spec, fields)
+                sort = None
+
+            elif operator == u"$sort":
+                # Resolved now: a later $project can rename or remove the sort keys.
+                sort = []
+                for key, direction in spec.items():
+                    # A sort on a document (e.g. a compound _id) sorts on its fields.
+                    names = [key] if key in fields else [name for name in fields if name.startswith(key + u".")]
+                    if not names:
+                        raise ValueError(u"Unknown field ${}.".format(key))
+                    sort += [(name, fields[name], direction) for name in names]
+
+            elif operator == u"$project":
+                fields = self._project(spec, fields)
+
+            elif operator == u"$skip":
+                skip = spec
+
+            elif operator == u"$limit":
+                limit = spec
+
+            else:
+                raise ValueError(u"Unsupported stage {}.".format(operator))
+
+        # The sort keys no longer selected as such are sorted on under a name of their own.
+        fields_mapping = OrderedDict(fields)
+        sort_keys = []
+        for key, expression, _ in sort or []:
+            if fields_mapping.get(key) is not expression:
+                key = u"$sort.{}".format(key)
+                fields_mapping[key] = expression
+            sort_keys.append(key)
+
+        cursor = Cursor(
+            collection,
+            [expression.label(name) for name, expression in fields.items()],
+            plan.select_from,
+            and_(*where) if where else None,
+            plan.lookup,
+            fields_mapping=fields_mapping,
+            result_cache=collection.get_result_cache(),
+            group_by=group_by,
+            having=and_(*having) if having else None,
+            stats=stats
+        )
+
+        if sort:
+            cursor.sort(sort_keys, [direction for _, _, direction in sort])
+        if skip is not None:
+            cursor.skip(skip)
+        if limit is not None:
+            cursor.limit(limit)
+
+        return cursor
@@ -0,0 +1,620 @@
+# coding utf-8
+"""
+Asyncio flavor of the client, built on the SQLAlchemy asyncio extension (SQLAlchemy 1.4+,
+with an asyncio driver such as aiosqlite, asyncpg or aiomysql).
+
+The query DSL, the lookups and the plans are the ones of the blocking classes: each AsyncDB keeps
+a blocking DB object holding the reflected schema and the collections, and only the statements
+are executed asynchronously.
+"""
+
+import asyncio
+from .db import DB
+from .client import Client
+from .engine import get_async_engine
+from .results import (
+    DeleteResult,
+    UpdateResult,
+    InsertResultOne,
+    InsertManyResult
+)
+
+
+class _SchemaDB(DB):
+    """
+    The blocking DB used by an AsyncDB to hold the schema, its engine is the one of the AsyncDB.
+    Tables are reflected through AsyncDB.reflect(), with a connection from the asyncio engine.
+    """
+    def __init__(self, async_db, *args, **kwargs):
+        """
+        Construct the object.
+        Args:
+            async_db (AsyncDB): The asynchronous database.
+            *args, **kwargs: The arguments of DB.
+        """
+        super(_SchemaDB, self).__init__(*args, **kwargs)
+        self._async_db = async_db
+
+    def get_engine(self):
+        """
+        Get the blocking facade of the asyncio engine, usable to compile statements.
+        Returns:
+            (sqlalchemy.engine.Engine): The Engine.
+        """
+        return self._async_db.get_engine().sync_engine
+
+
+class AsyncDB(object):
+    """
+    Wrapper around a database schema, with asyncio.
+    """
+    def __init__(self, url, schema=None, encoding=None, engine_options=None, metadata_cache=None,
+                 metadata_cache_ttl=None, result_cache=None, profiler=None):
+        """
+        Construct the object.
+        Args:
+            url (unicode): The DB connection URL, with an asyncio driver.
+            schema (unicode): Optionnal schema to select.
+            encoding (str): Unused, kept for the compatibility with DB.
+            engine_options (dict): Pool options given to create_async_engine (pool_size, max_overflow, ...).
+            metadata_cache (unicode): Optionnal directory where the reflected schema is cached.
+            metadata_cache_ttl (int): Number of seconds the cached schema stays valid (forever if None).
+            result_cache (ResultCache): Optionnal cache of the reads, invalidated by the asynchronous writes.
+            profiler (Profiler): Not supported: the profiler tracks the current operation per thread,
+                and the operations of concurrent tasks share the thread of the event loop.
+        """
+        if profiler is not None:
+            raise TypeError(u"Profilers aren't supported with asyncio.")
+
+        self._url = url
+        self._engine_options = engine_options or {}
+        self._db = _SchemaDB(
+            self, url, schema=schema, engine_options=engine_options, metadata_cache=metadata_cache,
+            metadata_cache_ttl=metadata_cache_ttl, result_cache=result_cache
+        )
+
+    def __getattr__(self, name):
+        """
+        Called when a user try to access to an attribute of the object.
+        Used to catch the table name. The table is reflected when the collection is first used.
+        Args:
+            name (unicode): The name of the table to fetch.
+
+        Returns:
+            (AsyncCollection): The collection.
+        """
+        if name.startswith(u"__"):
+            raise AttributeError(name)
+
+        if name not in self.__dict__:
+            setattr(self, name, AsyncCollection(self, name))
+
+        return self.__dict__[name]
+
+    def get_engine(self):
+        """
+        Get the asyncio engine, shared with every AsyncDB using the same url and options.
+        Returns:
+            (sqlalchemy.ext.asyncio.AsyncEngine): The Engine.
+        """
+        return get_async_engine(self._url, **self._engine_options)
+
+    async def reflect(self, *names):
+        """
+        Reflect the tables not known yet (with the tables their foreign keys point to).
+        Args:
+            *names (unicode): The names of the tables.
+        """
+        missing = [name for name in names if name not in self._db.__dict__]
+        if missing:
+            async with self.get_engine().connect() as connection:
+                await connection.run_sync(self._reflect_sync, missing)
+
+    def _reflect_sync(self, connection, names):
+        """
+        Reflect tables with the blocking facade of an asyncio connection.
+        Args:
+            connection (sqlalchemy.engine.base.Connection): The connection.
+            names (list of unicode): The names of the tables.
+        """
+        for name in names:
+            self._db._reflect(name, connection)
+
+    def refresh_schema(self):
+        """
+        Forget the reflected tables, they are reflected again the next time they are used.
+        """
+        self._db.refresh_schema()
+
+
+class AsyncClient(Client):
+    """
+    Handles the connection to a database, with asyncio.
+    """
+    # The class wrapping the databases.
+    db_class = AsyncDB
+
+    def __init__(self, *args, **kwargs):
+        """
+        Construct the object, see Client. Profilers aren't supported (see AsyncDB).
+        """
+        super(AsyncClient, self).__init__(*args, **kwargs)
+        if self._profiler is not None:
+            raise TypeError(u"Profilers aren't supported with asyncio.")
+
+    def get_engine(self):
+        """
+        Get the shared asyncio Engine.
+        Returns:
+            (sqlalchemy.ext.asyncio.AsyncEngine): The Engine registered for the url.
+        """
+        return get_async_engine(self._url, **self._engine_options)
+
+
+class AsyncCollection(object):
+    """
+    Wrapper around a collection, with asyncio.
+    """
+    def __init__(self, db_ref, name):
+        """
+        Construct the object.
+        Args:
+            db_ref (AsyncDB): A reference to the AsyncDB object (parent).
+            name (unicode): The name of the table.
+        """
+        self._db_ref = db_ref
+        self._name = name
+
+    async def get_collection(self, lookup=None):
+        """
+        Get the blocking collection building the statements, reflecting its table and the lookup ones if needed.
+        Args:
+            lookup (list of dict): The lookup the statements will use.
+
+        Returns:
+            (Collection): The collection.
+        """
+        await self._db_ref.reflect(self._name, *[relation[u"from"] for relation in lookup or []])
+        return getattr(self._db_ref._db, self._name)
+
+    def find(self, query=None, projection=None, lookup=None, auto_lookup=0):
+        """
+        Does a find query on the collection.
+        Args:
+            query (dict): The mongo like query to execute.
+            projection (dict): The projection parameter determines which columns are returned
+                in the matching documents.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+        Returns:
+            (AsyncCursor): Cursor to wrap the request result.
+        """
+        return AsyncCursor(self, dict(query=query, projection=projection, lookup=lookup, auto_lookup=auto_lookup))
+
+    async def find_one(self, query=None, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get the first document matching a query.
+        Args:
+            query (dict): The mongo like query to execute.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+        Returns:
+            (dict): The document, None if no document matches.
+        """
+        collection = await self.get_collection(lookup)
+        request, params, plan = collection._find_one_request(query, projection, lookup, auto_lookup)
+        return collection._decode_first(await self._fetch_rows(collection, request, params, plan), plan)
+
+    async def get(self, key, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get a document by primary key, see Collection.get().
+        Args:
+            key (object): The value of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+        Returns:
+            (dict): The document, None if it doesn't exist.
+        """
+        collection = await self.get_collection(lookup)
+        request, params, plan = collection._get_request(key, projection, lookup, auto_lookup)
+        return collection._decode_first(await self._fetch_rows(collection, request, params, plan), plan)
+
+    async def get_many(self, keys, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get documents by primary key, see Collection.get_many().
+        Args:
+            keys (list): The values of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+        Returns:
+            (list of dict): The document of each key, in the same order, None for the keys that don't exist.
+        """
+        if not keys:
+            return []
+
+        collection = await self.get_collection(lookup)
+        request, params, plan, keys = collection._get_many_request(keys, projection, lookup, auto_lookup)
+        return collection._decode_by_keys(await self._fetch_rows(collection, request, params, plan), plan, keys)
+
+    def loader(self, projection=None, lookup=None, auto_lookup=0, batch_size=None):
+        """
+        Create a request scoped loader, batching the lookups by primary key made in the same
+        iteration of the event loop. See AsyncLoader.
+        Args:
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during the queries.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            batch_size (int): The maximum number of keys fetched in one select, all the pending keys if None.
+
+        Returns:
+            (AsyncLoader): The loader.
+        """
+        return AsyncLoader(self, projection, lookup, auto_lookup, batch_size)
+
+    async def _get_cached(self, collection, request, params, lookup, read):
+        """
+        Execute a select through the result cache of the database, like Cursor._get_cached().
+        Args:
+            collection (Collection): The blocking collection.
+            request (sqlalchemy.sql.selectable.Select): The select.
+            params (dict): The parameters to bind.
+            lookup (list of dict): The lookup of the select, its tables are read too.
+            read (function): Turns the result into the value to cache.
+
+        Returns:
+            (object): The value, from the cache or from the database.
+        """
+        result_cache = collection.get_result_cache()
+        if result_cache is not None:
+            key = collection._result_cache_key(
+                request, params, [collection._table.name] + [relation[u"from"] for relation in lookup or []]
+            )
+            value = result_cache.get(key)
+            if value is not None:
+                return value
+
+        async with self._db_ref.get_engine().connect() as connection:
+            value = read(await connection.execute(request, params or None))
+
+        if result_cache is not None:
+            result_cache.set(key, value)
+        return value
+
+    async def _fetch_rows(self, collection, request, params, plan):
+        """
+        Execute a select of the fast paths.
+        Args:
+            collection (Collection): The blocking collection.
+            request (sqlalchemy.sql.selectable.Select): The select.
+            params (dict): The parameters to bind.
+            plan (QueryPlan): The plan the select was built from.
+
+        Returns:
+            (list): The rows.
+        """
+        return await self._get_cached(
+            collection, request, params, plan.lookup, lambda result: [tuple(row) for row in result]
+        )
+
+    async def _execute_write(self, collection, request, params=None):
+        """
+        Execute a write statement in its own transaction.
+        Args:
+            collection (Collection): The blocking collection.
+            request (sqlalchemy.sql.expression.Executable): The statement.
+            params (dict): The parameters to bind.
+
+        Returns:
+            (sqlalchemy.engine.CursorResult): The result.
+        """
+        async with self._db_ref.get_engine().begin() as connection:
+            result = await connection.execute(request, params or None)
+        collection._invalidate_result_cache()
+        return result
+
+    async def insert_one(self, document, lookup=None, auto_lookup=0):
+        """
+        Insert a document in the table.
+        Args:
+            document (dict): The document to insert.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (InsertResultOne): The result object.
+        """
+        collection = await self.get_collection(lookup)
+        fields_mapping = collection.get_plan(lookup, auto_lookup).fields_mapping
+        request = collection._table.insert().values(**collection._insert_values(document, fields_mapping))
+        result = await self._execute_write(collection, request)
+        return InsertResultOne(inserted_id=result.inserted_primary_key[0])
+
+    async def insert_many(self, documents, ordered=True, batch_size=1000, lookup=None, auto_lookup=0):
+        """
+        Insert documents in the table, in a single transaction.
+        Args:
+            documents (list of dict): The documents to insert.
+            ordered (bool): Insert the documents in the given order.
+            batch_size (int): The maximum number of rows sent in one statement.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (InsertManyResult): The result object.
+        """
+        collection = await self.get_collection(lookup)
+        fields_mapping = collection.get_plan(lookup, auto_lookup).fields_mapping
+        rows = [collection._insert_values(document, fields_mapping) for document in documents]
+
+        async with self._db_ref.get_engine().begin() as connection:
+            inserted_ids = await connection.run_sync(
+                lambda sync_connection: collection._insert_rows(sync_connection, rows, ordered, batch_size)
+            )
+        collection._invalidate_result_cache()
+        return InsertManyResult(inserted_ids=inserted_ids)
+
+    async def update_many(self, filter, update, lookup=None, auto_lookup=0):
+        """
+        Update many items from the collection.
+        Args:
+            filter (dict): query (dict): The mongo like query to execute.
+            update (dict): The modifications to apply ($set).
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (UpdateResult): The update operation result.
+        """
+        collection = await self.get_collection(lookup)
+        request, params = collection._update_many_request(filter, update, lookup, auto_lookup)
+        result = await self._execute_write(collection, request, params)
+        return UpdateResult(matched_count=result.rowcount)
+
+    async def delete_many(self, filter, lookup=None, auto_lookup=0):
+        """
+        Delete many items from the collection.
+        Args:
+            filter (dict): query (dict): The mongo like query to execute.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (DeleteResult): The delete operation result.
+        """
+        collection = await self.get_collection(lookup)
+        request, params = collection._delete_many_request(filter, lookup, auto_lookup)
+        result = await self._execute_write(collection, request, params)
+        return DeleteResult(deleted_count=result.rowcount)
+
+
+class AsyncCursor(object):
+    """
+    Cursor on the result of an asynchronous find().
+    sort(), limit(), skip(), after() and batch_size() are recorded, then applied to the blocking
+    cursor building the select once the collection is reflected.
+    """
+    def __init__(self, collection_ref, find_kwargs):
+        """
+        Constructs the object.
+        Args:
+            collection_ref (AsyncCollection): The reference to the collection object.
+            find_kwargs (dict): The arguments of find().
+        """
+        self._collection_ref = collection_ref
+        self._find_kwargs = find_kwargs
+        self._calls = []
+
+    def _record(self, name, *args, **kwargs):
+        """
+        Record a call to apply to the blocking cursor.
+        Args:
+            name (unicode): The name of the Cursor method.
+            *args, **kwargs: Its arguments.
+
+        Returns:
+            (AsyncCursor): The cursor itself.
+        """
+        self._calls.append((name, args, kwargs))
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        """
+        Sorts the result set, see Cursor.sort().
+        """
+        return self._record(u"sort", key_or_list, direction)
+
+    def limit(self, limit):
+        """
+        Limits the result set, see Cursor.limit().
+        """
+        return self._record(u"limit", limit)
+
+    def skip(self, skip):
+        """
+        Skips lines in the result set, see Cursor.skip().
+        """
+        return self._record(u"skip", skip)
+
+    def after(self, document_or_token=None):
+        """
+        Use keyset pagination, see Cursor.after().
+        """
+        return self._record(u"after", document_or_token)
+
+    def batch_size(self, batch_size):
+        """
+        Stream the result set by batches, see Cursor.batch_size().
+        """
+        return self._record(u"batch_size", batch_size)
+
+    async def get_cursor(self):
+        """
+        Build the blocking cursor holding the select.
+        Returns:
+            (Cursor): The cursor.
+        """
+        collection = await self._collection_ref.get_collection(self._find_kwargs[u"lookup"])
+        cursor = collection.find(**self._find_kwargs)
+        for name, args, kwargs in self._calls:
+            getattr(cursor, name)(*args, **kwargs)
+        return cursor
+
+    def __aiter__(self):
+        """
+        Called when iterating on the cursor with async for.
+        Returns:
+            (async iterator): The iterator on items.
+        """
+        return self._iterate()
+
+    async def _iterate(self):
+        """
+        Execute the select and decode its rows, streaming them when a batch size is set.
+        Returns:
+            (async generator): Generates the documents.
+        """
+        cursor = await self.get_cursor()
+        decode = cursor._get_decoder().decode
+        if cursor._batch_size is None:
+            rows = await self._collection_ref._get_cached(
+                cursor._collection_ref, cursor._serialize(), cursor._params, cursor._lookup,
+                lambda result: [tuple(row) for row in result]
+            )
+            for row in rows:
+                yield decode(row)
+            return
+
+        # Streamed rows bypass the result cache, like the blocking cursors with a batch size.
+        async with self._collection_ref._db_ref.get_engine().connect() as connection:
+            result = await connection.stream(cursor._serialize(), cursor._params or None)
+            async for rows in result.partitions(cursor._batch_size):
+                for row in rows:
+                    yield decode(row)
+
+    async def to_list(self):
+        """
+        Fetch all the documents of the cursor.
+        Returns:
+            (list of dict): The documents.
+        """
+        return [document async for document in self]
+
+    async def count(self, with_limit_and_skip=False):
+        """
+        Return the line count for the cursor.
+        Args:
+            with_limit_and_skip (boolean): If the count ignores limit / skip or not.
+        Returns:
+            (int): The line count.
+        """
+        cursor = await self.get_cursor()
+        return await self._collection_ref._get_cached(
+            cursor._collection_ref, cursor._serialize_count(with_limit_and_skip), cursor._params, cursor._lookup,
+            lambda result: result.scalar()
+        )
+
+
+class AsyncLoader(object):
+    """
+    Request scoped loader of the documents of a collection by primary key, with asyncio.
+    The keys requested while the event loop runs the ready callbacks (e.g. the resolvers started by
+    asyncio.gather) are fetched together in a single select with IN (...) (get_many), scheduled
+    with loop.call_soon. Loaded documents are kept in an identity map: a key is fetched once per loader,
+    and all the callers get the same document.
+    """
+    def __init__(self, collection, projection=None, lookup=None, auto_lookup=0, batch_size=None):
+        """
+        Construct the object.
+        Args:
+            collection (AsyncCollection): The collection the documents are fetched from.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during the queries.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            batch_size (int): The maximum number of keys fetched in one select, all the pending keys if None.
+        """
+        self._collection = collection
+        self._projection = projection
+        self._lookup = lookup
+        self._auto_lookup = auto_lookup
+        self._batch_size = batch_size
+        self._documents = {}
+        self._futures = {}
+        self._pending = []
+
+    def load(self, key):
+        """
+        Get a document, from the identity map or with the keys requested in the same iteration of the loop.
+        Args:
+            key (object): The value of the primary key.
+
+        Returns:
+            (asyncio.Future): Gives the document, None if it doesn't exist.
+        """
+        loop = asyncio.get_event_loop()
+        if key in self._documents:
+            future = loop.create_future()
+            future.set_result(self._documents[key])
+            return future
+
+        future = self._futures.get(key)
+        if future is None:
+            future = self._futures[key] = loop.create_future()
+            if not self._pending:
+                loop.call_soon(lambda: asyncio.ensure_future(self.dispatch()))
+            self._pending.append(key)
+        return future
+
+    def load_many(self, keys):
+        """
+        Get documents, see load().
+        Args:
+            keys (list): The values of the primary key.
+
+        Returns:
+            (asyncio.Future): Gives the document of each key, in the same order, None for the keys that don't exist.
+        """
+        return asyncio.gather(*[self.load(key) for key in keys])
+
+    async def dispatch(self):
+        """
+        Fetch the documents of the pending keys, by batches of batch_size keys.
+        """
+        keys, self._pending = self._pending, []
+        batch_size = self._batch_size or len(keys)
+        for index in range(0, len(keys), batch_size or 1):
+            batch = keys[index:index + batch_size]
+            try:
+                documents = await self._collection.get_many(
+                    batch, self._projection, self._lookup, self._auto_lookup
+                )
+            except Exception as exception:
+                for key in batch:
+                    self._futures.pop(key).set_exception(exception)
+                continue
+
+            for key, document in zip(batch, documents):
+                self._documents[key] = document
+                self._futures.pop(key).set_result(document)
+
+    def prime(self, key, document):
+        """
+        Put a document already fetched in the identity map.
+        Args:
+            key (object): The value of the primary key.
+            document (dict): The document.
+        """
+        self._documents[key] = document
+
+    def clear(self, key=None):
+        """
+        Forget a document of the identity map, or all of them, so it is fetched again.
+        Args:
+            key (object): The value of the primary key, None to forget all the documents.
+        """
+        if key is None:
+            self._documents.clear()
+        else:
+            self._documents.pop(key, None)
@@ -5,10 +5,7 @@ Contains the Client class.
 
 import re
 from .db import DB
-from sqlalchemy import (
-    create_engine,
-    inspect
-)
+from .engine import get_engine
 from .utils import parse_url_and_add_param
 
 
@@ -16,17 +13,40 @@ class Client(object):
     """
     Handles the connection to a database.
     """
-    def __init__(self, url=None, schema=None, encoding=None):
+    # The class wrapping the databases.
+    db_class = DB
+
+    def __init__(self, url=None, schema=None, encoding=None, pool_size=None, max_overflow=None,
+                 pool_recycle=None, pool_pre_ping=None, metadata_cache=None, metadata_cache_ttl=None,
+                 result_cache=None, profiler=None):
         """
         Construct the object.
         Args:
             url (unicode): The db connection string.
             schema (unicode): The schema to use (optionnal)/
             encoding (str): The encoding to use during interactions with the database.
+            pool_size (int): The number of connections kept open in the pool (optionnal).
+            max_overflow (int): The number of connections allowed above pool_size (optionnal).
+            pool_recycle (int): Seconds after which a pooled connection is recycled (optionnal).
+            pool_pre_ping (bool): Test connections for liveness when checked out (optionnal).
+            metadata_cache (unicode): Directory where the reflected schemas are cached (optionnal).
+            metadata_cache_ttl (int): Number of seconds a cached schema stays valid (optionnal).
+            result_cache (ResultCache): Cache for the results of find() and count() (optionnal).
+            profiler (Profiler): Records the timings of the operations, and logs the slow ones (optionnal).
         """
         self._url = url
         self._schema = schema
         self._encoding = encoding
+        self._engine_options = {
+            u"pool_size": pool_size,
+            u"max_overflow": max_overflow,
+            u"pool_recycle": pool_recycle,
+            u"pool_pre_ping": pool_pre_ping
+        }
+        self._metadata_cache = metadata_cache
+        self._metadata_cache_ttl = metadata_cache_ttl
+        self._result_cache = result_cache
+        self._profiler = profiler
 
     def __getattr__(self, name):
         """
@@ -39,25 +59,25 @@ class Client(object):
             The attribute attribute.
         """
         if name not in self.__dict__:
-            setattr(self, name, DB(
+            setattr(self, name, self.db_class(
                 url=self.adapt_url(name),
-                schema=self._schema
+                schema=self._schema,
+                engine_options=self._engine_options,
+                metadata_cache=self._metadata_cache,
+                metadata_cache_ttl=self._metadata_cache_ttl,
+                result_cache=self._result_cache,
+                profiler=self._profiler
             ))
 
         return self.__dict__[name]
 
     def get_engine(self):
         """
-        Creates the SQLAlchemy Engine.
+        Get the shared SQLAlchemy Engine.
         Returns:
-            (sqlalchemy.engine.Engine): The created Engine.
+            (sqlalchemy.engine.Engine): The Engine registered for the url.
         """
-        kwargs = {}
-
-        if self._encoding is not None:
-            kwargs[u"encoding"] = self._encoding
-
-        return create_engine(*[self._url], **kwargs)
+        return get_engine(self._url, encoding=self._encoding, **self._engine_options)
 
     def adapt_url(self, schema_name):
         """
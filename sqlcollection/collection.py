@@ -2,28 +2,65 @@
 """
 Contains DB Class.
 """
+import re
 import sys
+import json
 import decimal
 import datetime
+from contextlib import contextmanager
 from .cursor import Cursor
+from .aggregation import AggregationPipeline
+from .lru_cache import LRUCache
+from .query_plan import QueryPlan
+from .loader import Loader
+from .profiling import activate, profiled, profiled_phase
+from .explain import Explanation, explain, get_missing_indexes
+from .index_advisor import FILTER, JOIN, get_column_key, suggest_indexes
+from collections import OrderedDict
 from sqlalchemy.sql import (
     and_,
-    or_
+    or_,
+    select,
+    bindparam
 )
+from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.sql.expression import Delete
+from sqlalchemy.types import Integer, String
 from .results import (
     DeleteResult,
     UpdateResult,
-    InsertResultOne
+    InsertResultOne,
+    InsertManyResult,
+    BulkWriteResult
+)
+from .operations import (
+    InsertOne,
+    UpdateMany,
+    DeleteMany
 )
 
 from .utils import json_to_one_level
 from .compatibility import UNICODE_TYPE
 
+# Returned by _get_key_value when a query isn't an equality on the primary key.
+_NO_KEY = object()
+
 
 class Collection(object):
     """
     Wrapper around a collection.
     """
+    # Number of query plans kept per collection.
+    PLAN_CACHE_SIZE = 128
+    # Above this number of values, integer and string $in / $nin lists are rendered
+    # inline instead of being bound one parameter per value.
+    LARGE_IN_THRESHOLD = 1000
+
+    # Operators taking a list of values, expanded into IN (...) at execution.
+    _list_operators = {
+        u"$in": u"in_",
+        u"$nin": u"notin_"
+    }
 
     def __init__(self, db_ref, table):
         """
@@ -53,15 +90,132 @@ class Collection(object):
             u"$regex": u"REGEXP"
         }
 
+        self._plans = LRUCache(self.PLAN_CACHE_SIZE)
+
     def get_connection(self):
         """
-        Get connection to execute statements.
+        Get connection to execute statements, the one of the transaction if the thread opened one.
         Returns:
             (sqlalchemy.engine.base.Connection) A SQLAlchemy connection.
         """
-        connection = self._db_ref.get_engine().connect()
+        connection = self._db_ref.get_transaction_connection()
+        if connection is None:
+            connection = self._db_ref.get_engine().connect()
         return connection
 
+    def release_connection(self, connection):
+        """
+        Give a connection obtained with get_connection back to the pool.
+        The connection of a transaction stays open until the transaction ends.
+        Args:
+            connection (sqlalchemy.engine.base.Connection): The connection to release.
+        """
+        if connection is not self._db_ref.get_transaction_connection():
+            connection.close()
+
+    @staticmethod
+    @contextmanager
+    def _begin(connection):
+        """
+        Run a block in a transaction, or in the transaction already begun on the connection.
+        Args:
+            connection (sqlalchemy.engine.base.Connection): The connection.
+        """
+        if connection.in_transaction():
+            yield
+        else:
+            with connection.begin():
+                yield
+
+    def get_result_cache(self):
+        """
+        Get the result cache of the database.
+        Returns:
+            (ResultCache): The cache, None if results aren't cached or during a transaction.
+        """
+        if self._db_ref.get_transaction_connection() is not None:
+            return None
+        return self._db_ref._result_cache
+
+    def _cache_table_name(self, table_name):
+        """
+        Qualify a table name with the database, for the result cache keys.
+        Args:
+            table_name (unicode): The name of the table.
+
+        Returns:
+            (unicode): The qualified name.
+        """
+        return u"{}:{}".format(self._db_ref._cache_namespace, table_name)
+
+    def _result_cache_key(self, request, params, table_names):
+        """
+        Compute the result cache key of a statement.
+        Args:
+            request (sqlalchemy.sql.expression.Executable): The statement.
+            params (dict): The parameters bound at execution.
+            table_names (list of unicode): The tables the statement reads.
+
+        Returns:
+            (unicode): The key.
+        """
+        return self.get_result_cache().make_key(
+            request,
+            params,
+            self._db_ref.get_engine().dialect,
+            [self._cache_table_name(table_name) for table_name in table_names]
+        )
+
+    def _start_profiling(self, operation):
+        """
+        Start recording an operation executed later by a cursor, when the database has a profiler.
+        Args:
+            operation (unicode): The name of the operation.
+
+        Returns:
+            (OperationStats): The statistics of the operation, None if it isn't profiled
+                or if it is part of another operation.
+        """
+        profiler = self._db_ref._profiler
+        if profiler is None or profiler.get_current() is not None:
+            return None
+        return profiler.start(self._table.name, operation)
+
+    def _invalidate_result_cache(self):
+        """
+        Invalidate the cached results reading the table, after a write.
+        During a transaction, the table is invalidated when the transaction ends.
+        """
+        table_name = self._cache_table_name(self._table.name)
+        if self._db_ref.get_transaction_connection() is not None:
+            self._db_ref._local.written_tables.add(table_name)
+            return
+
+        result_cache = self.get_result_cache()
+        if result_cache is not None:
+            result_cache.invalidate(table_name)
+
+    def _explain(self, request, params, joins, analyze=False):
+        """
+        Get the query plan of a statement from the database, see Explanation.
+        Args:
+            request (sqlalchemy.sql.expression.Executable): The statement.
+            params (dict): The values of the bind parameters of the statement.
+            joins (list of tuple): The (foreign table, local field, foreign field) joins of the lookup,
+                checked for missing indexes.
+            analyze (bool): Execute the statement to get the actual numbers of rows (PostgreSQL and MySQL).
+
+        Returns:
+            (Explanation): The query plan.
+        """
+        connection = self.get_connection()
+        try:
+            statement, plan, steps = explain(connection, request, params, analyze)
+            dialect = connection.dialect.name
+        finally:
+            self.release_connection(connection)
+        return Explanation(dialect, statement, plan, steps, get_missing_indexes(joins))
+
     @staticmethod
     def generate_select_fields_mapping(table, prefix=None):
         """
@@ -87,7 +241,7 @@ class Collection(object):
 
         return fields_mapping
 
-    def _parse_query(self, query, fields_mapping, parent=None, conjunction=None):
+    def _parse_query(self, query, fields_mapping, parent=None, conjunction=None, params=None):
         """
         Parse a dict filter representation (MongoDB DSL) and convert it
         into SQLAlchemy expression language.
@@ -95,9 +249,11 @@ class Collection(object):
             query (dict): The filter we generate the where from.
             fields_mapping (dict): Mapping for available fields (unicode: column)
             conjunction (function): The default operator used to associate filters.
+            params (dict): If given, values are replaced by named bind parameters and
+                their values are stored in this dict.
 
         Returns:
-            (sqlalchemy.sql.elements): The elements to generate the WHERE clause.
+            (sqlalchemy.sql.elements): The elements to generate the WHERE clause, None if there is no filter.
         """
         conjunction = conjunction or and_
         filters = []
@@ -111,27 +267,224 @@ class Collection(object):
                 if key in fields_mapping:
                     column = fields_mapping[key]
                     if isinstance(value, dict):
-                        filters += [self._parse_query(value, fields_mapping, parent=key)]
+                        clause = self._parse_query(value, fields_mapping, parent=key, params=params)
+                        if clause is not None:
+                            filters.append(clause)
                     else:
-                        value = self._convert_to_python_type(value, column)
+                        value = self._bind_value(value, column, params)
                         filters.append(fields_mapping[key] == value)
 
                 elif key in self._builtin_operators:
                     column = fields_mapping[parent]
-                    value = self._convert_to_python_type(value, column)
+                    value = self._bind_value(value, column, params)
                     filters.append(getattr(column, self._builtin_operators[key])(value))
 
                 elif key in self._special_operators:
                     column = fields_mapping[parent]
-                    value = self._convert_to_python_type(value, column)
+                    value = self._bind_value(value, column, params)
                     filters.append(column.op(self._special_operators[key])(value))
 
+                elif key in self._list_operators:
+                    column = fields_mapping[parent]
+                    values = self._bind_values(value, column, params)
+                    clause = getattr(column, self._list_operators[key])(values)
+                    # NULL is never IN nor NOT IN a list: it is matched by $in when the list holds None,
+                    # and by $nin (the documents without the field) when it doesn't.
+                    if (None in value) == (key == u"$in"):
+                        clause = or_(clause, column.is_(None))
+                    filters.append(clause)
+
+                elif key in self._conjunctions and isinstance(value, list):
+                    clause = self._parse_query(
+                        value, fields_mapping, conjunction=self._conjunctions[key], params=params
+                    )
+                    if clause is not None:
+                        filters.append(clause)
+
+        return conjunction(*filters) if filters else None
+
+    def _bind_query(self, query, fields_mapping, params, parent=None):
+        """
+        Extract the parameters of a query, named the same way _parse_query names them.
+        Args:
+            query (dict): The filter to extract the values from.
+            fields_mapping (dict): Mapping for available fields (unicode: column)
+            params (dict): The dict where the parameters are stored.
+        """
+        if not isinstance(query, list):
+            query = [query]
+
+        for filt in query:
+
+            for key, value in filt.items():
+
+                if key in fields_mapping:
+                    if isinstance(value, dict):
+                        self._bind_query(value, fields_mapping, params, parent=key)
+                    else:
+                        self._bind_value(value, fields_mapping[key], params)
+
+                elif key in self._builtin_operators or key in self._special_operators:
+                    self._bind_value(value, fields_mapping[parent], params)
+
+                elif key in self._list_operators:
+                    self._bind_values(value, fields_mapping[parent], params)
+
+                elif key in self._conjunctions and isinstance(value, list):
+                    self._bind_query(value, fields_mapping, params)
+
+    def _bind_value(self, value, column, params):
+        """
+        Convert a filter value and turn it into a named bind parameter.
+        Args:
+            value (object): The value from the filter.
+            column (Column): The column the value is compared to.
+            params (dict): The parameters of the query, None to keep the value as a literal.
+
+        Returns:
+            (object): The bind parameter, or the converted value if it stays a literal.
+        """
+        value = self._convert_to_python_type(value, column)
+        if params is None or value is None:
+            return value
+
+        name = self._get_param_name(column, params)
+        params[name] = value
+        return bindparam(name, type_=column.type)
+
+    def _bind_values(self, values, column, params):
+        """
+        Convert the list of a $in / $nin filter and turn it into an expanding bind parameter,
+        rendered inline for the large lists of integers or strings (see _is_large_list).
+        None is left out, the NULLs being compared with IS NULL.
+        Args:
+            values (list): The values from the filter.
+            column (Column): The column the values are compared to.
+            params (dict): The parameters of the query, None to keep the values as literals.
+
+        Returns:
+            (object): The bind parameter, or the converted values if they stay literals.
+        """
+        if not isinstance(values, (list, tuple, set)):
+            raise ValueError(u"The $in and $nin operators expect a list of values.")
+
+        values = [self._convert_to_python_type(value, column) for value in values if value is not None]
+        if params is None:
+            return values
+
+        name = self._get_param_name(column, params)
+        params[name] = values
+        return bindparam(
+            name,
+            type_=column.type,
+            expanding=True,
+            literal_execute=self._is_large_list(values) and isinstance(column.type, (Integer, String))
+        )
+
+    @staticmethod
+    def _get_param_name(column, params):
+        """
+        Name a bind parameter after its column, like SQLAlchemy names the anonymous ones (id_1, id_2...).
+        Args:
+            column (Column): The column the value is compared to.
+            params (dict): The parameters already named.
+
+        Returns:
+            (unicode): The first free name.
+        """
+        prefix = re.sub(u"\\W", u"_", column.key)
+        index = 1
+        while u"{}_{}".format(prefix, index) in params:
+            index += 1
+        return u"{}_{}".format(prefix, index)
+
+    @classmethod
+    def _is_large_list(cls, values):
+        """
+        Tell if a $in / $nin list is large enough to be rendered inline.
+        Binding tens of thousands of parameters is slow and hits the limits of
+        the drivers (999 or 32766 variables for SQLite, 65535 for PostgreSQL).
+        Args:
+            values (list): The values of the list.
+
+        Returns:
+            (bool): True if the list is large.
+        """
+        return len(values) > cls.LARGE_IN_THRESHOLD
+
+    @classmethod
+    def _query_shape(cls, query):
+        """
+        Compute the shape of a query: its keys and operators, with the values left out.
+        Args:
+            query (dict): The filter.
+
+        Returns:
+            (tuple): A hashable representation of the query shape.
+        """
+        if isinstance(query, dict):
+            return (u"{",) + tuple(
+                (key, ((u"*" if cls._is_large_list(value) else u"?"), None in value)
+                 if key in cls._list_operators and isinstance(value, (list, tuple, set))
+                 else cls._query_shape(value))
+                for key, value in query.items()
+            )
+        elif isinstance(query, list):
+            return (u"[",) + tuple(cls._query_shape(value) for value in query)
+        return None if query is None else u"?"
+
+    @profiled_phase(u"parse")
+    def _get_where(self, query, plan):
+        """
+        Get the where clause of a query from the templates of the plan, with the parameters to bind.
+        Queries with the same shape share the same expression, so SQLAlchemy compiles it once.
+        Args:
+            query (dict): The filter we generate the where from.
+            plan (QueryPlan): The plan of the query.
+
+        Returns:
+            (sqlalchemy.sql.elements, dict): The where clause (None if empty) and its parameters.
+        """
+        params = {}
+        shape = self._query_shape(query)
+        template = plan.templates.get(shape)
+        if template is None:
+            where = self._parse_query(query, plan.fields_mapping, params=params)
+            template = where, [get_column_key(column) for column in self._get_query_columns(query, plan.fields_mapping)]
+            plan.templates.set(shape, template)
+        else:
+            self._bind_query(query, plan.fields_mapping, params)
+
+        where, columns = template
+        self._db_ref._field_usage.record(FILTER, columns)
+        return where, params
+
+    def _get_query_columns(self, query, fields_mapping):
+        """
+        Get the columns a query filters on, for the index advisor.
+        Args:
+            query (dict): The filter.
+            fields_mapping (dict): Mapping for available fields (unicode: column)
+
+        Returns:
+            (list of Column): The columns, once each.
+        """
+        columns = []
+        queries = [query]
+        while queries:
+            filt = queries.pop()
+            if isinstance(filt, list):
+                queries.extend(filt)
+                continue
+
+            for key, value in filt.items():
+                if key in fields_mapping:
+                    if not any(column is fields_mapping[key] for column in columns):
+                        columns.append(fields_mapping[key])
                 elif key in self._conjunctions and isinstance(value, list):
-                    filters.extend([
-                        self._parse_query(value, fields_mapping, conjunction=self._conjunctions[key])
-                    ])
+                    queries.extend(value)
 
-        return conjunction(*filters)
+        return columns
 
     def _convert_to_python_type(self, value, column):
         """
@@ -143,7 +496,12 @@ class Collection(object):
         Returns:
             (object): The converted value.
         """
-        if column.type.python_type in [datetime.date, datetime.datetime]:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return value
+
+        if python_type in [datetime.date, datetime.datetime]:
             if type(value) is int:
                 value = datetime.datetime.fromtimestamp(
                     int(value)
@@ -271,6 +629,58 @@ class Collection(object):
 
         return lookup
 
+    @profiled_phase(u"plan")
+    def get_plan(self, lookup=None, auto_lookup=0, projection=None):
+        """
+        Get the resolved select dependencies (fields mapping, joins, labels) from the plan cache,
+        computing them on the first call.
+        Args:
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            projection (dict): The projection parameter determines which columns are returned.
+
+        Returns:
+            (QueryPlan): The plan.
+        """
+        key = (
+            json.dumps(lookup, sort_keys=True) if auto_lookup == 0 else None,
+            auto_lookup,
+            json.dumps(projection, sort_keys=True)
+        )
+        plan = self._plans.get(key)
+        if plan is None:
+            lookup = (lookup or []) if auto_lookup == 0 else self.generate_lookup(self._table, auto_lookup)
+            fields_mapping, joins = self.generate_select_dependencies(lookup)
+            labels = [column.label(label) for label, column in fields_mapping.items()]
+
+            if projection is not None:
+                labels = self._apply_projection(labels, projection)
+
+            plan = QueryPlan(lookup, fields_mapping, joins, labels, self.generate_joins(joins))
+            self._plans.set(key, plan)
+
+        return plan
+
+    def suggest_indexes(self, ddl=False):
+        """
+        Suggest the indexes missing on the table: the foreign keys the lookups join on and the columns
+        the operations of the database filtered, sorted or joined on so far, ranked by score.
+        See sqlcollection.index_advisor.suggest_indexes.
+        Args:
+            ddl (bool): Add the CREATE INDEX statements to the suggestions.
+
+        Returns:
+            (list of dict): The suggestions (table, columns, score, filters, sorts, joins, foreign_key, ddl), best first.
+        """
+        dialect = self._db_ref.get_engine().dialect if ddl else None
+        return suggest_indexes([self._table], self._db_ref._field_usage, dialect)
+
+    def clear_plan_cache(self):
+        """
+        Forget the cached plans, needed when the schema changes.
+        """
+        self._plans.clear()
+
     def find(self, query=None, projection=None, lookup=None, auto_lookup=0):
         """
         Does a find query on the collection.
@@ -283,95 +693,606 @@ class Collection(object):
         Returns:
             (Cursor): Cursor to wrap the request result.
         """
-        lookup = (lookup or []) if auto_lookup == 0 else self.generate_lookup(self._table, auto_lookup)
+        stats = self._start_profiling(u"find")
+        with activate(stats):
+            plan = self.get_plan(lookup, auto_lookup, projection)
+            self._db_ref._field_usage.record(JOIN, plan.join_columns)
+
+            where, params = None, {}
+            if query is not None:
+                where, params = self._get_where(query, plan)
+
+        return Cursor(
+            self, plan.labels, plan.select_from, where, plan.lookup, plan.fields_mapping, params,
+            result_cache=self.get_result_cache(), stats=stats
+        )
 
-        fields_mapping, joins = self.generate_select_dependencies(lookup)
+    def _get_primary_key(self):
+        """
+        Get the primary key column the fast paths (get, get_many, find_one) select on.
+        Returns:
+            (Column): The column.
+        """
+        columns = list(self._table.primary_key.columns)
+        if len(columns) != 1:
+            raise ValueError(u"{} needs a single column primary key.".format(self._table.name))
+        return columns[0]
 
-        acc = self.generate_joins(joins)
+    def _convert_key(self, value, column):
+        """
+        Convert a primary key value to the type of the column: the keys often come as strings
+        (URLs, GraphQL ids), and the rows are matched with the keys by value.
+        Args:
+            value (object): The value of the key.
+            column (Column): The primary key column.
 
-        labels = [column.label(label) for label, column in fields_mapping.items()]
+        Returns:
+            (object): The converted value, unchanged if it can't be converted.
+        """
+        value = self._convert_to_python_type(value, column)
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return value
+
+        if python_type in (int, float, decimal.Decimal, UNICODE_TYPE) and value is not None \
+                and not isinstance(value, python_type):
+            try:
+                return python_type(value)
+            except (TypeError, ValueError, decimal.InvalidOperation):
+                pass
+        return value
 
-        where = None
+    def _get_key_value(self, query, plan):
+        """
+        Detect the queries made of a single equality on the primary key, like {"id": 5} or {"id": {"$eq": 5}}.
+        Args:
+            query (dict): The filter.
+            plan (QueryPlan): The plan of the query.
+
+        Returns:
+            (object): The value of the primary key, _NO_KEY if the query is something else.
+        """
+        if not isinstance(query, dict) or len(query) != 1:
+            return _NO_KEY
+
+        key, value = list(query.items())[0]
+        if isinstance(value, dict) and list(value) == [u"$eq"]:
+            value = value[u"$eq"]
+
+        columns = list(self._table.primary_key.columns)
+        if value is None or isinstance(value, (dict, list, tuple, set)) or len(columns) != 1 \
+                or plan.fields_mapping.get(key) is not columns[0]:
+            return _NO_KEY
+        return self._convert_key(value, columns[0])
+
+    def _get_key_request(self, plan, many=False, large=False):
+        """
+        Get the select of the primary key fast paths, built once per plan: the labels of the plan where the primary
+        key equals the "key" parameter, or is in the "keys" list (the key being added as a last "_key" column).
+        Args:
+            plan (QueryPlan): The plan.
+            many (bool): Select a list of keys.
+            large (bool): Render the list of keys inline, see _is_large_list.
+
+        Returns:
+            (sqlalchemy.sql.selectable.Select): The select.
+        """
+        name = (u"get_many", large) if many else (u"get", False)
+        request = plan.statements.get(name)
+        if request is None:
+            column = self._get_primary_key()
+            if many:
+                labels = list(plan.labels) + [column.label(u"_key")]
+                where = column.in_(bindparam(u"keys", type_=column.type, expanding=True, literal_execute=large))
+            else:
+                labels = plan.labels
+                where = column == bindparam(u"key", type_=column.type)
+            request = select(labels).select_from(plan.select_from).where(where)
+            plan.statements[name] = request
+
+        return request
+
+    def _fetch_rows(self, request, params, plan):
+        """
+        Execute a select of the fast paths, through the result cache if any,
+        counting its rows in the current profiled operation.
+        Args:
+            request (sqlalchemy.sql.selectable.Select): The select.
+            params (dict): The parameters to bind.
+            plan (QueryPlan): The plan the select was built from.
+
+        Returns:
+            (list): The rows.
+        """
+        rows = self._execute_fetch(request, params, plan)
+        profiler = self._db_ref._profiler
+        stats = profiler.get_current() if profiler is not None else None
+        if stats is not None:
+            stats.rows += len(rows)
+        return rows
+
+    def _execute_fetch(self, request, params, plan):
+        """
+        Fetch the rows of a select of the fast paths, see _fetch_rows.
+        Args:
+            request (sqlalchemy.sql.selectable.Select): The select.
+            params (dict): The parameters to bind.
+            plan (QueryPlan): The plan the select was built from.
+
+        Returns:
+            (list): The rows.
+        """
+        result_cache = self.get_result_cache()
+        if result_cache is not None:
+            key = self._result_cache_key(
+                request, params, [self._table.name] + [relation[u"from"] for relation in plan.lookup]
+            )
+            rows = result_cache.get(key)
+            if rows is not None:
+                return rows
+
+        connection = self.get_connection()
+        try:
+            rows = connection.execute(request, **params).fetchall()
+        finally:
+            self.release_connection(connection)
+
+        if result_cache is not None:
+            rows = [tuple(row) for row in rows]
+            result_cache.set(key, rows)
+        return rows
+
+    def _find_one_request(self, query=None, projection=None, lookup=None, auto_lookup=0):
+        """
+        Build the select of find_one: the cached select of get() when the query is an equality
+        on the primary key, a select with LIMIT 1 otherwise.
+        Args:
+            query (dict): The mongo like query to execute.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (sqlalchemy.sql.selectable.Select, dict, QueryPlan): The select, its parameters and its plan.
+        """
+        plan = self.get_plan(lookup, auto_lookup, projection)
+        self._db_ref._field_usage.record(JOIN, plan.join_columns)
+
+        value = self._get_key_value(query, plan)
+        if value is not _NO_KEY:
+            return self._get_key_request(plan), {u"key": value}, plan
+
+        request, params = select(plan.labels).select_from(plan.select_from).limit(1), {}
         if query is not None:
-            where = self._parse_query(query, fields_mapping)
+            where, params = self._get_where(query, plan)
+            if where is not None:
+                request = request.where(where)
+        return request, params, plan
 
-        if projection is not None:
-            labels = self._apply_projection(labels, projection)
+    def _get_request(self, key, projection=None, lookup=None, auto_lookup=0):
+        """
+        Build the select of get().
+        Args:
+            key (object): The value of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
 
-        return Cursor(self, labels, acc, where, lookup)
+        Returns:
+            (sqlalchemy.sql.selectable.Select, dict, QueryPlan): The select, its parameters and its plan.
+        """
+        plan = self.get_plan(lookup, auto_lookup, projection)
+        self._db_ref._field_usage.record(JOIN, plan.join_columns)
+        value = self._convert_key(key, self._get_primary_key())
+        return self._get_key_request(plan), {u"key": value}, plan
 
-    def delete_many(self, filter, lookup=None, auto_lookup=0):
+    def _get_many_request(self, keys, projection=None, lookup=None, auto_lookup=0):
         """
-        Delete many items from the collection.
+        Build the select of get_many().
+        Args:
+            keys (list): The values of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (sqlalchemy.sql.selectable.Select, dict, QueryPlan, list): The select, its parameters, its plan
+                and the converted keys, in the given order.
+        """
+        plan = self.get_plan(lookup, auto_lookup, projection)
+        self._db_ref._field_usage.record(JOIN, plan.join_columns)
+        column = self._get_primary_key()
+        keys = [self._convert_key(key, column) for key in keys]
+        distinct_keys = list(OrderedDict.fromkeys(keys))
+        large = self._is_large_list(distinct_keys) and isinstance(column.type, (Integer, String))
+        return self._get_key_request(plan, many=True, large=large), {u"keys": distinct_keys}, plan, keys
+
+    @staticmethod
+    def _decode_first(rows, plan):
+        """
+        Build the document of the first row of a fast path select.
+        Args:
+            rows (list): The rows.
+            plan (QueryPlan): The plan the select was built from.
+
+        Returns:
+            (dict): The document, None if there is no row.
+        """
+        return plan.get_decoder().decode(rows[0]) if rows else None
+
+    @staticmethod
+    def _decode_by_keys(rows, plan, keys):
+        """
+        Build the documents of the rows of get_many, in the order of the keys.
+        Args:
+            rows (list): The rows, their last column being the key.
+            plan (QueryPlan): The plan the select was built from.
+            keys (list): The keys, in the order of the documents to return.
+
+        Returns:
+            (list of dict): The document of each key, None for the keys no row has.
+        """
+        decode = plan.get_decoder().decode
+        documents = dict((row[-1], decode(row)) for row in rows)
+        return [documents.get(key) for key in keys]
+
+    @profiled(u"find_one")
+    def find_one(self, query=None, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get the first document matching a query, fetched with LIMIT 1.
+        Queries made of an equality on the primary key (like {"id": 5}) take the fast path of get().
+        Args:
+            query (dict): The mongo like query to execute.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (dict): The document, None if no document matches.
+        """
+        request, params, plan = self._find_one_request(query, projection, lookup, auto_lookup)
+        return self._decode_first(self._fetch_rows(request, params, plan), plan)
+
+    @profiled(u"get")
+    def get(self, key, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get a document by primary key. The filter isn't parsed: the select is built once per plan.
+        Needs a single column primary key.
+        Args:
+            key (object): The value of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (dict): The document, None if it doesn't exist.
+        """
+        request, params, plan = self._get_request(key, projection, lookup, auto_lookup)
+        return self._decode_first(self._fetch_rows(request, params, plan), plan)
+
+    @profiled(u"get_many")
+    def get_many(self, keys, projection=None, lookup=None, auto_lookup=0):
+        """
+        Get documents by primary key, in a single select with IN (...), built once per plan.
+        Needs a single column primary key.
+        Args:
+            keys (list): The values of the primary key.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (list of dict): The document of each key, in the same order, None for the keys that don't exist.
+        """
+        if not keys:
+            return []
+
+        request, params, plan, keys = self._get_many_request(keys, projection, lookup, auto_lookup)
+        return self._decode_by_keys(self._fetch_rows(request, params, plan), plan, keys)
+
+    def loader(self, projection=None, lookup=None, auto_lookup=0, batch_size=None):
+        """
+        Create a request scoped loader, batching the lookups by primary key into single selects
+        and keeping the documents in an identity map. See Loader.
+        Args:
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during the queries.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            batch_size (int): The maximum number of keys fetched in one select, all the pending keys if None.
+
+        Returns:
+            (Loader): The loader.
+        """
+        return Loader(self, projection, lookup, auto_lookup, batch_size)
+
+    def aggregate(self, pipeline, auto_lookup=0):
+        """
+        Run an aggregation pipeline, compiled into a single select with GROUP BY.
+        Supported stages: $lookup, $match, $group (with $sum, $avg, $min, $max and $count),
+        $sort, $project, $skip and $limit.
+        Args:
+            pipeline (list of dict): The stages.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (Cursor): Cursor to wrap the request result.
+        """
+        stats = self._start_profiling(u"aggregate")
+        with activate(stats):
+            return AggregationPipeline(self, pipeline, auto_lookup).compile(stats)
+
+    def _delete_many_request(self, filter, lookup=None, auto_lookup=0):
+        """
+        Build the delete statement of delete_many.
         Args:
             filter (dict): query (dict): The mongo like query to execute.
             lookup (list of dict): The lookup to apply during this query.
             auto_lookup (int): How many levels of lookup will be generated automatically.
 
         Returns:
-            (DeleteResult): The delete operation result.
+            (sqlalchemy.sql.expression.Delete, dict): The statement and its parameters.
         """
-        lookup = (lookup or []) if auto_lookup == 0 else self.generate_lookup(self._table, auto_lookup)
-        fields_mapping, joins = self.generate_select_dependencies(lookup)
-        filters = self._parse_query(filter, fields_mapping)
+        plan = self.get_plan(lookup, auto_lookup)
+        joins = plan.joins
+        filters, params = self._get_where(filter, plan)
 
-        if str(filters) == u"":
+        if filters is None:
             raise ValueError(u"Filter parameter is missing.")
 
-        join_where = and_(
-            *[(local_field == foreign_field) for foreign_table, local_field, foreign_field in joins]
-        )
+        request = self._table.delete()
+        if joins:
+            request = request.where(and_(
+                *[(local_field == foreign_field) for foreign_table, local_field, foreign_field in joins]
+            ))
 
-        request = self._table.delete().where(join_where).where(filters)
-        result = self.get_connection().execute(request)
-        return DeleteResult(deleted_count=result.rowcount)
+        return request.where(filters), params
 
-    def insert_one(self, document, lookup=None, auto_lookup=0):
+    @profiled(u"delete_many")
+    def delete_many(self, filter, lookup=None, auto_lookup=0, explain=False):
         """
-        Insert a document in the table.
+        Delete many items from the collection.
         Args:
-            document (dict): The document to insert.
+            filter (dict): query (dict): The mongo like query to execute.
             lookup (list of dict): The lookup to apply during this query.
             auto_lookup (int): How many levels of lookup will be generated automatically.
+            explain (bool): Return the query plan of the delete instead of executing it.
 
         Returns:
-            (InsertResultOne): The result object.
+            (DeleteResult|Explanation): The delete operation result, or the query plan with explain.
         """
-        document = json_to_one_level(document)
-        lookup = (lookup or []) if auto_lookup == 0 else self.generate_lookup(self._table, auto_lookup)
-        fields_mapping, _ = self.generate_select_dependencies(lookup)
+        request, params = self._delete_many_request(filter, lookup, auto_lookup)
+        if explain:
+            return self._explain(request, params, self.get_plan(lookup, auto_lookup).joins)
+
+        connection = self.get_connection()
+        try:
+            deleted_count = connection.execute(request, **params).rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return DeleteResult(deleted_count=deleted_count)
+
+    def _insert_values(self, document, fields_mapping):
+        """
+        Map a document on the columns of the table.
+        Args:
+            document (dict): The document to insert.
+            fields_mapping (dict): Mapping for available fields (unicode: column).
 
+        Returns:
+            (dict): The values to insert, by column name.
+        """
+        document = json_to_one_level(document)
         insert_kwargs = {}
         for key in document:
             column = fields_mapping.get(key)
             if column is not None and column.table.name == self._table.name:
                 insert_kwargs[column.name] = document[key]
 
+        return insert_kwargs
+
+    @profiled(u"insert_one")
+    def insert_one(self, document, lookup=None, auto_lookup=0):
+        """
+        Insert a document in the table.
+        Args:
+            document (dict): The document to insert.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (InsertResultOne): The result object.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        insert_kwargs = self._insert_values(document, fields_mapping)
+
         request = self._table.insert().values(**insert_kwargs)
-        result = self.get_connection().execute(request)
-        return InsertResultOne(inserted_id=result.inserted_primary_key[0])
+        connection = self.get_connection()
+        try:
+            inserted_id = connection.execute(request).inserted_primary_key[0]
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return InsertResultOne(inserted_id=inserted_id)
+
+    def _insert_rows(self, connection, rows, ordered=True, batch_size=1000):
+        """
+        Insert rows using as few statements as possible.
+        Rows with the same columns are sent together, with a multi-row VALUES ... RETURNING when the dialect
+        supports it (to get the generated ids), or with a DBAPI executemany.
+        Args:
+            connection (sqlalchemy.engine.base.Connection): The connection to execute the statements with.
+            rows (list of dict): The values to insert, by column name.
+            ordered (bool): Keep the insertion order. If False, rows are grouped by columns whatever their position.
+            batch_size (int): The maximum number of rows sent in one statement.
 
-    def update_many(self, filter, update, lookup=None, auto_lookup=0):
+        Returns:
+            (list): The inserted primary keys, None for the ones the dialect can't return.
         """
-        Update many items from the collection.
+        primary_key = list(self._table.primary_key.columns)
+        primary_key = primary_key[0] if len(primary_key) == 1 else None
+        dialect = connection.dialect
+        returning = primary_key is not None and dialect.implicit_returning and dialect.supports_multivalues_insert
+
+        groups = []
+        groups_by_columns = {}
+        for position, row in enumerate(rows):
+            columns = tuple(sorted(row))
+            if ordered and groups and groups[-1][0] == columns:
+                groups[-1][1].append(position)
+            elif not ordered and columns in groups_by_columns:
+                groups_by_columns[columns].append(position)
+            else:
+                groups.append((columns, [position]))
+                groups_by_columns[columns] = groups[-1][1]
+
+        inserted_ids = [None] * len(rows)
+        for _, positions in groups:
+            for index in range(0, len(positions), batch_size):
+                batch = positions[index:index + batch_size]
+                values = [rows[position] for position in batch]
+
+                if returning:
+                    request = self._table.insert().values(values).returning(primary_key)
+                    ids = [row[0] for row in connection.execute(request)]
+                elif len(values) == 1:
+                    ids = connection.execute(self._table.insert(), values[0]).inserted_primary_key[:1]
+                else:
+                    connection.execute(self._table.insert(), values)
+                    ids = [None] * len(values)
+
+                for position, inserted_id in zip(batch, ids):
+                    if primary_key is not None and inserted_id is None:
+                        inserted_id = rows[position].get(primary_key.name)
+                    inserted_ids[position] = inserted_id
+
+        return inserted_ids
+
+    @profiled(u"insert_many")
+    def insert_many(self, documents, ordered=True, batch_size=1000, lookup=None, auto_lookup=0):
+        """
+        Insert documents in the table, in a single transaction.
+        Args:
+            documents (list of dict): The documents to insert.
+            ordered (bool): Insert the documents in the given order. If False, documents with the same fields
+                are grouped together, which makes fewer statements.
+            batch_size (int): The maximum number of rows sent in one statement.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (InsertManyResult): The result object.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        rows = [self._insert_values(document, fields_mapping) for document in documents]
+
+        connection = self.get_connection()
+        try:
+            with self._begin(connection):
+                inserted_ids = self._insert_rows(connection, rows, ordered, batch_size)
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return InsertManyResult(inserted_ids=inserted_ids)
+
+    @profiled(u"bulk_write")
+    def bulk_write(self, requests, ordered=True, batch_size=1000, lookup=None, auto_lookup=0):
+        """
+        Execute a list of write operations in a single transaction.
+        Consecutive InsertOne operations are sent together, like insert_many does.
+        Args:
+            requests (list): The InsertOne, UpdateMany and DeleteMany operations.
+            ordered (bool): Execute the operations in the given order.
+                If False, all the inserts are sent first, grouped by fields.
+            batch_size (int): The maximum number of rows sent in one insert statement.
+            lookup (list of dict): The lookup to apply during the operations.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (BulkWriteResult): The result object.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        steps = [] if ordered else [[]]
+        for request in requests:
+            if isinstance(request, InsertOne):
+                row = self._insert_values(request.document, fields_mapping)
+                if not ordered:
+                    steps[0].append(row)
+                elif steps and isinstance(steps[-1], list):
+                    steps[-1].append(row)
+                else:
+                    steps.append([row])
+            elif isinstance(request, UpdateMany):
+                steps.append(self._update_many_request(request.filter, request.update, lookup, auto_lookup))
+            elif isinstance(request, DeleteMany):
+                steps.append(self._delete_many_request(request.filter, lookup, auto_lookup))
+            else:
+                raise TypeError(u"{} is not a valid write operation.".format(repr(request)))
+
+        inserted_ids, matched_count, deleted_count = [], 0, 0
+        connection = self.get_connection()
+        try:
+            with self._begin(connection):
+                for step in steps:
+                    if isinstance(step, list):
+                        inserted_ids.extend(self._insert_rows(connection, step, ordered, batch_size))
+                        continue
+
+                    request, params = step
+                    rowcount = connection.execute(request, **params).rowcount
+                    if isinstance(request, Delete):
+                        deleted_count += rowcount
+                    else:
+                        matched_count += rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+
+        return BulkWriteResult(
+            inserted_count=len(inserted_ids),
+            matched_count=matched_count,
+            deleted_count=deleted_count,
+            inserted_ids=inserted_ids
+        )
+
+    def _update_many_request(self, filter, update, lookup=None, auto_lookup=0):
+        """
+        Build the update statement of update_many.
         Args:
             filter (dict): query (dict): The mongo like query to execute.
+            update (dict): The modifications to apply ($set).
             lookup (list of dict): The lookup to apply during this query.
             auto_lookup (int): How many levels of lookup will be generated automatically.
 
         Returns:
-            (UpdateResult): The update operation result.
+            (sqlalchemy.sql.expression.Update, dict): The statement and its parameters.
         """
-        lookup = (lookup or []) if auto_lookup == 0 else self.generate_lookup(self._table, auto_lookup)
-        fields_mapping, joins = self.generate_select_dependencies(lookup)
-        filters = self._parse_query(filter, fields_mapping)
-        if str(filters) == u"":
+        plan = self.get_plan(lookup, auto_lookup)
+        fields_mapping, joins = plan.fields_mapping, plan.joins
+        filters, params = self._get_where(filter, plan)
+        if filters is None:
             raise ValueError(u"Filter parameter is missing.")
 
-        join_where = and_(
-            *[(local_field == foreign_field) for foreign_table, local_field, foreign_field in joins]
-        )
+        request = self._table.update().values(self._update_values(update, fields_mapping))
+        if joins:
+            request = request.where(and_(
+                *[(local_field == foreign_field) for foreign_table, local_field, foreign_field in joins]
+            ))
+
+        return request.where(filters), params
 
+    @staticmethod
+    def _update_values(update, fields_mapping):
+        """
+        Map the $set modifications of an update on the columns.
+        Args:
+            update (dict): The modifications to apply ($set).
+            fields_mapping (dict): Mapping for available fields (unicode: column).
+
+        Returns:
+            (dict): The values to set, by column.
+        """
         update_kwargs = {}
         set_ = json_to_one_level(update[u"$set"])
         for key in set_:
@@ -379,9 +1300,350 @@ class Collection(object):
             if column is not None:
                 update_kwargs[column] = set_[key]
 
-        request = self._table.update().values(update_kwargs).where(join_where).where(filters)
-        result = self.get_connection().execute(request)
-        return UpdateResult(matched_count=result.rowcount)
+        return update_kwargs
+
+    @profiled(u"update_many")
+    def update_many(self, filter, update, lookup=None, auto_lookup=0, upsert=False, explain=False):
+        """
+        Update many items from the collection.
+        Args:
+            filter (dict): query (dict): The mongo like query to execute.
+            update (dict): The modifications to apply ($set).
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            upsert (bool): Insert a document if none matches: the equalities of the filter on the table columns
+                with the $set values. The filter must give the values of the primary key or of a unique key,
+                with equalities. The update and the native insert run in a transaction.
+            explain (bool): Return the query plan of the update instead of executing it.
+
+        Returns:
+            (UpdateResult|Explanation): The update operation result, or the query plan with explain.
+                When an upsert inserts the document, matched_count is 0 and upserted_id its primary key.
+        """
+        request, params = self._update_many_request(filter, update, lookup, auto_lookup)
+        if explain:
+            return self._explain(request, params, self.get_plan(lookup, auto_lookup).joins)
+
+        if upsert:
+            return self._upsert_many_matching(request, params, filter, update, lookup, auto_lookup)
+
+        connection = self.get_connection()
+        try:
+            matched_count = connection.execute(request, **params).rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return UpdateResult(matched_count=matched_count)
+
+    def _upsert_many_matching(self, request, params, filter, update, lookup=None, auto_lookup=0):
+        """
+        Execute the update of update_many, then insert the document with the native upsert of the database
+        if no row matched, in a transaction. A row having the same key but not matching the rest of the filter
+        is left untouched (ON CONFLICT DO NOTHING).
+        Args:
+            request (sqlalchemy.sql.expression.Update): The update statement.
+            params (dict): The parameters to bind.
+            filter (dict): The filter, its equalities on the table columns are inserted with the values.
+            update (dict): The modifications to apply ($set).
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (UpdateResult): The update operation result.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        filter_values = self._filter_values(filter, fields_mapping)
+        keys = self._get_conflict_keys(filter_values)
+        values = dict(filter_values)
+        values.update(self._insert_values(update[u"$set"], fields_mapping))
+
+        dialect = self._db_ref.get_engine().dialect
+        if dialect.name == u"mysql" and any(
+            column is None or column.table is not self._table or column.name not in keys
+            for column in (fields_mapping.get(key) for key in filter)
+        ):
+            # MySQL reports the duplicates an insert ignores as affected rows: a row not matching the rest
+            # of the filter couldn't be told from an insert.
+            raise NotImplementedError(u"Upserts with conditions besides the key aren't supported with mysql.")
+        insert = self._upsert_request(dialect, keys, [], values)
+
+        upserted_id = None
+        connection = self.get_connection()
+        try:
+            with self._begin(connection):
+                matched_count = connection.execute(request, **params).rowcount
+                if not matched_count:
+                    result = connection.execute(insert)
+                    if result.rowcount:
+                        upserted_id = result.inserted_primary_key[0]
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return UpdateResult(matched_count=matched_count, upserted_id=upserted_id)
+
+    def _get_conflict_keys(self, column_names):
+        """
+        Find the primary or unique key a native upsert can detect the conflicts on.
+        Args:
+            column_names (iterable of unicode): The columns the values are known for.
+
+        Returns:
+            (list of unicode): The names of the columns of the first key they cover.
+        """
+        column_names = set(column_names)
+        keys = [self._table.primary_key.columns] + [
+            constraint.columns for constraint in self._table.constraints if isinstance(constraint, UniqueConstraint)
+        ] + [index.columns for index in self._table.indexes if index.unique]
+
+        for columns in keys:
+            names = [column.name for column in columns]
+            if names and set(names) <= column_names:
+                return names
+
+        raise ValueError(u"Upserts need the values of a primary or unique key of {}.".format(self._table.name))
+
+    def _upsert_request(self, dialect, keys, update_columns, values=None, where=None):
+        """
+        Build the native upsert statement of the dialect: INSERT ... ON CONFLICT DO UPDATE
+        for PostgreSQL and SQLite, INSERT ... ON DUPLICATE KEY UPDATE for MySQL.
+        Conflicting rows get the inserted values of the update columns.
+        Args:
+            dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the connection.
+            keys (list of unicode): The columns of the key the conflicts are detected on.
+            update_columns (list of unicode): The columns updated on conflict.
+            values (dict): The values to insert, by column name. None to give them at execution.
+            where (sqlalchemy.sql.elements): The condition the conflicting row must match to be updated
+                (PostgreSQL and SQLite only).
+
+        Returns:
+            (sqlalchemy.sql.expression.Insert): The statement.
+        """
+        if dialect.name == u"postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect.name == u"sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        elif dialect.name == u"mysql":
+            from sqlalchemy.dialects.mysql import insert
+        else:
+            raise NotImplementedError(u"Upserts aren't supported with {}.".format(dialect.name))
+
+        request = insert(self._table)
+        if values is not None:
+            request = request.values(values)
+
+        if dialect.name == u"mysql":
+            if where is not None:
+                raise NotImplementedError(u"Conditional upserts aren't supported with mysql.")
+            # Updating a key column to its own value is how MySQL ignores a duplicate.
+            return request.on_duplicate_key_update(OrderedDict(
+                (name, request.inserted[name]) for name in update_columns or keys[:1]
+            ))
+        elif update_columns:
+            return request.on_conflict_do_update(
+                index_elements=keys,
+                set_=OrderedDict((name, request.excluded[name]) for name in update_columns),
+                where=where
+            )
+        return request.on_conflict_do_nothing(index_elements=keys)
+
+    def _filter_values(self, filter, fields_mapping):
+        """
+        Get the equalities on the columns of the table in a filter, the values an upsert inserts.
+        Args:
+            filter (dict): The filter.
+            fields_mapping (dict): Mapping for available fields (unicode: column).
+
+        Returns:
+            (dict): The values, by column name.
+        """
+        values = {}
+        for key, value in filter.items():
+            column = fields_mapping.get(key)
+            if isinstance(value, dict) and list(value) == [u"$eq"]:
+                value = value[u"$eq"]
+            if column is not None and column.table is self._table and not isinstance(value, dict):
+                values[column.name] = self._convert_to_python_type(value, column)
+
+        return values
+
+    def _upsert_one(self, filter, values, update_columns, lookup=None, auto_lookup=0):
+        """
+        Insert a row or update the row having the same key, in a single statement.
+        The conditions of the filter besides the equalities on the key are checked on the conflicting row
+        (ON CONFLICT DO UPDATE ... WHERE): a row not matching them is left untouched. MySQL has no such
+        clause, neither can it join the lookup: the row is then selected and updated, or inserted if
+        none matches, in a transaction.
+        Args:
+            filter (dict): The filter, its equalities on the table columns are inserted with the values.
+            values (dict): The values to insert, by column name.
+            update_columns (list of unicode): The columns updated if the row exists.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (UpdateResult): The number of rows inserted or updated, as reported by the database.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        filter_values = self._filter_values(filter, fields_mapping)
+        keys = self._get_conflict_keys(filter_values)
+        values = dict(values)
+        values.update(filter_values)
+        update_columns = [name for name in update_columns if name not in keys]
+
+        conditions = {}
+        for key, value in filter.items():
+            column = fields_mapping.get(key)
+            if column is None or column.table is not self._table or column.name not in keys:
+                conditions[key] = value
+
+        dialect = self._db_ref.get_engine().dialect
+        if conditions and (dialect.name == u"mysql" or any(
+            column.table is not self._table for column in self._get_query_columns(conditions, fields_mapping)
+        )):
+            return self._update_first(
+                filter, dict((name, values.get(name)) for name in update_columns), lookup, auto_lookup,
+                insert=self._upsert_request(dialect, keys, [], values)
+            )
+
+        where = self._parse_query(conditions, fields_mapping) if conditions else None
+        connection = self.get_connection()
+        try:
+            request = self._upsert_request(connection.dialect, keys, update_columns, values, where)
+            matched_count = connection.execute(request).rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return UpdateResult(matched_count=matched_count)
+
+    def _update_first(self, filter, values, lookup=None, auto_lookup=0, insert=None):
+        """
+        Update the first row matching a filter: its primary key is selected, then the row is updated.
+        Args:
+            filter (dict): The mongo like query to execute.
+            values (dict): The values to set, by column.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            insert (sqlalchemy.sql.expression.Insert): Executed in the same transaction if no row matches.
+
+        Returns:
+            (UpdateResult): The update operation result.
+        """
+        plan = self.get_plan(lookup, auto_lookup)
+        primary_key = list(self._table.primary_key.columns)
+        if not primary_key:
+            raise ValueError(u"{} has no primary key.".format(self._table.name))
+
+        where, params = self._get_where(filter, plan)
+        request = select(primary_key).select_from(plan.select_from).limit(1)
+        if where is not None:
+            request = request.where(where)
+
+        matched_count = 0
+        connection = self.get_connection()
+        try:
+            with self._begin(connection):
+                rows = list(connection.execute(request, **params))
+                if rows:
+                    matched_count = connection.execute(self._table.update().values(values).where(
+                        and_(*[column == value for column, value in zip(primary_key, rows[0])])
+                    )).rowcount
+                elif insert is not None:
+                    matched_count = connection.execute(insert).rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return UpdateResult(matched_count=matched_count)
+
+    @profiled(u"update_one")
+    def update_one(self, filter, update, lookup=None, auto_lookup=0, upsert=False):
+        """
+        Update the first item matching a filter.
+        With upsert, the document is inserted if it doesn't exist, in a single statement using the native
+        upsert of the database (ON CONFLICT / ON DUPLICATE KEY). The filter must then give the values
+        of the primary key or of a unique key, with equalities. An existing row is only updated if it
+        matches the rest of the filter.
+        Args:
+            filter (dict): The mongo like query to execute.
+            update (dict): The modifications to apply ($set).
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            upsert (bool): Insert the document if it doesn't exist.
+
+        Returns:
+            (UpdateResult): The update operation result. For an upsert, the number of rows
+                inserted or updated as reported by the database.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        if not upsert:
+            return self._update_first(filter, self._update_values(update, fields_mapping), lookup, auto_lookup)
+
+        values = self._insert_values(update[u"$set"], fields_mapping)
+        return self._upsert_one(filter, values, list(values), lookup, auto_lookup)
+
+    @profiled(u"replace_one")
+    def replace_one(self, filter, replacement, lookup=None, auto_lookup=0, upsert=False):
+        """
+        Replace the first item matching a filter: the columns missing from the replacement are set to NULL.
+        With upsert, the document is inserted if it doesn't exist, see update_one.
+        Args:
+            filter (dict): The mongo like query to execute.
+            replacement (dict): The new document.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            upsert (bool): Insert the document if it doesn't exist.
+
+        Returns:
+            (UpdateResult): The update operation result.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        values = self._insert_values(replacement, fields_mapping)
+        primary_key = [column.name for column in self._table.primary_key.columns]
+        update_columns = [column.name for column in self._table.columns if column.name not in primary_key]
+
+        if upsert:
+            return self._upsert_one(filter, values, update_columns, lookup, auto_lookup)
+
+        return self._update_first(
+            filter, dict((name, values.get(name)) for name in update_columns), lookup, auto_lookup
+        )
+
+    @profiled(u"upsert_many")
+    def upsert_many(self, documents, keys=None, batch_size=1000, lookup=None, auto_lookup=0):
+        """
+        Insert documents, or update the rows having the same key, in a single transaction.
+        Uses the native upsert of the database (ON CONFLICT / ON DUPLICATE KEY), sent by batches.
+        Args:
+            documents (list of dict): The documents to insert or update.
+            keys (list of unicode): The columns of the primary or unique key identifying the documents.
+                Found from the reflected keys if not given.
+            batch_size (int): The maximum number of rows sent in one statement.
+            lookup (list of dict): The lookup to apply during this query.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+
+        Returns:
+            (UpdateResult): The number of rows inserted or updated, as reported by the database.
+        """
+        fields_mapping = self.get_plan(lookup, auto_lookup).fields_mapping
+        groups = OrderedDict()
+        for document in documents:
+            row = self._insert_values(document, fields_mapping)
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        matched_count = 0
+        connection = self.get_connection()
+        try:
+            with self._begin(connection):
+                for columns, rows in groups.items():
+                    group_keys = keys or self._get_conflict_keys(columns)
+                    request = self._upsert_request(
+                        connection.dialect, group_keys, [name for name in columns if name not in group_keys]
+                    )
+                    for index in range(0, len(rows), batch_size):
+                        matched_count += connection.execute(request, rows[index:index + batch_size]).rowcount
+        finally:
+            self.release_connection(connection)
+        self._invalidate_result_cache()
+        return UpdateResult(matched_count=matched_count)
 
     @staticmethod
     def _python_type_to_string(python_type):
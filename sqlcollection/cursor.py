@@ -3,16 +3,116 @@
 Contains DB Class.
 """
 
-import sys
+import io
+import csv
+import json
+import heapq
+import base64
 import decimal
-from .utils import json_set
-from .compatibility import BYTE_TYPE, INT_TYPES
-from sqlalchemy import func, select, subquery, union
+import datetime
+import threading
+from itertools import islice
+from collections import OrderedDict
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from .decoder import RowDecoder
+from .profiling import activate, record, clock
+from .index_advisor import SORT, get_column_key
+from .utils import json_get, json_set
+from .compatibility import UNICODE_TYPE
+from sqlalchemy import func, select, and_, or_, bindparam, false
+from sqlalchemy.schema import Column
+from sqlalchemy.types import Integer
+
+# Number of rows fetched at once by the columnar reads and the exports when no batch size is set.
+DEFAULT_BATCH_SIZE = 10000
+
+_DATETIME_FORMAT = u"%Y-%m-%d %H:%M:%S.%f"
+_DATE_FORMAT = u"%Y-%m-%d"
+
+
+def _encode_token_value(value):
+    """
+    JSON encoder for the values of a continuation token.
+    Args:
+        value (object): The value json can't encode.
+
+    Returns:
+        (dict): The tagged representation of the value.
+    """
+    if isinstance(value, datetime.datetime):
+        return {u"$datetime": value.strftime(_DATETIME_FORMAT)}
+    elif isinstance(value, datetime.date):
+        return {u"$date": value.strftime(_DATE_FORMAT)}
+    raise TypeError(u"{} is not serializable in a continuation token.".format(repr(value)))
+
+
+def _decode_token_value(obj):
+    """
+    JSON object hook restoring the values encoded by _encode_token_value.
+    Args:
+        obj (dict): The decoded json object.
+
+    Returns:
+        (object): The restored value.
+    """
+    if u"$datetime" in obj:
+        return datetime.datetime.strptime(obj[u"$datetime"], _DATETIME_FORMAT)
+    elif u"$date" in obj:
+        return datetime.datetime.strptime(obj[u"$date"], _DATE_FORMAT).date()
+    return obj
+
+
+def _to_isoformat(value):
+    """
+    Convert a date, datetime or time into its ISO 8601 representation, keeping None.
+    Args:
+        value (object): The value to convert.
+
+    Returns:
+        (unicode): The converted value.
+    """
+    return None if value is None else value.isoformat()
+
+
+# Sent by the partitions of a parallel scan when they are done.
+_PARTITION_DONE = object()
+
+
+class _Descending(object):
+    """
+    Reverses the comparisons of a value, to merge rows sorted in descending order.
+    """
+    __slots__ = (u"value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _sorts_nulls_last(dialect):
+    """
+    Tell where a dialect sorts NULLs in ascending order (the opposite in descending order).
+    Args:
+        dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the connections.
+
+    Returns:
+        (bool): True if NULLs come last (PostgreSQL, Oracle), False if they come first (SQLite, MySQL).
+    """
+    return dialect.name in (u"postgresql", u"oracle")
 
 
 class Cursor(object):
 
-    def __init__(self, collection_ref, fields, joins, where, lookup):
+    def __init__(self, collection_ref, fields, joins, where, lookup, fields_mapping=None, params=None,
+                 result_cache=None, group_by=None, having=None, stats=None):
         """
         Constructs the object.
         Args:
@@ -21,10 +121,19 @@ class Cursor(object):
             joins:
             where:
             lookup (list of dict): The lookup parameter used in the find query associated.
+            fields_mapping (dict): Mapping for available fields (unicode: column), resolved from
+                the lookup when not given.
+            params (dict): The values of the bind parameters of the where clause.
+            result_cache (ResultCache): The cache for the rows and counts, None to always query the database.
+            group_by (list): The GROUP BY clauses, for the cursors of aggregation pipelines.
+            having (sqlalchemy.sql.elements): The HAVING clause, for the cursors of aggregation pipelines.
+            stats (OperationStats): The statistics of the planning of the cursor, when the database is profiled.
         """
         self._fields = fields
         self._joins = joins
         self._where = where
+        self._group_by = group_by
+        self._having = having
         self._limit = None
         self._offset = None
         self._sort = None
@@ -32,44 +141,630 @@ class Cursor(object):
 
         self._collection_ref = collection_ref
         self._lookup = lookup
+        self._fields_mapping = fields_mapping
+        self._params = params or {}
+        self._result_cache = result_cache
+        self._decoder = None
+        self._batch_size = None
+        self._after = None
+        self._keyset = False
+        self._connection = None
+        self._result = None
+        self._partitions = None
+        self._stats = stats
+        self._generator = None
+        self._iteration_stats = None
 
     def __iter__(self):
         """
         Called when iterating on the cursor. Should be called once per request.
+        The connection goes back to the pool when the iteration ends, fails or the cursor is closed.
+        With a batch size, the rows are streamed from a server side cursor.
         Returns:
             (iterator): The iterator on items.
         """
-        conn = self._collection_ref.get_connection()
+        self.close()
+        if self._partitions is not None:
+            return self._iter_parallel()
+
+        stats = self._start_profiling(self._stats.operation if self._stats is not None else None)
+        try:
+            with activate(stats):
+                request = self._serialize()
+
+                if self._result_cache is not None and self._batch_size is None:
+                    rows = self._get_cached(request, lambda result: [tuple(row) for row in result])
+                else:
+                    self._connection = self._collection_ref.get_connection()
+                    if self._batch_size is None:
+                        self._result = self._connection.execute(request, **self._params)
+                        rows = self._result
+                    else:
+                        connection = self._connection.execution_options(stream_results=True)
+                        self._result = connection.execute(request, **self._params)
+                        rows = self._fetch_batches(self._result)
+        except Exception as exception:
+            self.close()
+            if stats is not None:
+                stats.profiler.finish(stats, exception)
+            raise
+
+        if stats is not None:
+            self._iteration_stats = stats
+            self._generator = self._to_profiled_dict_generator(self._get_decoder(), rows, stats)
+        else:
+            self._generator = self._to_dict_generator(self._get_decoder(), rows)
+        return self._generator
+
+    def explain(self, analyze=False):
+        """
+        Get the query plan of the cursor from the database (EXPLAIN QUERY PLAN for SQLite,
+        EXPLAIN (FORMAT JSON) for PostgreSQL, EXPLAIN FORMAT=JSON for MySQL), with the tables read
+        entirely and the join columns of the lookup having no index.
+        Args:
+            analyze (bool): Execute the request to get the actual numbers of rows (PostgreSQL, MySQL 8.0.18+).
+
+        Returns:
+            (Explanation): The query plan.
+        """
+        joins = self._collection_ref.get_plan(self._lookup).joins
+        return self._collection_ref._explain(self._serialize(), self._params, joins, analyze)
+
+    def _get_cached(self, request, read):
+        """
+        Get the result of a request from the result cache, executing it on a miss.
+        Args:
+            request (sqlalchemy.sql.selectable.Select): The request.
+            read (function): Turns the result proxy into the value to cache.
+
+        Returns:
+            (object): The cached value.
+        """
+        table_names = [self._collection_ref._table.name] + [relation[u"from"] for relation in self._lookup or []]
+        key = self._collection_ref._result_cache_key(request, self._params, table_names)
+        value = self._result_cache.get(key)
+        if value is None:
+            conn = self._collection_ref.get_connection()
+            try:
+                value = read(conn.execute(request, **self._params))
+            finally:
+                self._collection_ref.release_connection(conn)
+            self._result_cache.set(key, value)
+
+        return value
+
+    def _fetch_batches(self, result):
+        """
+        Fetch the rows of a result by batches.
+        Args:
+            result (sqlalchemy.engine.result.ResultProxy): The streamed result set.
+
+        Returns:
+            (generator): Generates the rows, holding at most one batch in memory.
+        """
+        while True:
+            rows = result.fetchmany(self._batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def _iter_batches(self, batch_size):
+        """
+        Execute the request and generate its rows by batches, from a server side cursor.
+        The result cache is bypassed, like for the cursors with a batch size: caching would hold
+        the whole result set in memory.
+        The connection goes back to the pool when the generator ends or is closed.
+        Args:
+            batch_size (int): Number of rows fetched at once.
+
+        Returns:
+            (generator): Generates lists of rows.
+        """
         request = self._serialize()
-        rows = conn.execute(request)
-        return self._to_dict_generator(select(self._fields).c, rows)
+        conn = self._collection_ref.get_connection()
+        try:
+            result = conn.execution_options(stream_results=True).execute(request, **self._params)
+            try:
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                result.close()
+        finally:
+            self._collection_ref.release_connection(conn)
+
+    def _iter_column_batches(self, batch_size=None):
+        """
+        Generate the values of the cursor column by column, one batch of rows at a time.
+        No document is built: the values are transposed from the rows and converted in bulk.
+        Args:
+            batch_size (int): Number of rows fetched at once, the cursor batch size by default.
+
+        Returns:
+            (generator): Generates, for each batch, the list of the values of each label.
+        """
+        converters = self._get_decoder().converters
+        for rows in self._iter_batches(batch_size or self._batch_size or DEFAULT_BATCH_SIZE):
+            yield [
+                list(values) if converter is None else list(map(converter, values))
+                for values, converter in zip(zip(*rows), converters)
+            ]
+
+    def to_columns(self, batch_size=None):
+        """
+        Fetch the cursor as columns instead of documents, for the analytics reads.
+        Args:
+            batch_size (int): Number of rows fetched at once, the cursor batch size by default.
 
-    def _to_dict_generator(self, columns, rows):
+        Returns:
+            (OrderedDict): The list of the values of each label (unicode: list), in the order of the select.
+        """
+        columns = [[] for _ in self._fields]
+        for batch in self._iter_column_batches(batch_size):
+            for column, values in zip(columns, batch):
+                column.extend(values)
+
+        return OrderedDict((label.name, column) for label, column in zip(self._fields, columns))
+
+    @staticmethod
+    def _get_numpy_dtype(type_):
+        """
+        Choose the NumPy dtype of a column.
+        Args:
+            type_ (sqlalchemy.types.TypeEngine): The type of the column.
+
+        Returns:
+            (unicode): The dtype, None for an object array.
+        """
+        try:
+            python_type = type_.python_type
+        except NotImplementedError:
+            return None
+
+        if python_type is bool:
+            return u"bool"
+        elif python_type is int:
+            return u"int64"
+        elif python_type in (float, decimal.Decimal):
+            return u"float64"
+        elif python_type is datetime.datetime:
+            return u"datetime64[us]"
+        elif python_type is datetime.date:
+            return u"datetime64[D]"
+        return None
+
+    def to_numpy(self, batch_size=None):
+        """
+        Fetch the cursor as NumPy arrays, typed from the columns: int64, float64, bool, datetime64
+        or object for the other types. Integer and boolean columns holding NULLs are returned
+        as float64 (NaN) and object arrays. Needs NumPy.
+        Args:
+            batch_size (int): Number of rows fetched at once, the cursor batch size by default.
+
+        Returns:
+            (OrderedDict): The array of each label (unicode: numpy.ndarray), in the order of the select.
+        """
+        import numpy
+
+        dtypes = [self._get_numpy_dtype(label.type) for label in self._fields]
+        chunks = [[] for _ in self._fields]
+
+        for batch in self._iter_column_batches(batch_size):
+            for chunk, values, dtype in zip(chunks, batch, dtypes):
+                if dtype in (u"int64", u"bool") and None in values:
+                    dtype = u"float64" if dtype == u"int64" else None
+                chunk.append(numpy.array(values, dtype=dtype or object))
+
+        return OrderedDict(
+            (label.name, numpy.concatenate(chunk) if chunk else numpy.array([], dtype=dtype or object))
+            for label, chunk, dtype in zip(self._fields, chunks, dtypes)
+        )
+
+    def _get_export_converters(self):
+        """
+        Choose, once per export, the function turning the values of each label into
+        a value json and csv can write: ISO 8601 strings for the dates and times,
+        floats for the decimals.
+        Returns:
+            (list of function): The converter of each label, None to keep the values.
+        """
+        converters = []
+        for label, converter in zip(self._fields, self._get_decoder().converters):
+            try:
+                python_type = label.type.python_type
+            except NotImplementedError:
+                python_type = None
+
+            if python_type in (datetime.datetime, datetime.date, datetime.time):
+                converter = _to_isoformat
+            converters.append(converter)
+
+        return converters
+
+    def export(self, path_or_file, format=u"jsonl", batch_size=None):
+        """
+        Write the documents of the cursor into a file, streaming the rows by batches so the memory
+        used doesn't depend on the size of the result set.
+        Formats:
+            - jsonl: one json document per line, lookups as nested objects.
+            - csv: a header with the labels, the lookup paths flattened (e.g. "project.client.name").
+        Args:
+            path_or_file (unicode|file): The path of the file to create, or a file opened in text mode.
+            format (unicode): The format of the file, "jsonl" or "csv".
+            batch_size (int): Number of rows fetched and written at once, the cursor batch size by default.
+
+        Returns:
+            (int): The number of documents written.
+        """
+        if format not in (u"jsonl", u"csv"):
+            raise ValueError(u"Unsupported export format {}.".format(format))
+
+        batch_size = batch_size or self._batch_size or DEFAULT_BATCH_SIZE
+        if hasattr(path_or_file, u"write"):
+            return self._export(path_or_file, format, batch_size)
+
+        with io.open(path_or_file, u"w", encoding=u"utf-8", newline=u"", buffering=1 << 20) as output:
+            return self._export(output, format, batch_size)
+
+    def _export(self, output, format, batch_size):
+        """
+        Write the documents of the cursor into an opened file.
+        Args:
+            output (file): The file opened in text mode.
+            format (unicode): The format of the file, "jsonl" or "csv".
+            batch_size (int): Number of rows fetched and written at once.
+
+        Returns:
+            (int): The number of documents written.
+        """
+        converters = self._get_export_converters()
+        count = 0
+
+        if format == u"csv":
+            writer = csv.writer(output)
+            writer.writerow([label.name for label in self._fields])
+            indexed_converters = [
+                (index, converter) for index, converter in enumerate(converters) if converter is not None
+            ]
+            for rows in self._iter_batches(batch_size):
+                rows = [list(row) for row in rows]
+                for index, converter in indexed_converters:
+                    for row in rows:
+                        row[index] = converter(row[index])
+                writer.writerows(rows)
+                count += len(rows)
+
+        else:
+            decode = RowDecoder(self._fields, converters).decode
+            dumps = json.JSONEncoder(ensure_ascii=False, default=UNICODE_TYPE).encode
+            for rows in self._iter_batches(batch_size):
+                output.write(u"".join([dumps(decode(row)) + u"\n" for row in rows]))
+                count += len(rows)
+
+        return count
+
+    def parallel(self, n_partitions):
+        """
+        Scan the result set in parallel: the primary key range is split into partitions,
+        each one streamed from its own connection by a thread while the documents are built.
+        The documents are merged in the sort order if the cursor is sorted, in any order otherwise.
+        Needs a single integer primary key.
+        Args:
+            n_partitions (int): Number of partitions, thus of connections used at once.
+
+        Returns:
+            (Cursor): The cursor itself.
+        """
+        if n_partitions < 1:
+            raise ValueError(u"n_partitions must be greater than 0.")
+        self._partitions = n_partitions
+        return self
+
+    def _get_partitions(self):
+        """
+        Split the primary key range of the result set into partitions of the same width.
+        Returns:
+            (list of sqlalchemy.sql.elements): The where clause of each partition, empty if there is no row.
+        """
+        columns = list(self._collection_ref._table.primary_key.columns)
+        if len(columns) != 1 or not isinstance(columns[0].type, Integer):
+            raise ValueError(u"Parallel scans need a single integer primary key.")
+        column = columns[0]
+
+        request = select([func.min(column), func.max(column)]).select_from(self._joins)
+        if self._where is not None:
+            request = request.where(self._where)
+
+        conn = self._collection_ref.get_connection()
+        try:
+            low, high = list(conn.execute(request, **self._params))[0]
+        finally:
+            self._collection_ref.release_connection(conn)
+
+        if low is None:
+            return []
+
+        width = (high - low) // self._partitions + 1
+        return [
+            and_(
+                column >= bindparam(u"partition_start", start, type_=column.type),
+                column < bindparam(u"partition_end", start + width, type_=column.type)
+            )
+            for start in range(low, high + 1, width)
+        ]
+
+    def _get_merge_key(self, sort, first_index, dialect):
+        """
+        Build the function giving the sort key of a row, to merge the rows of the partitions.
+        NULLs come first in ascending order, except on the databases sorting them last.
+        Args:
+            sort (list of tuple): The (key, direction) pairs the rows are sorted with.
+            first_index (int): Index of the first sort column in the rows.
+            dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the connections.
+
+        Returns:
+            (function): The key function.
+        """
+        null_rank = 2 if _sorts_nulls_last(dialect) else 0
+        keys = [(first_index + index, direction == -1) for index, (_, direction) in enumerate(sort)]
+
+        def merge_key(row):
+            values = []
+            for index, descending in keys:
+                value = (1, row[index]) if row[index] is not None else (null_rank, None)
+                values.append(_Descending(value) if descending else value)
+            return values
+
+        return merge_key
+
+    def _iter_parallel(self):
+        """
+        Prepare the requests of the partitions of a parallel scan.
+        Limit and skip are applied after the merge, each partition being limited to skip + limit rows.
+        Returns:
+            (generator): Generates the documents.
+        """
+        if self._group_by is not None:
+            raise ValueError(u"Parallel scans don't support grouped cursors.")
+
+        fields_mapping = self._get_fields_mapping()
+        sort = self._get_seek_keys() if self._keyset else list(self._sort or [])
+        labels = list(self._fields) + [
+            fields_mapping[key].label(u"_sort_{}".format(index)) for index, (key, _) in enumerate(sort)
+        ]
+
+        request = self._serialize(labels, add_limit_and_skip=False)
+        offset = self._offset or 0
+        if self._limit is not None:
+            request = request.limit(offset + self._limit)
+
+        requests = [request.where(partition) for partition in self._get_partitions()]
+        merge_key = None
+        if sort:
+            merge_key = self._get_merge_key(sort, len(self._fields), self._collection_ref._db_ref.get_engine().dialect)
+
+        # Closing the cursor closes the merge, stopping the threads.
+        self._result = rows = self._merge_partitions(requests, merge_key)
+        if offset or self._limit is not None:
+            rows = islice(rows, offset, None if self._limit is None else offset + self._limit)
+
+        return self._to_dict_generator(self._get_decoder(), rows)
+
+    def _merge_partitions(self, requests, merge_key):
+        """
+        Run the requests of the partitions in threads and merge their rows.
+        The threads stop as soon as the generator is closed.
+        Args:
+            requests (list of sqlalchemy.sql.selectable.Select): The request of each partition.
+            merge_key (function): The sort key of the rows, None to yield them in any order.
+
+        Returns:
+            (generator): Generates the rows.
+        """
+        if not requests:
+            return
+
+        stop = threading.Event()
+        if merge_key is None:
+            outputs = [queue.Queue(maxsize=len(requests) * 2)] * len(requests)
+        else:
+            outputs = [queue.Queue(maxsize=2) for _ in requests]
+
+        threads = [
+            threading.Thread(target=self._run_partition, args=(request, output, stop))
+            for request, output in zip(requests, outputs)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            if merge_key is None:
+                for row in self._read_partition(outputs[0], len(requests)):
+                    yield row
+            else:
+                for row in heapq.merge(*[self._read_partition(output) for output in outputs], key=merge_key):
+                    yield row
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _run_partition(self, request, output, stop):
+        """
+        Stream the rows of a partition into a queue, by batches. Runs in its own thread.
+        Args:
+            request (sqlalchemy.sql.selectable.Select): The request of the partition.
+            output (queue.Queue): Receives the batches, then the error if any and _PARTITION_DONE.
+            stop (threading.Event): Set when the rows aren't needed anymore.
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        try:
+            conn = self._collection_ref.get_connection()
+            try:
+                result = conn.execution_options(stream_results=True).execute(request, **self._params)
+                try:
+                    while not stop.is_set():
+                        rows = result.fetchmany(self._batch_size or DEFAULT_BATCH_SIZE)
+                        if not rows:
+                            break
+                        put(rows)
+                finally:
+                    result.close()
+            finally:
+                self._collection_ref.release_connection(conn)
+        except Exception as exception:
+            put(exception)
+
+        put(_PARTITION_DONE)
+
+    @staticmethod
+    def _read_partition(output, partitions=1):
+        """
+        Generate the rows put in a queue by partitions, until they are all done.
+        Args:
+            output (queue.Queue): The queue the partitions write into.
+            partitions (int): Number of partitions writing into the queue.
+
+        Returns:
+            (generator): Generates the rows.
+        """
+        while partitions:
+            item = output.get()
+            if item is _PARTITION_DONE:
+                partitions -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for row in item:
+                    yield row
+
+    def __enter__(self):
+        """
+        Use the cursor as a context manager, closing it at exit.
+        Returns:
+            (Cursor): The cursor itself.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Close the cursor when leaving the with block.
+        """
+        self.close()
+
+    def close(self):
+        """
+        Close the pending result and release the connection of the cursor, if any.
+        An iteration left before its end is closed too, finishing its profiled operation.
+        """
+        generator, stats = self._generator, self._iteration_stats
+        self._generator, self._iteration_stats = None, None
+        try:
+            if generator is not None:
+                generator.close()
+        finally:
+            self._close_result()
+            if stats is not None:
+                stats.profiler.finish(stats)
+
+    def _close_result(self):
+        """
+        Close the pending result and release the connection of the cursor, if any.
+        """
+        result, connection = self._result, self._connection
+        self._result, self._connection = None, None
+        try:
+            if result is not None:
+                result.close()
+        finally:
+            if connection is not None:
+                self._collection_ref.release_connection(connection)
+
+    def _to_dict_generator(self, decoder, rows):
         """
         Transforms rows into dict.
         Args:
-            columns (list of sqlalchemy.sql.base.ImmutableColumnCollection): List of columns to set in dict.
+            decoder (RowDecoder): The decoder built from the selected labels.
             rows (sqlalchemy.engine.result.ResultProxy): Result set containing the rows.
 
         Returns:
             (generator): Generates an iterator on rows transformed in dict.
         """
-        for row in rows:
-            obj = {}
+        decode = decoder.decode
+        try:
+            for row in rows:
+                yield decode(row)
+        finally:
+            self._close_result()
 
-            for key, value in row.items():
-                python_type = type(value)
-                if python_type in [decimal.Decimal, float]:
-                    value = float(value)
+    def _to_profiled_dict_generator(self, decoder, rows, stats):
+        """
+        Transforms rows into dict, like _to_dict_generator, timing the decode phase of the operation.
+        The time spent by the caller between two documents isn't counted. The operation ends with the iteration.
+        Args:
+            decoder (RowDecoder): The decoder built from the selected labels.
+            rows (sqlalchemy.engine.result.ResultProxy): Result set containing the rows.
+            stats (OperationStats): The statistics of the operation.
 
-                # elif python_type is BYTE_TYPE:
-                #     value = value.decode(self._collection_ref._db_ref._encoding)
+        Returns:
+            (generator): Generates an iterator on rows transformed in dict.
+        """
+        decode = decoder.decode
+        duration = 0.0
+        error = None
+        try:
+            started_at = clock()
+            for row in rows:
+                document = decode(row)
+                stats.rows += 1
+                duration += clock() - started_at
+                yield document
+                started_at = clock()
+            duration += clock() - started_at
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            stats.add(u"decode", duration)
+            self._close_result()
+            stats.profiler.finish(stats, error)
 
-                json_set(obj, key, value)
+    def _start_profiling(self, operation):
+        """
+        Start recording an execution of the cursor, with the phases of its planning.
+        Args:
+            operation (unicode): The name of the operation.
 
-            yield obj
+        Returns:
+            (OperationStats): The statistics of the operation, None if the database isn't profiled.
+        """
+        if self._stats is None:
+            return None
+
+        stats = self._stats.profiler.start(self._stats.collection, operation)
+        stats.phases.update(self._stats.phases)
+        return stats
 
-        raise StopIteration
+    def _get_decoder(self):
+        """
+        Get the decoder of the cursor rows, built once from the selected labels.
+        Returns:
+            (RowDecoder): The decoder.
+        """
+        if self._decoder is None:
+            self._decoder = RowDecoder(self._fields)
+        return self._decoder
 
     def _serialize_count(self, with_limit_and_skip=False):
         """
@@ -80,19 +775,26 @@ class Cursor(object):
         Returns:
             (sqlalchemy.sql.selectable.Select): A SQLAlchemy representation of the select request used.
         """
-        if not with_limit_and_skip:
-            request = self._serialize([func.count()], add_limit_and_skip=False)
+        # The order only matters to the rows limit and skip keep.
+        if self._group_by is not None:
+            request = select([func.count()]).select_from(self._serialize(
+                add_limit_and_skip=with_limit_and_skip, add_order_by=with_limit_and_skip
+            ).alias(u"sub"))
+        elif not with_limit_and_skip:
+            request = self._serialize([func.count()], add_limit_and_skip=False, add_order_by=False)
         else:
             request = select([func.count()]).select_from(self._serialize().alias(u"sub"))
 
         return request
 
-    def _serialize(self, labels=None, add_limit_and_skip=True):
+    def _serialize(self, labels=None, add_limit_and_skip=True, add_order_by=True):
         """
         Serialize the request using the different elements from the cursor.
         Args:
             labels (list of sqlalchemy.sql.elements.Label): A list of select labels. Used to affect which fields
                 are returned (for count and projection features).
+            add_limit_and_skip (bool): Apply the limit and the skip of the cursor.
+            add_order_by (bool): Apply the sort of the cursor (the keyset pagination still filters the rows).
         Returns:
             (sqlalchemy.sql.selectable.Select): A SQLAlchemy representation of the select request.
         """
@@ -102,7 +804,20 @@ class Cursor(object):
         if self._where is not None:
             request = request.where(self._where)
 
-        if self._order_by is not None:
+        if self._group_by:
+            request = request.group_by(*self._group_by)
+
+        if self._having is not None:
+            request = request.having(self._having)
+
+        if self._keyset:
+            seek_where, order_by = self._serialize_seek()
+            if seek_where is not None:
+                request = request.where(seek_where)
+            if add_order_by:
+                request = request.order_by(*order_by)
+
+        elif self._order_by is not None and add_order_by:
             request = request.order_by(*self._order_by)
 
         if self._offset is not None and add_limit_and_skip:
@@ -123,7 +838,7 @@ class Cursor(object):
         Returns:
             (Cursor): The cursor itself.
         """
-        fields_mapping, _ = self._collection_ref.generate_select_dependencies(self._lookup)
+        fields_mapping = self._get_fields_mapping()
 
         if isinstance(key_or_list, str):
             key_or_list = [key_or_list]
@@ -143,15 +858,140 @@ class Cursor(object):
         }
 
         to_order_by = []
+        sort = []
 
         for index, key in enumerate(key_or_list):
             column = fields_mapping.get(key)
             if column is not None:
                 to_order_by.append(getattr(column, binding[direction[index]])())
+                sort.append((key, direction[index]))
 
         self._order_by = to_order_by
+        self._sort = sort
+        self._collection_ref._db_ref._field_usage.record(SORT, [
+            get_column_key(fields_mapping[key]) for key, _ in sort if isinstance(fields_mapping[key], Column)
+        ])
         return self
 
+    def _get_fields_mapping(self):
+        """
+        Get the mapping between the document keys and the columns of the cursor.
+        Returns:
+            (dict): The field mapping (unicode: Column).
+        """
+        if self._fields_mapping is None:
+            self._fields_mapping = self._collection_ref.get_plan(self._lookup).fields_mapping
+        return self._fields_mapping
+
+    def _get_seek_keys(self):
+        """
+        Get the keys the keyset pagination relies on: the sort keys followed by the primary key.
+        Returns:
+            (list of tuple): The (key, direction) pairs.
+        """
+        fields_mapping = self._get_fields_mapping()
+        keys = list(self._sort or [])
+        sorted_columns = [fields_mapping[key] for key, _ in keys]
+
+        for column in self._collection_ref._table.primary_key.columns:
+            if any(sorted_column is column for sorted_column in sorted_columns):
+                continue
+            for key, mapped_column in fields_mapping.items():
+                if mapped_column is column:
+                    keys.append((key, 1))
+                    break
+
+        if not keys:
+            raise ValueError(u"Keyset pagination needs a sort key or a primary key.")
+
+        return keys
+
+    def _serialize_seek(self):
+        """
+        Serialize the keyset pagination part of the request.
+        Rows are ordered by the seek keys and, after a document, the next rows are selected with
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) ..., comparisons being reversed for descending keys.
+        On nullable keys, the comparisons follow the place of the NULLs in the order of the dialect:
+        after a NULL come the non NULL values (NULLs first) or nothing (NULLs last), and the NULLs
+        come after a value when they are sorted last.
+        Returns:
+            (sqlalchemy.sql.elements, list): The where clause (None for the first page) and the order by clauses.
+        """
+        fields_mapping = self._get_fields_mapping()
+        keys = self._get_seek_keys()
+        order_by = [
+            fields_mapping[key].asc() if direction == 1 else fields_mapping[key].desc() for key, direction in keys
+        ]
+
+        if self._after is None:
+            return None, order_by
+
+        nulls_last = False
+        if any(getattr(fields_mapping[key], u"nullable", True) for key, _ in keys):
+            nulls_last = _sorts_nulls_last(self._collection_ref._db_ref.get_engine().dialect)
+
+        clauses = []
+        equalities = []
+        for index, (key, direction) in enumerate(keys):
+            column = fields_mapping[key]
+            python_value = self._collection_ref._convert_to_python_type(json_get(self._after, key), column)
+            # Named so they can't conflict with the parameters of the where clause.
+            value = bindparam(u"seek_{}".format(index + 1), python_value, type_=column.type)
+            comparison = column > value if direction == 1 else column < value
+            tie = column == value
+
+            if getattr(column, u"nullable", True):
+                nulls_first = nulls_last == (direction == -1)
+                if python_value is None:
+                    comparison = column.isnot(None) if nulls_first else None
+                    tie = column.is_(None)
+                elif not nulls_first:
+                    comparison = or_(comparison, column.is_(None))
+
+            if comparison is not None:
+                clauses.append(and_(*(equalities + [comparison])))
+            equalities.append(tie)
+
+        return or_(false(), *clauses), order_by
+
+    def after(self, document_or_token=None):
+        """
+        Use keyset pagination: return the documents coming after a document, in the sort order.
+        The primary key is added to the sort keys so the order is total. Unlike skip(), the cost of
+        a page doesn't depend on its depth.
+        Args:
+            document_or_token (dict|unicode): The last document of the previous page, or a token from
+                continuation_token(). None for the first page.
+
+        Returns:
+            (Cursor): The cursor itself.
+        """
+        if document_or_token is not None and not isinstance(document_or_token, dict):
+            values = json.loads(
+                base64.urlsafe_b64decode(document_or_token.encode(u"ascii")).decode(u"utf-8"),
+                object_hook=_decode_token_value
+            )
+            document_or_token = {}
+            for key, value in values.items():
+                json_set(document_or_token, key, value)
+
+        self._keyset = True
+        self._after = document_or_token
+        return self
+
+    def continuation_token(self, document):
+        """
+        Build an opaque token to fetch the documents coming after a document with after().
+        Args:
+            document (dict): The last document of a page.
+
+        Returns:
+            (unicode): The token.
+        """
+        values = dict((key, json_get(document, key)) for key, _ in self._get_seek_keys())
+        token = json.dumps(values, default=_encode_token_value, sort_keys=True)
+        return base64.urlsafe_b64encode(token.encode(u"utf-8")).decode(u"ascii")
+
     def limit(self, limit):
         """
         Limits the result set.
@@ -164,6 +1004,20 @@ class Cursor(object):
         self._limit = limit
         return self
 
+    def batch_size(self, batch_size):
+        """
+        Stream the result set with a server side cursor, fetching the rows by batches.
+        Args:
+            batch_size (int): Number of rows fetched at once.
+
+        Returns:
+            (Cursor): The cursor itself.
+        """
+        if batch_size < 1:
+            raise ValueError(u"batch_size must be greater than 0.")
+        self._batch_size = batch_size
+        return self
+
     def skip(self, skip):
         """
         Skips lines in the result set.
@@ -184,7 +1038,63 @@ class Cursor(object):
         Returns:
             (int): The line count.
         """
-        conn = self._collection_ref.get_connection()
-        request = self._serialize_count(with_limit_and_skip)
-        count = conn.execute(request)
-        return list(count)[0][0]
+        with record(self._start_profiling(u"count")):
+            request = self._serialize_count(with_limit_and_skip)
+            if self._result_cache is not None:
+                return self._get_cached(request, lambda result: list(result)[0][0])
+
+            conn = self._collection_ref.get_connection()
+            try:
+                count = conn.execute(request, **self._params)
+                return list(count)[0][0]
+            finally:
+                self._collection_ref.release_connection(conn)
+
+    @staticmethod
+    def _supports_window_functions(dialect):
+        """
+        Tell if a dialect supports window functions (COUNT(*) OVER ()).
+        Args:
+            dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the connection.
+
+        Returns:
+            (bool): True if window functions are available.
+        """
+        if dialect.name == u"sqlite":
+            return dialect.dbapi.sqlite_version_info >= (3, 25)
+        elif dialect.name == u"mysql":
+            version = dialect.server_version_info or ()
+            return version >= (10, 2) if getattr(dialect, u"is_mariadb", False) else version >= (8, 0)
+        return True
+
+    def with_total(self):
+        """
+        Fetch the documents of the cursor with the count of the documents matching the query (ignoring
+        limit and skip), in a single round trip with a COUNT(*) OVER () column when the database supports it.
+        Otherwise, the select and the count are executed on the same connection.
+        Returns:
+            (list of dict, int): The documents and the total count.
+        """
+        decode = self._get_decoder().decode
+        with record(self._start_profiling(u"find")) as stats:
+            conn = self._collection_ref.get_connection()
+            try:
+                total = None
+                if self._supports_window_functions(conn.dialect):
+                    request = self._serialize(list(self._fields) + [func.count().over().label(u"_total")])
+                    rows = list(conn.execute(request, **self._params))
+                    if rows:
+                        total = rows[0][-1]
+                    elif not self._offset and self._limit != 0:
+                        total = 0
+                else:
+                    rows = list(conn.execute(self._serialize(), **self._params))
+
+                if total is None:
+                    total = list(conn.execute(self._serialize_count(), **self._params))[0][0]
+            finally:
+                self._collection_ref.release_connection(conn)
+
+            if stats is not None:
+                stats.rows = len(rows)
+            return [decode(row) for row in rows], total
@@ -2,11 +2,15 @@
 """
 Contains DB Class.
 """
-from sqlalchemy import (
-    create_engine,
-    MetaData
-)
+import hashlib
+import threading
+from contextlib import contextmanager
+from sqlalchemy import MetaData
+from sqlalchemy.exc import InvalidRequestError
+from .engine import get_engine
 from .collection import Collection
+from .metadata_cache import MetadataCache
+from .index_advisor import FieldUsage, get_indexes, suggest_indexes
 from .utils import parse_url_and_add_param
 
 
@@ -14,17 +18,41 @@ class DB(object):
     """
     Wrapper around a database schema.
     """
-    def __init__(self, url, schema=None, encoding=None):
+    def __init__(self, url, schema=None, encoding=None, engine_options=None, metadata_cache=None,
+                 metadata_cache_ttl=None, result_cache=None, profiler=None):
         """
         Construct the object.
         Args:
             url (unicode): The DB connection URL.
             schema (unicode): Optionnal schema to select.
             encoding (str): The encoding to use during interactions with the database.
+            engine_options (dict): Pool options given to create_engine (pool_size, max_overflow, ...).
+            metadata_cache (unicode): Optionnal directory where the reflected schema is cached.
+            metadata_cache_ttl (int): Number of seconds the cached schema stays valid (forever if None).
+            result_cache (ResultCache): Optionnal cache for the results of the cursors.
+            profiler (Profiler): Optionnal recorder of the timings of the operations.
         """
         self._url = url
         self._schema = schema
         self._encoding = encoding
+        self._engine_options = engine_options or {}
+        self._metadata = None
+        self._reflection_lock = threading.RLock()
+        # The names found to be no table, not reflected again until refresh_schema.
+        self._missing_tables = set()
+        self._metadata_cache = None
+        if metadata_cache is not None:
+            self._metadata_cache = MetadataCache(metadata_cache, url, schema, metadata_cache_ttl)
+        self._result_cache = result_cache
+        self._profiler = profiler
+        # The columns the collections filter, sort and join on, for the index advisor.
+        self._field_usage = FieldUsage()
+        # The connection and the written tables of the transaction of each thread.
+        self._local = threading.local()
+        # Identifies the database in the keys of a result cache shared between databases.
+        self._cache_namespace = hashlib.sha1(
+            u"{}|{}".format(url, schema or u"").encode(u"utf-8")
+        ).hexdigest()
 
     def __getattr__(self, name):
         """
@@ -36,38 +64,165 @@ class DB(object):
         Returns:
             The attribute attribute.
         """
+        if name.startswith(u"__"):
+            raise AttributeError(name)
+
         if name not in self.__dict__:
-            self.discover_collections()
+            if name in self._missing_tables:
+                raise KeyError(name)
+            try:
+                self._reflect(name)
+            except InvalidRequestError:
+                self._missing_tables.add(name)
+                raise KeyError(name)
 
         return self.__dict__[name]
 
     def get_engine(self):
         """
-        Creates the SQLAlchemy engine.
+        Get the SQLAlchemy engine, shared with every DB using the same url and options.
+        Returns:
+            (sqlalchemy.engine.Engine): The Engine.
+        """
+        url = parse_url_and_add_param(self._url, u"charset", self._encoding)
+        engine = get_engine(url, encoding=self._encoding, **self._engine_options)
+        if self._profiler is not None:
+            self._profiler.instrument(engine)
+        return engine
+
+    def get_transaction_connection(self):
+        """
+        Get the connection of the transaction opened by the current thread.
         Returns:
-            (sqlalchemy.engine.Engine): The created Engine.
+            (sqlalchemy.engine.base.Connection): The connection, None outside of a transaction.
+        """
+        return getattr(self._local, u"connection", None)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Open a transaction: the collections of the database use the same connection for all the operations
+        made by the thread in the with block, committed once at the end (or rolled back on error).
+        Transactions opened inside a transaction join it.
+        The result cache is bypassed during the transaction, and the written tables invalidated at the end.
+        Returns:
+            (DB): The database itself.
+        """
+        if self.get_transaction_connection() is not None:
+            yield self
+            return
+
+        connection = self.get_engine().connect()
+        self._local.connection = connection
+        self._local.written_tables = set()
+        try:
+            with connection.begin():
+                yield self
+        finally:
+            written_tables = self._local.written_tables
+            self._local.connection = None
+            self._local.written_tables = None
+            connection.close()
+            if self._result_cache is not None and written_tables:
+                self._result_cache.invalidate(*written_tables)
+
+    def get_metadata(self):
+        """
+        Get the metadata holding the tables reflected so far, loading it from the cache file if any.
+        Returns:
+            (sqlalchemy.MetaData): The metadata.
+        """
+        if self._metadata is None:
+            metadata = None
+            if self._metadata_cache is not None:
+                metadata = self._metadata_cache.load()
+            self._metadata = metadata if metadata is not None else MetaData(schema=self._schema)
+
+        return self._metadata
+
+    def _reflect(self, name, bind=None):
+        """
+        Reflect a single table (and the tables its foreign keys point to), then create its collection.
+        Args:
+            name (unicode): The name of the table to reflect.
+            bind (sqlalchemy.engine.Connectable): The engine or connection to reflect with.
+        """
+        with self._reflection_lock:
+            metadata = self.get_metadata()
+            key = name if not self._schema else u"{}.{}".format(self._schema, name)
+
+            if key not in metadata.tables:
+                metadata.reflect(bind=bind or self.get_engine(), only=[name], views=True)
+                if self._metadata_cache is not None:
+                    self._metadata_cache.save(metadata)
+
+            self._register_collections(metadata)
+
+    def _register_collections(self, metadata):
+        """
+        Create a collection object for each table of the metadata not yet known.
+        Args:
+            metadata (sqlalchemy.MetaData): The metadata containing the tables.
         """
-        if self._encoding is not None:
-            url = parse_url_and_add_param(self._url, u"charset", self._encoding)
-            return create_engine(
-                url, encoding=self._encoding
-            )
-        else:
-            return create_engine(self._url)
+        for key in metadata.tables:
+            root_table = metadata.tables[key]
+            if self._schema:
+                key = key.split(".")[1]
+            if key not in self.__dict__:
+                setattr(self, key, Collection(
+                    db_ref=self,
+                    table=root_table
+                ))
 
     def discover_collections(self):
         """
         Discover tables, create a collection object for each one in the
         schema.
         """
-        meta = MetaData(schema=self._schema)
-        meta.reflect(bind=self.get_engine(), views=True)
+        with self._reflection_lock:
+            metadata = self.get_metadata()
+            metadata.reflect(bind=self.get_engine(), views=True)
+            if self._metadata_cache is not None:
+                self._metadata_cache.save(metadata)
 
-        for key in meta.tables:
-            root_table = meta.tables[key]
-            if self._schema:
-                key = key.split(".")[1]
-            setattr(self, key, Collection(
-                db_ref=self,
-                table=root_table
-            ))
+            self._register_collections(metadata)
+
+    def refresh_schema(self):
+        """
+        Forget the reflected tables and their collections, and invalidate the cache file.
+        Tables are reflected again from the database the next time they are accessed.
+        """
+        with self._reflection_lock:
+            for key, value in list(self.__dict__.items()):
+                if isinstance(value, Collection):
+                    value.clear_plan_cache()
+                    delattr(self, key)
+
+            self._metadata = None
+            self._missing_tables.clear()
+            if self._metadata_cache is not None:
+                self._metadata_cache.clear()
+
+    def index_report(self, ddl=False):
+        """
+        Report the indexes of the reflected tables and suggest the missing ones: the foreign keys the lookups
+        join on and the columns the operations filtered, sorted or joined on so far, ranked by score.
+        See sqlcollection.index_advisor.suggest_indexes.
+        Args:
+            ddl (bool): Add the CREATE INDEX statements to the suggestions.
+
+        Returns:
+            (dict): The existing indexes of each table (unicode: list of dict) and the suggestions, best first.
+        """
+        tables = sorted(self.get_metadata().tables.values(), key=lambda table: table.name)
+        dialect = self.get_engine().dialect if ddl else None
+        return {
+            u"indexes": dict((table.name, get_indexes(table)) for table in tables),
+            u"suggestions": suggest_indexes(tables, self._field_usage, dialect)
+        }
+
+    def reset_field_usage(self):
+        """
+        Forget the uses of the columns recorded so far for the index advisor.
+        """
+        self._field_usage.clear()
@@ -0,0 +1,115 @@
+# coding utf-8
+"""
+Contains RowDecoder Class.
+"""
+
+import decimal
+from sqlalchemy.types import Numeric
+from sqlalchemy.sql.expression import ColumnClause
+
+
+def _to_float(value):
+    """
+    Convert a numeric value into a float, keeping None.
+    Args:
+        value (object): The value to convert.
+
+    Returns:
+        (float): The converted value.
+    """
+    return None if value is None else float(value)
+
+
+def _to_float_if_decimal(value):
+    """
+    Convert a value into a float only if it is a Decimal or a float.
+    Used for columns the type of which is unknown, and for the expressions the drivers can return
+    as Decimal whatever their type (e.g. SUM of an integer column with MySQL).
+    Args:
+        value (object): The value to convert.
+
+    Returns:
+        (object): The converted value.
+    """
+    if type(value) in (decimal.Decimal, float):
+        return float(value)
+    return value
+
+
+class RowDecoder(object):
+    """
+    Turns rows into nested documents, following a plan computed once from the selected labels.
+    """
+    def __init__(self, labels, converters=None):
+        """
+        Construct the object.
+        Args:
+            labels (list of sqlalchemy.sql.elements.Label): The selected labels, in the order of the row.
+            converters (list of function): The converter of each label (None to keep the values),
+                chosen from the label types if not given.
+        """
+        self._steps = []
+        self.converters = []
+        nodes = {(): 0}
+
+        for index, label in enumerate(labels):
+            path = tuple(label.name.split(u"."))
+
+            for depth in range(1, len(path)):
+                if path[:depth] not in nodes:
+                    nodes[path[:depth]] = len(nodes)
+                    self._steps.append((nodes[path[:depth - 1]], path[depth - 1], None, None))
+
+            if converters is None:
+                column = isinstance(getattr(label, u"element", label), ColumnClause)
+                self.converters.append(self._get_converter(label.type, column))
+            else:
+                self.converters.append(converters[index])
+            self._steps.append((nodes[path[:-1]], path[-1], index, self.converters[-1]))
+
+    @staticmethod
+    def _get_converter(type_, column=True):
+        """
+        Choose the function converting the values of a column.
+        Args:
+            type_ (sqlalchemy.types.TypeEngine): The type of the column.
+            column (bool): False for the other expressions (aggregates, functions...), the type of
+                which doesn't tell if the values are Decimals.
+
+        Returns:
+            (function): The converter, None if the values are kept as they are.
+        """
+        if isinstance(type_, Numeric):
+            return _to_float if type_.asdecimal else None
+
+        if not column:
+            return _to_float_if_decimal
+
+        try:
+            type_.python_type
+        except NotImplementedError:
+            return _to_float_if_decimal
+
+        return None
+
+    def decode(self, row):
+        """
+        Build the document of a row.
+        Args:
+            row (sequence): The row values, in the order of the labels.
+
+        Returns:
+            (dict): The document.
+        """
+        nodes = [{}]
+        for node, key, index, converter in self._steps:
+            if index is None:
+                child = {}
+                nodes[node][key] = child
+                nodes.append(child)
+            elif converter is None:
+                nodes[node][key] = row[index]
+            else:
+                nodes[node][key] = converter(row[index])
+
+        return nodes[0]
@@ -0,0 +1,73 @@
+# coding utf-8
+"""
+Process-wide registry of SQLAlchemy engines, shared by all the DB objects.
+"""
+
+import threading
+from sqlalchemy import create_engine
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def get_engine(url, **kwargs):
+    """
+    Return the engine registered for the url and options, creating it on first use.
+    Args:
+        url (unicode): The connection URL (already adapted to the database).
+        **kwargs: Options given to create_engine (pool_size, max_overflow, pool_recycle, ...).
+            Options set to None are ignored so the dialect defaults apply.
+
+    Returns:
+        (sqlalchemy.engine.Engine): The shared engine.
+    """
+    options = dict((key, value) for key, value in kwargs.items() if value is not None)
+    key = (url, tuple(sorted(options.items())))
+
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_engine(url, **options)
+                _engines[key] = engine
+
+    return engine
+
+
+def get_async_engine(url, **kwargs):
+    """
+    Return the asyncio engine registered for the url and options, creating it on first use.
+    Needs SQLAlchemy 1.4 and an asyncio driver (aiosqlite, asyncpg, aiomysql).
+    Args:
+        url (unicode): The connection URL (already adapted to the database).
+        **kwargs: Options given to create_async_engine, None values are ignored.
+
+    Returns:
+        (sqlalchemy.ext.asyncio.AsyncEngine): The shared engine.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    options = dict((key, value) for key, value in kwargs.items() if value is not None)
+    key = (u"async", url, tuple(sorted(options.items())))
+
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_async_engine(url, **options)
+                _engines[key] = engine
+
+    return engine
+
+
+def dispose_engines():
+    """
+    Dispose all the registered engines and empty the registry.
+    Must be called in a forked worker before using the database, pools can't be shared across processes.
+    """
+    with _lock:
+        for engine in _engines.values():
+            getattr(engine, u"sync_engine", engine).dispose()
+        _engines.clear()
@@ -0,0 +1,355 @@
+# coding utf-8
+"""
+Query plans: runs the EXPLAIN of the database on a statement and normalizes its output.
+"""
+
+import re
+import json
+from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from .compatibility import UNICODE_TYPE
+
+# Access types of the normalized steps.
+SCAN = u"scan"
+INDEX_SCAN = u"index_scan"
+INDEX = u"index"
+
+_SQLITE_STEP = re.compile(u"^(SCAN|SEARCH)(?: TABLE)? (\\S+)(?: AS (\\S+))?(.*)$")
+_MYSQL_TREE_STEPS = [
+    (re.compile(u"Table scan on (\\S+)"), SCAN),
+    (re.compile(u"Index scan on (\\S+) using (\\S+)"), INDEX_SCAN),
+    (re.compile(u"[Ii]ndex (?:lookup|range scan) on (\\S+) using (\\S+)"), INDEX)
+]
+_MYSQL_ESTIMATED_ROWS = re.compile(u"\\(cost=[\\d.e+]+ rows=([\\d.e+]+)\\)")
+_MYSQL_ACTUAL_ROWS = re.compile(u"\\(actual time=[\\d.e+]+\\.\\.[\\d.e+]+ rows=([\\d.e+]+)")
+
+
+class Explain(Executable, ClauseElement):
+    """
+    Statement prefixing another one with EXPLAIN, executed with the parameters of the explained statement.
+    """
+    inherit_cache = False
+    # Read by the compiler when the explained statement is an update or a delete.
+    _returning = ()
+    _inline = False
+    _return_defaults = False
+
+    def __init__(self, statement, prefix):
+        """
+        Construct the object.
+        Args:
+            statement (sqlalchemy.sql.expression.Executable): The explained statement.
+            prefix (unicode): The EXPLAIN command of the dialect (e.g. "EXPLAIN QUERY PLAN").
+        """
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kwargs):
+    """
+    Render an Explain statement: the command followed by the explained statement.
+    """
+    return u"{} {}".format(element.prefix, compiler.process(element.statement, **kwargs))
+
+
+class Explanation(object):
+    """
+    The query plan of a statement, normalized across the databases.
+    Each step of the plan is a dict with:
+        - table: The table or alias the step reads, None for the other steps (sorts, aggregates...).
+        - access: "scan" (the whole table is read), "index_scan" (the whole index is read),
+            "index" (rows found with an index) or None.
+        - index: The name of the index used, if any.
+        - rows: The number of rows the database estimates, if it gives it.
+        - actual_rows: The number of rows read, with analyze.
+        - detail: The description of the step given by the database.
+    """
+    def __init__(self, dialect, statement, plan, steps, missing_indexes):
+        """
+        Construct the object.
+        Args:
+            dialect (unicode): The name of the dialect.
+            statement (unicode): The explained SQL.
+            plan (object): The plan as returned by the database.
+            steps (list of dict): The normalized steps.
+            missing_indexes (list of dict): The join columns of the lookups without index (table, column, as).
+        """
+        self.dialect = dialect
+        self.statement = statement
+        self.plan = plan
+        self.steps = steps
+        self.missing_indexes = missing_indexes
+
+    @property
+    def sequential_scans(self):
+        """
+        Get the tables read entirely.
+        Returns:
+            (list of unicode): The tables or aliases, in the order of the plan.
+        """
+        return [step[u"table"] for step in self.steps if step[u"access"] == SCAN]
+
+    def to_dict(self):
+        """
+        Serialize the explanation.
+        Returns:
+            (dict): The explanation.
+        """
+        return {
+            u"dialect": self.dialect,
+            u"statement": self.statement,
+            u"plan": self.plan,
+            u"steps": self.steps,
+            u"sequential_scans": self.sequential_scans,
+            u"missing_indexes": self.missing_indexes
+        }
+
+
+def _step(table, access, index=None, rows=None, actual_rows=None, detail=None):
+    """
+    Build a normalized step, see Explanation.
+    """
+    return {
+        u"table": table,
+        u"access": access,
+        u"index": index,
+        u"rows": rows,
+        u"actual_rows": actual_rows,
+        u"detail": detail
+    }
+
+
+def get_explain_prefix(dialect, analyze=False):
+    """
+    Get the EXPLAIN command of a dialect.
+    Args:
+        dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the connection.
+        analyze (bool): Execute the statement to get the actual numbers of rows (PostgreSQL, MySQL 8.0.18+).
+
+    Returns:
+        (unicode): The command.
+    """
+    if dialect.name == u"sqlite" and not analyze:
+        return u"EXPLAIN QUERY PLAN"
+    elif dialect.name == u"postgresql":
+        return u"EXPLAIN (ANALYZE, FORMAT JSON)" if analyze else u"EXPLAIN (FORMAT JSON)"
+    elif dialect.name == u"mysql":
+        return u"EXPLAIN ANALYZE" if analyze else u"EXPLAIN FORMAT=JSON"
+
+    raise NotImplementedError(u"{} isn't supported with {}.".format(
+        u"EXPLAIN ANALYZE" if analyze else u"EXPLAIN", dialect.name
+    ))
+
+
+def parse_sqlite_plan(rows):
+    """
+    Normalize the rows of EXPLAIN QUERY PLAN (id, parent, notused, detail).
+    Args:
+        rows (list of tuple): The rows.
+
+    Returns:
+        (list of dict): The steps.
+    """
+    steps = []
+    for row in rows:
+        detail = row[-1]
+        match = _SQLITE_STEP.match(detail)
+        if match is None:
+            steps.append(_step(None, None, detail=detail))
+            continue
+
+        operation, table, alias, using = match.groups()
+        index = re.search(u"INDEX (\\S+)", using)
+        index = index.group(1) if index is not None else (u"PRIMARY KEY" if u"PRIMARY KEY" in using else None)
+        if u"AUTOMATIC" in using:
+            # The table is read entirely to build a temporary index.
+            access, index = SCAN, None
+        elif operation == u"SEARCH":
+            access = INDEX
+        else:
+            access = INDEX_SCAN if index is not None else SCAN
+        steps.append(_step(alias or table, access, index, detail=detail))
+
+    return steps
+
+
+def parse_postgresql_plan(plan):
+    """
+    Normalize the output of EXPLAIN (FORMAT JSON): the nodes of the plan tree, depth first.
+    Args:
+        plan (list of dict): The plan.
+
+    Returns:
+        (list of dict): The steps.
+    """
+    steps = []
+    nodes = [plan[0][u"Plan"]]
+    while nodes:
+        node = nodes.pop()
+        node_type = node[u"Node Type"]
+        if node_type == u"Seq Scan":
+            access = SCAN
+        elif node_type in (u"Index Scan", u"Index Only Scan", u"Bitmap Index Scan", u"Bitmap Heap Scan"):
+            access = INDEX
+        else:
+            access = None
+        steps.append(_step(
+            node.get(u"Alias", node.get(u"Relation Name")),
+            access,
+            node.get(u"Index Name"),
+            node.get(u"Plan Rows"),
+            node.get(u"Actual Rows"),
+            node_type
+        ))
+        nodes.extend(reversed(node.get(u"Plans", [])))
+
+    return steps
+
+
+def parse_mysql_plan(plan):
+    """
+    Normalize the output of EXPLAIN FORMAT=JSON: the tables of the query blocks.
+    Args:
+        plan (dict): The plan.
+
+    Returns:
+        (list of dict): The steps.
+    """
+    steps = []
+    values = [plan]
+    while values:
+        value = values.pop()
+        if isinstance(value, list):
+            values.extend(reversed(value))
+        elif isinstance(value, dict):
+            table = value.get(u"table")
+            if isinstance(table, dict) and u"table_name" in table:
+                access_type = table.get(u"access_type")
+                access = SCAN if access_type == u"ALL" else INDEX_SCAN if access_type == u"index" else INDEX
+                steps.append(_step(
+                    table[u"table_name"], access, table.get(u"key"), table.get(u"rows_examined_per_scan"),
+                    detail=access_type
+                ))
+            values.extend(reversed([item for key, item in value.items() if isinstance(item, (list, dict))]))
+
+    return steps
+
+
+def parse_mysql_tree(tree):
+    """
+    Normalize the output of EXPLAIN ANALYZE (a tree of "-> ..." lines).
+    Args:
+        tree (unicode): The plan.
+
+    Returns:
+        (list of dict): The steps.
+    """
+    steps = []
+    for line in tree.splitlines():
+        detail = line.strip().lstrip(u"-> ")
+        if not detail:
+            continue
+
+        table, access, index = None, None, None
+        for pattern, pattern_access in _MYSQL_TREE_STEPS:
+            match = pattern.search(detail)
+            if match is not None:
+                table, access = match.group(1), pattern_access
+                index = match.group(2) if match.lastindex > 1 else None
+                break
+
+        rows = _MYSQL_ESTIMATED_ROWS.search(detail)
+        actual_rows = _MYSQL_ACTUAL_ROWS.search(detail)
+        steps.append(_step(
+            table, access, index,
+            float(rows.group(1)) if rows else None,
+            float(actual_rows.group(1)) if actual_rows else None,
+            detail
+        ))
+
+    return steps
+
+
+def _load_json(value):
+    """
+    Decode a JSON plan, if the driver didn't.
+    """
+    return json.loads(value) if isinstance(value, (UNICODE_TYPE, str, bytes)) else value
+
+
+def explain(connection, statement, params, analyze=False):
+    """
+    Run the EXPLAIN of the database on a statement.
+    Args:
+        connection (sqlalchemy.engine.base.Connection): The connection.
+        statement (sqlalchemy.sql.expression.Executable): The explained statement.
+        params (dict): The values of the bind parameters of the statement.
+        analyze (bool): Execute the statement to get the actual numbers of rows.
+
+    Returns:
+        (unicode, object, list of dict): The explained SQL, the plan as returned by the database and its steps.
+    """
+    dialect = connection.dialect
+    prefix = get_explain_prefix(dialect, analyze)
+    result = connection.execute(Explain(statement, prefix), **params)
+    # The SQL sent to the database, with the expanded parameters.
+    sql = result.context.statement[len(prefix) + 1:]
+    rows = [tuple(row) for row in result]
+
+    if dialect.name == u"sqlite":
+        return sql, rows, parse_sqlite_plan(rows)
+    elif dialect.name == u"postgresql":
+        plan = _load_json(rows[0][0])
+        return sql, plan, parse_postgresql_plan(plan)
+    elif analyze:
+        plan = u"\n".join(row[0] for row in rows)
+        return sql, plan, parse_mysql_tree(plan)
+
+    plan = _load_json(rows[0][0])
+    return sql, plan, parse_mysql_plan(plan)
+
+
+def is_indexed(column):
+    """
+    Tell if a column is the first column of the primary key, of a unique constraint or of an index of its table.
+    Args:
+        column (sqlalchemy.schema.Column): The column, of a table or of an alias.
+
+    Returns:
+        (bool): True if an index starts with the column.
+    """
+    table = getattr(column.table, u"element", column.table)
+    keys = [table.primary_key.columns] + [
+        constraint.columns for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+    ] + [index.columns for index in table.indexes]
+
+    for columns in keys:
+        columns = list(columns)
+        if columns and columns[0].name == column.name:
+            return True
+    return False
+
+
+def get_missing_indexes(joins):
+    """
+    Find the columns of the join conditions of a lookup that no index starts with.
+    Args:
+        joins (list of tuple): The (foreign table, local field, foreign field) joins of the plan.
+
+    Returns:
+        (list of dict): The table, column and alias ("as") of each column without index.
+    """
+    missing_indexes = []
+    seen = set()
+    for _, local_field, foreign_field in joins:
+        for column in (local_field, foreign_field):
+            table = getattr(column.table, u"element", column.table)
+            if (table.name, column.name) in seen or is_indexed(column):
+                continue
+            seen.add((table.name, column.name))
+            missing_indexes.append({u"table": table.name, u"column": column.name, u"as": column.table.name})
+
+    return missing_indexes
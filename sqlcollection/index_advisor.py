@@ -0,0 +1,165 @@
+# coding utf-8
+"""
+Index advisor: suggests the indexes missing behind the lookups, the filters and the sorts of the collections.
+"""
+
+import threading
+from collections import Counter
+from sqlalchemy.schema import Column, Index, Table, MetaData, UniqueConstraint, CreateIndex
+from .explain import is_indexed
+
+# Weight of each use of a column in the score of a suggestion. Joins and filters select the rows to read,
+# sorts only save the sort of rows already read.
+FILTER_WEIGHT = 1.0
+JOIN_WEIGHT = 1.0
+SORT_WEIGHT = 0.5
+
+FILTER = u"filter"
+SORT = u"sort"
+JOIN = u"join"
+
+
+def get_column_key(column):
+    """
+    Identify a column by the names of its table and of itself, the table of an alias being the aliased table.
+    Args:
+        column (sqlalchemy.schema.Column): The column.
+
+    Returns:
+        (tuple): The (table name, column name) pair.
+    """
+    return getattr(column.table, u"element", column.table).name, column.name
+
+
+class FieldUsage(object):
+    """
+    Thread safe histogram of the columns the operations filter, sort and join on.
+    """
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, use, keys):
+        """
+        Count a use of columns.
+        Args:
+            use (unicode): How the columns are used: "filter", "sort" or "join".
+            keys (iterable of tuple): The (table name, column name) of the columns.
+        """
+        with self._lock:
+            for table_name, column_name in keys:
+                self._counts[(table_name, column_name, use)] += 1
+
+    def get(self, table_name, column_name, use):
+        """
+        Get the number of uses of a column.
+        Args:
+            table_name (unicode): The name of the table.
+            column_name (unicode): The name of the column.
+            use (unicode): "filter", "sort" or "join".
+
+        Returns:
+            (int): The number of uses recorded.
+        """
+        return self._counts.get((table_name, column_name, use), 0)
+
+    def clear(self):
+        """
+        Forget the uses recorded so far.
+        """
+        with self._lock:
+            self._counts.clear()
+
+
+def get_indexes(table):
+    """
+    Describe the reflected indexes of a table, its primary key and unique constraints included.
+    Args:
+        table (sqlalchemy.schema.Table): The table.
+
+    Returns:
+        (list of dict): The name, columns and unicity of each index.
+    """
+    indexes = []
+    if len(table.primary_key.columns):
+        indexes.append({
+            u"name": table.primary_key.name,
+            u"columns": [column.name for column in table.primary_key.columns],
+            u"unique": True,
+            u"primary_key": True
+        })
+
+    constraints = [constraint for constraint in table.constraints if isinstance(constraint, UniqueConstraint)]
+    for index in sorted(constraints + list(table.indexes), key=lambda index: index.name or u""):
+        indexes.append({
+            u"name": index.name,
+            u"columns": [column.name for column in index.columns],
+            u"unique": isinstance(index, UniqueConstraint) or bool(index.unique),
+            u"primary_key": False
+        })
+
+    return indexes
+
+
+def get_index_ddl(table, column_name, dialect):
+    """
+    Build the CREATE INDEX statement of a single column index.
+    Args:
+        table (sqlalchemy.schema.Table): The table.
+        column_name (unicode): The name of the column.
+        dialect (sqlalchemy.engine.interfaces.Dialect): The dialect of the database.
+
+    Returns:
+        (unicode): The statement.
+    """
+    # Built on a copy of the column so the reflected table doesn't get the index.
+    column = table.columns[column_name]
+    copy = Table(table.name, MetaData(), Column(column.name, column.type), schema=table.schema)
+    index = Index(u"ix_{}_{}".format(table.name, column.name), copy.columns[column.name])
+    return u"{};".format(CreateIndex(index).compile(dialect=dialect))
+
+
+def suggest_indexes(tables, usage, dialect=None):
+    """
+    Suggest single column indexes for the columns no index starts with: the foreign keys the lookups join on,
+    and the columns the operations recorded in the histogram filter or sort on.
+    Suggestions are ranked by score: the recorded uses, weighted by FILTER_WEIGHT, SORT_WEIGHT and JOIN_WEIGHT.
+    Args:
+        tables (list of sqlalchemy.schema.Table): The tables to inspect.
+        usage (FieldUsage): The recorded uses of the columns.
+        dialect (sqlalchemy.engine.interfaces.Dialect): Add the CREATE INDEX statement of this dialect
+            to the suggestions, if given.
+
+    Returns:
+        (list of dict): The suggestions, best first.
+    """
+    suggestions = []
+    for table in tables:
+        foreign_keys = set(foreign_key.parent.name for foreign_key in table.foreign_keys)
+        for column in table.columns:
+            if is_indexed(column):
+                continue
+
+            filters = usage.get(table.name, column.name, FILTER)
+            sorts = usage.get(table.name, column.name, SORT)
+            joins = usage.get(table.name, column.name, JOIN)
+            if not (filters or sorts or joins or column.name in foreign_keys):
+                continue
+
+            suggestion = {
+                u"table": table.name,
+                u"columns": [column.name],
+                u"score": filters * FILTER_WEIGHT + sorts * SORT_WEIGHT + joins * JOIN_WEIGHT,
+                u"filters": filters,
+                u"sorts": sorts,
+                u"joins": joins,
+                u"foreign_key": column.name in foreign_keys
+            }
+            if dialect is not None:
+                suggestion[u"ddl"] = get_index_ddl(table, column.name, dialect)
+            suggestions.append(suggestion)
+
+    suggestions.sort(key=lambda suggestion: (
+        -suggestion[u"score"], not suggestion[u"foreign_key"], suggestion[u"table"], suggestion[u"columns"]
+    ))
+    return suggestions
@@ -0,0 +1,154 @@
+# coding utf-8
+"""
+Contains Loader Class.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class PendingDocument(object):
+    """
+    A document requested from a loader, fetched with the other pending keys when its result is first needed.
+    """
+    __slots__ = (u"_loader", u"key")
+
+    def __init__(self, loader, key):
+        """
+        Construct the object.
+        Args:
+            loader (Loader): The loader the document was requested from.
+            key (object): The value of the primary key.
+        """
+        self._loader = loader
+        self.key = key
+
+    def result(self):
+        """
+        Get the document, fetching all the keys pending in the loader if it isn't loaded yet.
+        Returns:
+            (dict): The document, None if it doesn't exist.
+        """
+        return self._loader.get(self.key)
+
+
+class Loader(object):
+    """
+    Request scoped loader of the documents of a collection by primary key, to avoid the N+1 queries of resolvers.
+    The keys requested with load() are queued, then fetched together in a single select with IN (...)
+    (get_many) when one of their results is needed or on dispatch(). Loaded documents are kept in an identity map:
+    a key is fetched once per loader, and all the callers get the same document.
+    Create one loader per request, the documents aren't refreshed after a write.
+    """
+    def __init__(self, collection, projection=None, lookup=None, auto_lookup=0, batch_size=None):
+        """
+        Construct the object.
+        Args:
+            collection (Collection): The collection the documents are fetched from.
+            projection (dict): The projection parameter determines which columns are returned.
+            lookup (list of dict): The lookup to apply during the queries.
+            auto_lookup (int): How many levels of lookup will be generated automatically.
+            batch_size (int): The maximum number of keys fetched in one select, all the pending keys if None.
+        """
+        self._collection = collection
+        self._projection = projection
+        self._lookup = lookup
+        self._auto_lookup = auto_lookup
+        self._batch_size = batch_size
+        self._documents = {}
+        self._pending = OrderedDict()
+        self._lock = threading.RLock()
+
+    def load(self, key):
+        """
+        Queue a key, its document is fetched with the other pending keys.
+        Args:
+            key (object): The value of the primary key.
+
+        Returns:
+            (PendingDocument): The handle giving the document.
+        """
+        with self._lock:
+            if key not in self._documents:
+                self._pending[key] = True
+        return PendingDocument(self, key)
+
+    def load_many(self, keys):
+        """
+        Queue keys, see load().
+        Args:
+            keys (list): The values of the primary key.
+
+        Returns:
+            (list of PendingDocument): The handle of each key.
+        """
+        return [self.load(key) for key in keys]
+
+    def get(self, key):
+        """
+        Get a document, from the identity map or with the pending keys.
+        Args:
+            key (object): The value of the primary key.
+
+        Returns:
+            (dict): The document, None if it doesn't exist.
+        """
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """
+        Get documents, from the identity map or with the pending keys.
+        Args:
+            keys (list): The values of the primary key.
+
+        Returns:
+            (list of dict): The document of each key, in the same order, None for the keys that don't exist.
+        """
+        with self._lock:
+            for key in keys:
+                if key not in self._documents:
+                    self._pending[key] = True
+            self.dispatch()
+            return [self._documents[key] for key in keys]
+
+    def dispatch(self):
+        """
+        Fetch the documents of the pending keys, by batches of batch_size keys.
+        """
+        with self._lock:
+            keys = [key for key in self._pending if key not in self._documents]
+            self._pending.clear()
+
+            batch_size = self._batch_size or len(keys)
+            for index in range(0, len(keys), batch_size or 1):
+                batch = keys[index:index + batch_size]
+                try:
+                    documents = self._collection.get_many(batch, self._projection, self._lookup, self._auto_lookup)
+                except Exception:
+                    # The keys not fetched stay pending.
+                    self._pending.update((key, True) for key in keys[index:])
+                    raise
+                self._documents.update(zip(batch, documents))
+
+    def prime(self, key, document):
+        """
+        Put a document already fetched in the identity map.
+        Args:
+            key (object): The value of the primary key.
+            document (dict): The document.
+        """
+        with self._lock:
+            self._documents[key] = document
+            self._pending.pop(key, None)
+
+    def clear(self, key=None):
+        """
+        Forget a document of the identity map, or all of them, so it is fetched again.
+        Args:
+            key (object): The value of the primary key, None to forget all the documents.
+        """
+        with self._lock:
+            if key is None:
+                self._documents.clear()
+            else:
+                self._documents.pop(key, None)
@@ -0,0 +1,75 @@
+# coding utf-8
+"""
+Contains LRUCache Class.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded mapping dropping the least recently used entries first.
+    """
+    def __init__(self, max_size=128):
+        """
+        Construct the object.
+        Args:
+            max_size (int): The maximum number of entries kept.
+        """
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Get an entry, marking it as the most recently used.
+        Args:
+            key (hashable): The key of the entry.
+            default (object): The value returned when the key is missing.
+
+        Returns:
+            (object): The cached value.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Add or replace an entry, dropping the least recently used one if the cache is full.
+        Args:
+            key (hashable): The key of the entry.
+            value (object): The value to cache.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove an entry if present.
+        Args:
+            key (hashable): The key of the entry.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all the entries.
+        """
+        with self._lock:
+            self._entries.clear()
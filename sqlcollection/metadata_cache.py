@@ -0,0 +1,79 @@
+# coding utf-8
+"""
+Contains MetadataCache Class.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import sqlalchemy
+
+
+class MetadataCache(object):
+    """
+    Stores reflected SQLAlchemy metadata in a file, to avoid reflecting the schema on each cold start.
+    """
+    VERSION = 1
+
+    def __init__(self, directory, url, schema=None, ttl=None):
+        """
+        Construct the object.
+        Args:
+            directory (unicode): The directory where the cache files are written.
+            url (unicode): The DB connection URL, part of the cache key.
+            schema (unicode): The selected schema, part of the cache key.
+            ttl (int): Number of seconds a cache file stays valid (never expires if None).
+        """
+        key = hashlib.sha1(u"{}|{}".format(url, schema or u"").encode(u"utf-8")).hexdigest()
+        self._directory = directory
+        self._path = os.path.join(directory, u"sqlcollection-{}.metadata".format(key))
+        self._ttl = ttl
+
+    def load(self):
+        """
+        Load the metadata from the cache file.
+        Returns:
+            (sqlalchemy.MetaData): The cached metadata, None if missing, expired or written by another version.
+        """
+        try:
+            with open(self._path, u"rb") as cache_file:
+                content = pickle.load(cache_file)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if content.get(u"version") != self.VERSION or content.get(u"sqlalchemy") != sqlalchemy.__version__:
+            return None
+
+        if self._ttl is not None and time.time() - content[u"created_at"] > self._ttl:
+            return None
+
+        return content[u"metadata"]
+
+    def save(self, metadata):
+        """
+        Write the metadata in the cache file.
+        The file is written next to its destination then renamed, so concurrent workers never read a partial file.
+        Args:
+            metadata (sqlalchemy.MetaData): The metadata to store.
+        """
+        content = {
+            u"version": self.VERSION,
+            u"sqlalchemy": sqlalchemy.__version__,
+            u"created_at": time.time(),
+            u"metadata": metadata
+        }
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._directory)
+        with os.fdopen(descriptor, u"wb") as cache_file:
+            pickle.dump(content, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_path, self._path)
+
+    def clear(self):
+        """
+        Remove the cache file.
+        """
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
@@ -0,0 +1,45 @@
+# coding utf-8
+"""
+Write operations for Collection.bulk_write().
+"""
+
+
+class InsertOne(object):
+    """
+    Insert a document.
+    """
+    def __init__(self, document):
+        """
+        Construct the object.
+        Args:
+            document (dict): The document to insert.
+        """
+        self.document = document
+
+
+class UpdateMany(object):
+    """
+    Update the documents matching a filter.
+    """
+    def __init__(self, filter, update):
+        """
+        Construct the object.
+        Args:
+            filter (dict): The mongo like query selecting the documents.
+            update (dict): The modifications to apply ($set).
+        """
+        self.filter = filter
+        self.update = update
+
+
+class DeleteMany(object):
+    """
+    Delete the documents matching a filter.
+    """
+    def __init__(self, filter):
+        """
+        Construct the object.
+        Args:
+            filter (dict): The mongo like query selecting the documents.
+        """
+        self.filter = filter
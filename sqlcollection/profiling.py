@@ -0,0 +1,382 @@
+# coding utf-8
+"""
+Instrumentation of the collection operations: per-phase timings and slow query log.
+"""
+
+import time
+import weakref
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+
+# Use time.perf_counter when available (python 3).
+clock = getattr(time, u"perf_counter", time.time)
+
+
+class _NoProfiling(object):
+    """
+    Context manager doing nothing, used when the operations aren't profiled.
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_PROFILING = _NoProfiling()
+
+
+class OperationStats(object):
+    """
+    The statistics of an operation made on a collection.
+    Phases:
+        - plan: resolving the lookup into joins and fields (get_plan).
+        - parse: converting the filter into a where clause (_get_where).
+        - compile: compiling the statements into SQL.
+        - execute: executing the statements in the database.
+        - decode: fetching the rows and building the documents.
+    """
+    def __init__(self, profiler, collection, operation):
+        """
+        Construct the object.
+        Args:
+            profiler (Profiler): The profiler recording the operation.
+            collection (unicode): The name of the collection.
+            operation (unicode): The name of the operation (find, count, update_many, ...).
+        """
+        self.profiler = profiler
+        self.collection = collection
+        self.operation = operation
+        self.phases = OrderedDict()
+        self.statements = []
+        self.rows = 0
+        self.duration = None
+        self.error = None
+        self._started_at = clock()
+        self._execute_started_at = None
+        self._cursor_started_at = None
+
+    def add(self, phase, duration):
+        """
+        Add time spent in a phase.
+        Args:
+            phase (unicode): The name of the phase.
+            duration (float): The number of seconds spent.
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def to_dict(self):
+        """
+        Serialize the statistics.
+        Returns:
+            (dict): The statistics.
+        """
+        return OrderedDict([
+            (u"collection", self.collection),
+            (u"operation", self.operation),
+            (u"duration", self.duration),
+            (u"phases", dict(self.phases)),
+            (u"rows", self.rows),
+            (u"statements", list(self.statements)),
+            (u"error", None if self.error is None else repr(self.error))
+        ])
+
+
+class _Phase(object):
+    """
+    Context manager adding the time spent in its block to a phase of the current operation.
+    """
+    __slots__ = (u"_stats", u"_phase", u"_started_at")
+
+    def __init__(self, stats, phase):
+        self._stats = stats
+        self._phase = phase
+        self._started_at = None
+
+    def __enter__(self):
+        self._started_at = clock()
+        return self._stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.add(self._phase, clock() - self._started_at)
+        return False
+
+
+class _Activation(object):
+    """
+    Context manager making an operation the current one of the thread, so the statements executed
+    in its block are recorded in the operation.
+    """
+    __slots__ = (u"_profiler", u"_stats", u"_previous")
+
+    def __init__(self, profiler, stats):
+        self._profiler = profiler
+        self._stats = stats
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = self._profiler.get_current()
+        self._profiler._local.stats = self._stats
+        return self._stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler._local.stats = self._previous
+        return False
+
+
+class Profiler(object):
+    """
+    Records the statistics of the operations made on the collections, calls the listeners
+    when an operation ends and logs the slow ones.
+    Given to a Client, all its databases are profiled. Without profiler, the operations pay
+    a single attribute check.
+    """
+    def __init__(self, slow_query_threshold=None, logger=None, listeners=None):
+        """
+        Construct the object.
+        Args:
+            slow_query_threshold (float): Number of seconds above which an operation is logged as slow,
+                None to disable the slow query log.
+            logger (logging.Logger): The logger of the slow queries, "sqlcollection.slow_queries" by default.
+            listeners (list of function): Called with the OperationStats of each operation when it ends.
+        """
+        self._slow_query_threshold = slow_query_threshold
+        self._logger = logger or logging.getLogger(u"sqlcollection.slow_queries")
+        self._listeners = list(listeners or [])
+        self._local = threading.local()
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        Register a function called with the OperationStats of each operation when it ends.
+        Args:
+            listener (function): The function.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Unregister a listener.
+        Args:
+            listener (function): The function given to add_listener.
+        """
+        self._listeners.remove(listener)
+
+    def instrument(self, engine):
+        """
+        Listen to the executions of an engine, to time the compilation and the execution of the statements.
+        Engines are instrumented once.
+        Args:
+            engine (sqlalchemy.engine.Engine): The engine.
+        """
+        if engine in self._engines:
+            return
+
+        with self._lock:
+            if engine not in self._engines:
+                event.listen(engine, u"before_execute", self._before_execute)
+                event.listen(engine, u"before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, u"after_cursor_execute", self._after_cursor_execute)
+                self._engines.add(engine)
+
+    def get_current(self):
+        """
+        Get the operation running in the current thread.
+        Returns:
+            (OperationStats): The statistics of the operation, None if there is none.
+        """
+        return getattr(self._local, u"stats", None)
+
+    def start(self, collection, operation):
+        """
+        Start recording an operation.
+        Args:
+            collection (unicode): The name of the collection.
+            operation (unicode): The name of the operation.
+
+        Returns:
+            (OperationStats): The statistics of the operation.
+        """
+        return OperationStats(self, collection, operation)
+
+    def activate(self, stats):
+        """
+        Make an operation the current one of the thread in a with block.
+        Args:
+            stats (OperationStats): The statistics of the operation.
+
+        Returns:
+            (context manager): The activation.
+        """
+        return _Activation(self, stats)
+
+    def phase(self, phase):
+        """
+        Time a phase of the current operation in a with block.
+        Args:
+            phase (unicode): The name of the phase.
+
+        Returns:
+            (context manager): The timer, doing nothing if no operation is running.
+        """
+        stats = self.get_current()
+        return NO_PROFILING if stats is None else _Phase(stats, phase)
+
+    def finish(self, stats, error=None):
+        """
+        End an operation: call the listeners and log it if it is slow.
+        Args:
+            stats (OperationStats): The statistics of the operation.
+            error (Exception): The error that ended the operation, if any.
+        """
+        if stats.duration is not None:
+            return
+
+        stats.duration = clock() - stats._started_at
+        stats.error = error
+
+        for listener in self._listeners:
+            listener(stats)
+
+        if self._slow_query_threshold is not None and stats.duration >= self._slow_query_threshold:
+            self._logger.warning(
+                u"Slow %s on %s: %.3fs (%s), %d rows. %s",
+                stats.operation,
+                stats.collection,
+                stats.duration,
+                u", ".join(u"{} {:.3f}s".format(phase, duration) for phase, duration in stats.phases.items()),
+                stats.rows,
+                u"; ".join(stats.statements)
+            )
+
+    def operation(self, collection, operation):
+        """
+        Record an operation in a with block. An operation started in the block of another one
+        is part of it.
+        Args:
+            collection (unicode): The name of the collection.
+            operation (unicode): The name of the operation.
+
+        Returns:
+            (context manager): Gives the statistics of the operation, None if it joined another one.
+        """
+        if self.get_current() is not None:
+            return NO_PROFILING
+        return _Operation(self.start(collection, operation))
+
+    def _before_execute(self, conn, *args):
+        stats = self.get_current()
+        if stats is not None:
+            stats._execute_started_at = clock()
+
+    def _before_cursor_execute(self, conn, cursor, statement, *args):
+        stats = self.get_current()
+        if stats is not None:
+            now = clock()
+            if stats._execute_started_at is not None:
+                stats.add(u"compile", now - stats._execute_started_at)
+                stats._execute_started_at = None
+            stats._cursor_started_at = now
+            stats.statements.append(statement)
+
+    def _after_cursor_execute(self, conn, *args):
+        stats = self.get_current()
+        if stats is not None and stats._cursor_started_at is not None:
+            stats.add(u"execute", clock() - stats._cursor_started_at)
+            stats._cursor_started_at = None
+
+
+class _Operation(object):
+    """
+    Context manager making an operation the current one in its block, then finishing it.
+    """
+    __slots__ = (u"_stats", u"_activation")
+
+    def __init__(self, stats):
+        self._stats = stats
+        self._activation = stats.profiler.activate(stats)
+
+    def __enter__(self):
+        return self._activation.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._activation.__exit__(exc_type, exc_value, traceback)
+        self._stats.profiler.finish(self._stats, exc_value)
+        return False
+
+
+def activate(stats):
+    """
+    Make an operation the current one of the thread in a with block.
+    Args:
+        stats (OperationStats): The statistics of the operation, None if it isn't profiled.
+
+    Returns:
+        (context manager): The activation.
+    """
+    return NO_PROFILING if stats is None else stats.profiler.activate(stats)
+
+
+def record(stats):
+    """
+    Record an operation started with Profiler.start in a with block, finishing it at the end.
+    Args:
+        stats (OperationStats): The statistics of the operation, None if it isn't profiled.
+
+    Returns:
+        (context manager): Gives the statistics.
+    """
+    return NO_PROFILING if stats is None else _Operation(stats)
+
+
+def profiled(operation):
+    """
+    Decorate a method of Collection to record it as an operation, when the database has a profiler.
+    Args:
+        operation (unicode): The name of the operation.
+
+    Returns:
+        (function): The decorator.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._db_ref._profiler
+            if profiler is None:
+                return method(self, *args, **kwargs)
+
+            with profiler.operation(self._table.name, operation):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_phase(phase):
+    """
+    Decorate a method of Collection to time it as a phase of the current operation,
+    when the database has a profiler.
+    Args:
+        phase (unicode): The name of the phase.
+
+    Returns:
+        (function): The decorator.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._db_ref._profiler
+            if profiler is None:
+                return method(self, *args, **kwargs)
+
+            with profiler.phase(phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,51 @@
+# coding utf-8
+"""
+Contains QueryPlan Class.
+"""
+from .lru_cache import LRUCache
+from .decoder import RowDecoder
+from .index_advisor import get_column_key
+
+
+class QueryPlan(object):
+    """
+    The resolved select dependencies of a collection for a lookup and projection.
+    Shared between queries, it must never be mutated.
+    """
+    # Number of where clause templates kept per plan.
+    TEMPLATE_CACHE_SIZE = 64
+
+    def __init__(self, lookup, fields_mapping, joins, labels, select_from):
+        """
+        Construct the object.
+        Args:
+            lookup (list of dict): The lookup the plan was built with.
+            fields_mapping (dict): Mapping for available fields (unicode: column).
+            joins (list of tuple): The (foreign table, local field, foreign field) joins.
+            labels (list of sqlalchemy.sql.elements.Label): The selected labels, after projection.
+            select_from (sqlalchemy.sql.selectable.Join | sqlalchemy.sql.schema.Table): What to select from.
+        """
+        self.lookup = lookup
+        self.fields_mapping = fields_mapping
+        self.joins = joins
+        self.labels = labels
+        self.select_from = select_from
+        # The (where clause with bind parameters, filtered columns) pairs, by query shape.
+        self.templates = LRUCache(self.TEMPLATE_CACHE_SIZE)
+        # The columns of the join conditions, recorded for the index advisor.
+        self.join_columns = [
+            get_column_key(column) for _, local_field, foreign_field in joins for column in (local_field, foreign_field)
+        ]
+        # The selects of the primary key fast paths (get, get_many), by name.
+        self.statements = {}
+        self._decoder = None
+
+    def get_decoder(self):
+        """
+        Get the decoder of the rows selecting the labels of the plan, built once.
+        Returns:
+            (RowDecoder): The decoder.
+        """
+        if self._decoder is None:
+            self._decoder = RowDecoder(self.labels)
+        return self._decoder
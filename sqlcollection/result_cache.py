@@ -0,0 +1,176 @@
+# coding utf-8
+"""
+Cache of query results, invalidated by the writes made through the library.
+"""
+
+import time
+import uuid
+import hashlib
+from .lru_cache import LRUCache
+from .compatibility import UNICODE_TYPE
+
+
+class CacheBackend(object):
+    """
+    Interface of the storages used by ResultCache.
+    Values must be stored and returned as they are (or as equal copies).
+    """
+    def get(self, key):
+        """
+        Get a value.
+        Args:
+            key (unicode): The key of the value.
+
+        Returns:
+            (object): The stored value, None if missing or expired.
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value.
+        Args:
+            key (unicode): The key of the value.
+            value (object): The value to store.
+            ttl (int): Number of seconds the value stays valid (forever if None).
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        """
+        Remove a value if present.
+        Args:
+            key (unicode): The key of the value.
+        """
+        raise NotImplementedError()
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process, size bounded backend, dropping the least recently used values first.
+    """
+    def __init__(self, max_size=1024):
+        """
+        Construct the object.
+        Args:
+            max_size (int): The maximum number of values kept.
+        """
+        self._entries = LRUCache(max_size)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            self._entries.delete(key)
+            return None
+
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = None if ttl is None else time.time() + ttl
+        self._entries.set(key, (expires_at, value))
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+
+class ResultCache(object):
+    """
+    Caches the rows and counts returned by cursors, keyed by the SQL of the statement and its parameters.
+    Each table has a generation token that is part of the keys of the results reading it:
+    a write on a table renews its token, so every cached result reading the table (joined
+    through a lookup or not) becomes unreachable.
+    """
+    def __init__(self, backend=None, ttl=None, max_statements=1024):
+        """
+        Construct the object.
+        Args:
+            backend (CacheBackend): The storage, an in-process MemoryCacheBackend by default.
+            ttl (int): Number of seconds a result stays valid (forever if None).
+            max_statements (int): Number of statements the SQL of which is kept, by structure.
+        """
+        self._backend = backend if backend is not None else MemoryCacheBackend()
+        self._ttl = ttl
+        self._statements = LRUCache(max_statements)
+
+    def _get_generation(self, table_name):
+        """
+        Get the generation token of a table, creating it if missing.
+        Args:
+            table_name (unicode): The name of the table.
+
+        Returns:
+            (unicode): The token.
+        """
+        key = u"sqlcollection:table:{}".format(table_name)
+        generation = self._backend.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self._backend.set(key, generation)
+        return generation
+
+    def make_key(self, request, params, dialect, table_names):
+        """
+        Compute the key of a result.
+        Args:
+            request (sqlalchemy.sql.expression.Executable): The statement.
+            params (dict): The parameters bound at execution.
+            dialect (sqlalchemy.engine.interfaces.Dialect): The dialect to compile the statement with.
+            table_names (list of unicode): The tables the statement reads.
+
+        Returns:
+            (unicode): The key.
+        """
+        # The statements are identified by their SQLAlchemy cache key, so a statement with the same
+        # structure as a previous one isn't compiled again.
+        cache_key = request._generate_cache_key()
+        if cache_key is None:
+            compiled = request.compile(dialect=dialect)
+            values = dict(compiled.params)
+            values.update(params)
+            sql, values = UNICODE_TYPE(compiled), sorted(values.items())
+        else:
+            sql = self._statements.get((dialect.name, cache_key.key))
+            if sql is None:
+                sql = UNICODE_TYPE(request.compile(dialect=dialect))
+                self._statements.set((dialect.name, cache_key.key), sql)
+            # The values of the anonymous parameters, by position, then the parameters bound at execution.
+            values = [bind.effective_value for bind in cache_key.bindparams if bind.key not in params]
+            values.append(sorted(params.items()))
+        generations = [self._get_generation(table_name) for table_name in sorted(set(table_names))]
+
+        digest = hashlib.sha1()
+        digest.update(u"{}|{}|{}".format(sql, repr(values), u",".join(generations)).encode(u"utf-8"))
+        return u"sqlcollection:result:{}".format(digest.hexdigest())
+
+    def get(self, key):
+        """
+        Get a cached result.
+        Args:
+            key (unicode): The key from make_key().
+
+        Returns:
+            (object): The result, None if missing.
+        """
+        return self._backend.get(key)
+
+    def set(self, key, value):
+        """
+        Cache a result.
+        Args:
+            key (unicode): The key from make_key().
+            value (object): The result.
+        """
+        self._backend.set(key, value, self._ttl)
+
+    def invalidate(self, *table_names):
+        """
+        Invalidate the cached results reading the tables.
+        Args:
+            *table_names (unicode): The names of the modified tables.
+        """
+        for table_name in table_names:
+            self._backend.set(u"sqlcollection:table:{}".format(table_name), uuid.uuid4().hex)
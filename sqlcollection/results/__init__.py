@@ -1,3 +1,5 @@
 from .update_result import UpdateResult
 from .delete_many_result import DeleteResult
-from .insert_one_result import InsertResultOne
\ No newline at end of file
+from .insert_one_result import InsertResultOne
+from .insert_many_result import InsertManyResult
+from .bulk_write_result import BulkWriteResult
@@ -0,0 +1,23 @@
+# coding utf-8
+"""
+Contains BulkWriteResult Class.
+"""
+
+
+class BulkWriteResult(object):
+    """
+    The return type for bulk_write().
+    """
+    def __init__(self, inserted_count, matched_count, deleted_count, inserted_ids):
+        """
+        The constructor.
+        Args:
+            inserted_count (int): The number of inserted documents.
+            matched_count (int): The number of documents matched by the updates.
+            deleted_count (int): The number of deleted documents.
+            inserted_ids (list): The inserted primary keys, None when the database can't return them.
+        """
+        self.inserted_count = inserted_count
+        self.matched_count = matched_count
+        self.deleted_count = deleted_count
+        self.inserted_ids = inserted_ids
@@ -0,0 +1,17 @@
+# coding utf-8
+"""
+Contains InsertManyResult Class.
+"""
+
+
+class InsertManyResult(object):
+    """
+    The return type for insert_many().
+    """
+    def __init__(self, inserted_ids):
+        """
+        The constructor.
+        Args:
+            inserted_ids (list): The inserted primary keys, None when the database can't return them.
+        """
+        self.inserted_ids = inserted_ids
@@ -8,5 +8,12 @@ class UpdateResult(object):
     """
     The return type for update method.
     """
-    def __init__(self, matched_count):
+    def __init__(self, matched_count, upserted_id=None):
+        """
+        The constructor.
+        Args:
+            matched_count (int): The number of rows matching the filter.
+            upserted_id (int): The primary key of the row inserted by an upsert, None if there was none.
+        """
         self.matched_count = matched_count
+        self.upserted_id = upserted_id
@@ -0,0 +1,107 @@
+# coding utf-8
+"""
+Aggregation pipeline tests
+"""
+from pytest import raises
+from .collection_test import hours_count_sqlite
+
+HOURS_LOOKUP = [{
+    u"$lookup": {u"from": u"project", u"localField": u"project", u"foreignField": u"id", u"as": u"project"}
+}, {
+    u"$lookup": {
+        u"from": u"client", u"localField": u"project.client", u"foreignField": u"id", u"as": u"project.client"
+    }
+}]
+
+
+def test_group_by_client(hours_count_sqlite):
+    cursor = hours_count_sqlite.hour.aggregate(HOURS_LOOKUP + [
+        {u"$match": {u"minutes": {u"$gt": 10}}},
+        {u"$group": {
+            u"_id": u"$project.client.name",
+            u"total": {u"$sum": u"$minutes"},
+            u"hours": {u"$sum": 1},
+            u"longest": {u"$max": u"$minutes"}
+        }},
+        {u"$sort": {u"total": -1}}
+    ])
+
+    assert list(cursor) == [
+        {u"_id": u"Hello inc", u"total": 390, u"hours": 6, u"longest": 100},
+        {u"_id": u"World inc", u"total": 150, u"hours": 3, u"longest": 80}
+    ]
+    assert cursor.count() == 2
+
+
+def test_group_with_compound_id_and_having(hours_count_sqlite):
+    cursor = hours_count_sqlite.hour.aggregate([
+        {u"$group": {
+            u"_id": {u"client": u"$project.client.id", u"project": u"$project.name"},
+            u"average": {u"$avg": u"$minutes"}
+        }},
+        {u"$match": {u"average": {u"$gte": 50}}},
+        {u"$sort": {u"_id.project": 1}},
+        {u"$limit": 5}
+    ], auto_lookup=2)
+
+    assert list(cursor) == [
+        {u"_id": {u"client": 2, u"project": u"Backend"}, u"average": 50.0},
+        {u"_id": {u"client": 1, u"project": u"Mobile app"}, u"average": 55.0},
+        {u"_id": {u"client": 1, u"project": u"Website"}, u"average": 60.0}
+    ]
+
+
+def test_project_and_skip(hours_count_sqlite):
+    documents = list(hours_count_sqlite.hour.aggregate([
+        {u"$match": {u"project": 3}},
+        {u"$project": {u"id": 1, u"duration": u"$minutes"}},
+        {u"$sort": {u"id": 1}},
+        {u"$skip": 1}
+    ]))
+    assert documents == [{u"id": 5, u"duration": 50}, {u"id": 8, u"duration": 80}]
+
+
+def test_stages_use_the_fields_of_their_stage(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    documents = list(hour.aggregate([
+        {u"$sort": {u"minutes": -1}},
+        {u"$project": {u"m": u"$minutes"}},
+        {u"$limit": 3}
+    ]))
+    assert documents == [{u"m": 100}, {u"m": 90}, {u"m": 80}]
+
+    documents = list(hour.aggregate([
+        {u"$sort": {u"id": -1}},
+        {u"$project": {u"id": u"$minutes", u"project": 1}},
+        {u"$limit": 2}
+    ]))
+    assert documents == [{u"id": 100, u"project": 2}, {u"id": 90, u"project": 1}]
+
+    documents = list(hour.aggregate([
+        {u"$group": {u"_id": {u"client": u"$project.client.id", u"project": u"$project.name"}}},
+        {u"$sort": {u"_id": -1}}
+    ], auto_lookup=2))
+    assert [document[u"_id"][u"project"] for document in documents] == [u"Backend", u"Website", u"Mobile app"]
+
+    with raises(ValueError):
+        hour.aggregate([{u"$project": {u"id": 1}}, {u"$match": {u"minutes": 10}}])
+    with raises(ValueError):
+        hour.aggregate([{u"$group": {u"_id": u"$project", u"total": {u"$sum": u"$minutes"}}}, {u"$match": {u"nope": 1}}])
+    with raises(ValueError):
+        hour.aggregate([{u"$project": {u"id": 1}}, {u"$sort": {u"minutes": 1}}])
+
+
+def test_group_without_id(hours_count_sqlite):
+    cursor = hours_count_sqlite.hour.aggregate([{u"$group": {u"_id": None, u"total": {u"$sum": u"$minutes"}}}])
+    assert list(cursor) == [{u"total": 550}]
+    assert cursor.count() == 1
+
+
+def test_invalid_pipelines(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    with raises(ValueError):
+        hour.aggregate([{u"$limit": 1}, {u"$match": {u"id": 1}}])
+    with raises(ValueError):
+        hour.aggregate([{u"$unwind": u"$project"}])
+    with raises(ValueError):
+        hour.aggregate([{u"$group": {u"_id": u"$unknown"}}])
@@ -0,0 +1,130 @@
+# coding utf-8
+"""
+Asyncio classes tests
+"""
+import asyncio
+from pytest import importorskip, raises
+from .collection_test import hours_count_sqlite
+
+importorskip(u"aiosqlite")
+
+from sqlcollection.aio import AsyncClient, AsyncDB
+from sqlcollection.profiling import Profiler
+from sqlcollection.result_cache import ResultCache
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def async_db(hours_count_sqlite):
+    url = hours_count_sqlite._url.rsplit(u"/", 1)[0].replace(u"sqlite://", u"sqlite+aiosqlite://")
+    return AsyncClient(url=url).hours_count
+
+
+def test_find(hours_count_sqlite):
+    hour = async_db(hours_count_sqlite).hour
+
+    async def scenario():
+        documents = [
+            document async for document in hour.find({u"minutes": {u"$gt": 50}}, auto_lookup=2).sort(u"id", -1)
+        ]
+        count = await hour.find({u"minutes": {u"$gt": 50}}).count()
+        first = await hour.find_one({u"id": 1}, auto_lookup=1)
+        missing = await hour.find_one({u"id": 42})
+        streamed = await hour.find().batch_size(3).to_list()
+        return documents, count, first, missing, streamed
+
+    documents, count, first, missing, streamed = run(scenario())
+    assert [document[u"id"] for document in documents] == [10, 9, 8, 7, 6]
+    assert documents[0][u"project"][u"client"][u"name"] == u"Hello inc"
+    assert count == 5
+    assert first[u"project"][u"name"] == u"Mobile app"
+    assert missing is None
+    assert len(streamed) == 10
+
+
+def test_writes(hours_count_sqlite):
+    project = async_db(hours_count_sqlite).project
+
+    async def scenario():
+        inserted = await project.insert_one({u"name": u"Api", u"client": 2})
+        many = await project.insert_many([{u"id": 10, u"name": u"Docs"}, {u"id": 11, u"name": u"Ops"}])
+        updated = await project.update_many({u"client": 2}, {u"$set": {u"client": 1}})
+        deleted = await project.delete_many({u"id": {u"$gte": 10}})
+        count = await project.find({u"client": 1}).count()
+        return inserted, many, updated, deleted, count
+
+    inserted, many, updated, deleted, count = run(scenario())
+    assert inserted.inserted_id == 4
+    assert many.inserted_ids == [10, 11]
+    assert updated.matched_count == 2
+    assert deleted.deleted_count == 2
+    assert count == 4
+
+
+def test_get(hours_count_sqlite):
+    hour = async_db(hours_count_sqlite).hour
+
+    async def scenario():
+        return await hour.get(2, auto_lookup=1), await hour.get_many([3, 42], projection={u"id": 1})
+
+    document, documents = run(scenario())
+    assert document[u"project"][u"name"] == u"Backend"
+    assert documents == [{u"id": 3}, None]
+
+
+def test_loader(hours_count_sqlite):
+    hour = async_db(hours_count_sqlite).hour
+    loader = hour.loader(projection={u"id": 1})
+    calls = []
+    get_many = hour.get_many
+
+    async def spy(keys, *args):
+        calls.append(list(keys))
+        return await get_many(keys, *args)
+
+    hour.get_many = spy
+
+    async def scenario():
+        first = await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(42))
+        second = await loader.load_many([2, 3])
+        return first, second
+
+    first, second = run(scenario())
+    assert first == [{u"id": 1}, {u"id": 2}, {u"id": 1}, None]
+    assert second == [{u"id": 2}, {u"id": 3}]
+    assert calls == [[1, 2, 42], [3]]
+
+
+def test_reads_use_the_result_cache(hours_count_sqlite):
+    url = hours_count_sqlite._url.rsplit(u"/", 1)[0].replace(u"sqlite://", u"sqlite+aiosqlite://")
+    hour = AsyncClient(url=url, result_cache=ResultCache()).hours_count.hour
+
+    async def read():
+        return (
+            [document[u"minutes"] async for document in hour.find({u"id": {u"$lte": 2}}).sort(u"id")],
+            await hour.find({u"minutes": 10}).count(),
+            (await hour.get(1))[u"minutes"],
+            [document[u"minutes"] for document in await hour.get_many([1, 2])]
+        )
+
+    first = run(read())
+    assert first == ([10, 20], 1, 10, [10, 20])
+
+    # Not made through the collection, so the cached results are still served.
+    hours_count_sqlite.get_engine().execute(u"UPDATE hour SET minutes = 0 WHERE id IN (1, 2)")
+    assert run(read()) == first
+
+    async def write_and_read():
+        await hour.update_many({u"id": 3}, {u"$set": {u"minutes": 0}})
+        return await read()
+
+    assert run(write_and_read()) == ([0, 0], 0, 0, [0, 0])
+
+
+def test_profiler_is_rejected():
+    with raises(TypeError):
+        AsyncClient(url=u"sqlite+aiosqlite://", profiler=Profiler())
+    with raises(TypeError):
+        AsyncDB(u"sqlite+aiosqlite://", profiler=Profiler())
@@ -4,15 +4,18 @@ Collection class tests
 """
 import sys
 import datetime
-from pytest import fixture
-from mock import Mock
+from pytest import fixture, raises
+from mock import Mock, MagicMock
+from sqlcollection import Client, InsertOne, UpdateMany, DeleteMany
 from sqlcollection.db import DB
 from collections import OrderedDict
 from sqlcollection.collection import Collection
 from sqlalchemy.sql.expression import Label, Alias
 from sqlcollection.compatibility import UNICODE_TYPE
 from sqlalchemy.types import Integer, String, DateTime
-from sqlalchemy.schema import Column, Table, MetaData, ForeignKey
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, mysql, oracle
+from sqlalchemy.schema import Column, Table, MetaData, ForeignKey, PrimaryKeyConstraint
 
 @fixture(scope=u"function")
 def client_table():
@@ -53,6 +56,45 @@ def hours_count_db(client_table, project_table):
     return db
 
 
+@fixture(scope=u"function")
+def hours_count_sqlite(tmpdir):
+    """
+    A real SQLite database, with a client / project / hour foreign key chain.
+    """
+    client = Client(url=u"sqlite:///{}".format(tmpdir))
+    db = client.hours_count
+    engine = db.get_engine()
+    metadata = MetaData()
+    client_table = Table(u"client", metadata,
+                         Column(u"id", Integer(), primary_key=True),
+                         Column(u"name", String(50)))
+    project_table = Table(u"project", metadata,
+                          Column(u"id", Integer(), primary_key=True),
+                          Column(u"name", String(50)),
+                          Column(u"client", Integer(), ForeignKey(u"client.id")))
+    hour_table = Table(u"hour", metadata,
+                       Column(u"id", Integer(), primary_key=True),
+                       Column(u"project", Integer(), ForeignKey(u"project.id")),
+                       Column(u"minutes", Integer()),
+                       Column(u"started_at", DateTime()))
+    metadata.create_all(engine)
+    engine.execute(client_table.insert(), [
+        {u"id": 1, u"name": u"Hello inc"},
+        {u"id": 2, u"name": u"World inc"}
+    ])
+    engine.execute(project_table.insert(), [
+        {u"id": 1, u"name": u"Website", u"client": 1},
+        {u"id": 2, u"name": u"Mobile app", u"client": 1},
+        {u"id": 3, u"name": u"Backend", u"client": 2}
+    ])
+    engine.execute(hour_table.insert(), [
+        {u"id": index, u"project": index % 3 + 1, u"minutes": index * 10,
+         u"started_at": datetime.datetime(2017, 1, index)}
+        for index in range(1, 11)
+    ])
+    return db
+
+
 def add_connection_execute_mock(collection, return_value):
     connection = Mock()
     connection.execute = Mock(return_value=return_value)
@@ -322,3 +364,377 @@ def test__convert_to_python_type(stubbed_collection):
         )
     )
 
+
+
+def test_write_methods_release_connection(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.release_connection = Mock(side_effect=project.release_connection)
+
+    project.insert_one({u"name": u"Api", u"client": 2})
+    project.update_many({u"name": u"Api"}, {u"$set": {u"name": u"Rest api"}})
+    project.delete_many({u"name": u"Rest api"})
+
+    assert project.release_connection.call_count == 3
+
+
+def test_get_plan_is_cached(stubbed_collection, project_client_lookup):
+    stubbed_collection.generate_select_dependencies = Mock(
+        side_effect=stubbed_collection.generate_select_dependencies
+    )
+    plan = stubbed_collection.get_plan(project_client_lookup)
+    assert stubbed_collection.get_plan(project_client_lookup) is plan
+    assert stubbed_collection.get_plan(project_client_lookup, projection={u"name": 1}) is not plan
+    assert stubbed_collection.generate_select_dependencies.call_count == 2
+
+    stubbed_collection.find({u"id": 1}, lookup=project_client_lookup).sort(u"client.name")
+    assert stubbed_collection.generate_select_dependencies.call_count == 2
+
+    stubbed_collection.clear_plan_cache()
+    assert stubbed_collection.get_plan(project_client_lookup) is not plan
+
+
+def test_get_plan_auto_lookup(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    plan = hour.get_plan(auto_lookup=2)
+    assert u"project.client.name" in plan.fields_mapping
+    assert hour.get_plan(auto_lookup=2) is plan
+    assert len(plan.joins) == 2
+
+
+def test__get_where_reuses_template(stubbed_collection):
+    plan = stubbed_collection.get_plan()
+    where, params = stubbed_collection._get_where(OrderedDict([
+        (u"id", OrderedDict([(u"$gt", 5), (u"$lt", 10)])), (u"name", u"test")
+    ]), plan)
+    assert str(where) == u"project.id > :id_1 AND project.id < :id_2 AND project.name = :name_1"
+    assert params == {u"id_1": 5, u"id_2": 10, u"name_1": u"test"}
+
+    other_where, other_params = stubbed_collection._get_where(OrderedDict([
+        (u"id", OrderedDict([(u"$gt", 1), (u"$lt", 2)])), (u"name", u"other")
+    ]), plan)
+    assert other_where is where
+    assert other_params == {u"id_1": 1, u"id_2": 2, u"name_1": u"other"}
+
+
+def test__get_where_keeps_null_comparisons(stubbed_collection):
+    plan = stubbed_collection.get_plan()
+    where, params = stubbed_collection._get_where({u"name": None}, plan)
+    assert str(where) == u"project.name IS NULL"
+    assert params == {}
+
+    where, params = stubbed_collection._get_where({}, plan)
+    assert where is None
+
+
+def test_find_binds_parameters(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    for minutes in [30, 70]:
+        documents = list(hour.find({
+            u"minutes": {u"$gte": minutes},
+            u"started_at": {u"$lt": u"2017-01-09 00:00:00"}
+        }))
+        assert sorted(document[u"id"] for document in documents) == list(range(minutes // 10, 9))
+
+
+def test__parse_query_in(stubbed_collection, mock_project_fields_mapping):
+    result = stubbed_collection._parse_query(OrderedDict([
+        (u"id", {u"$in": [1, 2]}), (u"name", {u"$nin": [u"a"]})
+    ]), fields_mapping=mock_project_fields_mapping)
+    assert str(result) == u"id IN (__[POSTCOMPILE_id_1]) AND ((name NOT IN (__[POSTCOMPILE_name_1])) OR name IS NULL)"
+
+
+def test_in_and_nin_with_nulls(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hours_count_sqlite.get_engine().execute(u"UPDATE hour SET minutes = NULL WHERE id = 3")
+
+    def ids(query):
+        return [document[u"id"] for document in hour.find(query).sort(u"id")]
+
+    assert ids({u"minutes": {u"$nin": [10, 20, 40, 50, 60, 70]}}) == [3, 8, 9, 10]
+    assert ids({u"minutes": {u"$nin": [None, 10, 20, 40, 50, 60, 70]}}) == [8, 9, 10]
+    assert ids({u"minutes": {u"$in": [10, 20]}}) == [1, 2]
+    assert ids({u"minutes": {u"$in": [None, 10]}}) == [1, 3]
+
+
+def test__get_where_in_reuses_template(stubbed_collection):
+    plan = stubbed_collection.get_plan()
+    where, params = stubbed_collection._get_where({u"id": {u"$in": [1, 2]}}, plan)
+    assert params == {u"id_1": [1, 2]}
+
+    other_where, other_params = stubbed_collection._get_where({u"id": {u"$in": [3, 4, 5]}}, plan)
+    assert other_where is where
+    assert other_params == {u"id_1": [3, 4, 5]}
+
+    with raises(ValueError):
+        stubbed_collection._get_where({u"id": {u"$in": 3}}, plan)
+
+
+def test_find_in(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    assert sorted(document[u"id"] for document in hour.find({u"id": {u"$in": [2, 4, 11]}})) == [2, 4]
+    assert sorted(document[u"id"] for document in hour.find({u"id": {u"$nin": [2, 4]}})) == [
+        1, 3, 5, 6, 7, 8, 9, 10
+    ]
+    assert list(hour.find({u"id": {u"$in": []}})) == []
+    assert hour.find({u"project.name": {u"$in": [u"Website"]}}, auto_lookup=1).count() == 3
+
+
+def test_find_in_large_list(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    ids = list(range(-50000, 3))
+    assert sorted(document[u"id"] for document in hour.find({u"id": {u"$in": ids}})) == [1, 2]
+    assert hour.find({u"id": {u"$nin": ids}}).count() == 8
+
+    where, params = hour._get_where({u"id": {u"$in": ids}}, hour.get_plan())
+    assert where.right.literal_execute
+    where, params = hour._get_where({u"id": {u"$in": [1]}}, hour.get_plan())
+    assert not where.right.literal_execute
+
+
+def test_insert_many(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    result = project.insert_many([
+        {u"id": 10, u"name": u"Api", u"client": {u"id": 2}},
+        {u"id": 11, u"name": u"Docs", u"client": {u"id": 2}},
+        {u"name": u"Ops"}
+    ], auto_lookup=1)
+
+    assert result.inserted_ids == [10, 11, 12]
+    assert sorted(document[u"name"] for document in project.find({u"client": 2})) == [
+        u"Api", u"Backend", u"Docs"
+    ]
+
+
+def test_insert_many_batches(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hour.release_connection = Mock(side_effect=hour.release_connection)
+    result = hour.insert_many([{u"minutes": index} for index in range(25)], batch_size=10)
+
+    assert len(result.inserted_ids) == 25
+    assert hour.find().count() == 35
+    assert hour.release_connection.call_count == 2
+
+
+def test_insert_many_uses_returning(stubbed_collection, project_table):
+    project_table.append_constraint(PrimaryKeyConstraint(project_table.columns[u"id"]))
+    add_connection_execute_mock(stubbed_collection, [(7,), (8,)])
+    connection = stubbed_collection.get_connection()
+    connection.dialect = postgresql.dialect()
+    connection.begin = MagicMock()
+
+    result = stubbed_collection.insert_many([{u"name": u"a"}, {u"name": u"b"}])
+
+    assert result.inserted_ids == [7, 8]
+    assert str(connection.execute.call_args[0][0].compile(dialect=postgresql.dialect())) == (
+        u"INSERT INTO project (name) VALUES (%(name_m0)s), (%(name_m1)s) RETURNING project.id"
+    )
+
+
+def test_bulk_write(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    result = project.bulk_write([
+        InsertOne({u"id": 4, u"name": u"Api", u"client": 2}),
+        InsertOne({u"id": 5, u"name": u"Docs", u"client": 2}),
+        UpdateMany({u"client": 2}, {u"$set": {u"client": 1}}),
+        DeleteMany({u"name": u"Website"})
+    ])
+
+    assert result.inserted_count == 2
+    assert result.inserted_ids == [4, 5]
+    assert result.matched_count == 3
+    assert result.deleted_count == 1
+    assert sorted(document[u"id"] for document in project.find({u"client": 1})) == [2, 3, 4, 5]
+
+
+def test_bulk_write_rolls_back(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    with raises(IntegrityError):
+        project.bulk_write([
+            InsertOne({u"id": 4, u"name": u"Api", u"client": 2}),
+            UpdateMany({u"id": 1}, {u"$set": {u"name": u"Renamed"}}),
+            InsertOne({u"id": 1, u"name": u"Duplicate", u"client": 2})
+        ])
+    assert project.find().count() == 3
+    assert project.find({u"name": u"Renamed"}).count() == 0
+
+
+def test_update_one(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    result = project.update_one({u"client": 1}, {u"$set": {u"name": u"Renamed"}})
+    assert result.matched_count == 1
+    assert project.find({u"name": u"Renamed"}).count() == 1
+
+    assert project.update_one({u"client": 3}, {u"$set": {u"name": u"Renamed"}}).matched_count == 0
+
+
+def test_update_one_upsert(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.update_one({u"id": 4}, {u"$set": {u"name": u"Api", u"client": 2}}, upsert=True)
+    project.update_one({u"id": {u"$eq": 1}}, {u"$set": {u"name": u"Site"}}, upsert=True)
+    project.update_many({u"id": 3}, {u"$set": {u"name": u"Server"}}, upsert=True)
+
+    documents = list(project.find().sort(u"id"))
+    assert [document[u"name"] for document in documents] == [u"Site", u"Mobile app", u"Server", u"Api"]
+    assert documents[0][u"client"] == 1
+
+    with raises(ValueError):
+        project.update_one({u"name": u"Api"}, {u"$set": {u"client": 1}}, upsert=True)
+
+
+def test_update_many_upsert(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    result = project.update_many({u"id": 1}, {u"$set": {u"name": u"Site"}}, upsert=True)
+    assert (result.matched_count, result.upserted_id) == (1, None)
+    result = project.update_many({u"id": 2, u"client": 2}, {u"$set": {u"name": u"Api"}}, upsert=True)
+    assert (result.matched_count, result.upserted_id) == (0, None)
+    result = project.update_many(
+        {u"id": 4, u"name": {u"$ne": u"X"}}, {u"$set": {u"name": u"Api", u"client": 3}}, upsert=True
+    )
+    assert (result.matched_count, result.upserted_id) == (0, 4)
+
+    documents = list(project.find().sort(u"id"))
+    assert [(document[u"id"], document[u"name"], document[u"client"]) for document in documents] == [
+        (1, u"Site", 1), (2, u"Mobile app", 1), (3, u"Backend", 2), (4, u"Api", 3)
+    ]
+
+    with raises(ValueError):
+        project.update_many({u"client": 1}, {u"$set": {u"name": u"Site"}}, upsert=True)
+
+
+def test_update_one_upsert_checks_the_filter(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    result = project.update_one({u"id": 2, u"name": u"Backend"}, {u"$set": {u"client": 2}}, upsert=True)
+    assert result.matched_count == 0
+    result = project.update_one({u"id": 3, u"client": {u"$gt": 5}}, {u"$set": {u"name": u"X"}}, upsert=True)
+    assert result.matched_count == 0
+    result = project.update_one(
+        {u"id": 1, u"client.name": u"World inc"}, {u"$set": {u"name": u"X"}}, auto_lookup=1, upsert=True
+    )
+    assert result.matched_count == 0
+    assert [document[u"name"] for document in project.find().sort(u"id")] == [u"Website", u"Mobile app", u"Backend"]
+
+    project.update_one({u"id": 3, u"client": {u"$gte": 2}}, {u"$set": {u"name": u"Server"}}, upsert=True)
+    project.update_one(
+        {u"id": 1, u"client.name": u"Hello inc"}, {u"$set": {u"name": u"Site"}}, auto_lookup=1, upsert=True
+    )
+    project.update_one({u"id": 4, u"name": u"Api", u"client": {u"$in": [1, 2]}}, {u"$set": {u"client": 2}}, upsert=True)
+    documents = list(project.find().sort(u"id"))
+    assert [(document[u"name"], document[u"client"]) for document in documents] == [
+        (u"Site", 1), (u"Mobile app", 1), (u"Server", 2), (u"Api", 2)
+    ]
+
+
+def test_replace_one(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.replace_one({u"name": u"Website"}, {u"name": u"Homepage"})
+    project.replace_one({u"id": 2}, {u"name": u"Android", u"client": 2}, upsert=True)
+    project.replace_one({u"id": 5}, {u"name": u"Ios"}, upsert=True)
+
+    documents = list(project.find().sort(u"id"))
+    assert [(document[u"name"], document[u"client"]) for document in documents] == [
+        (u"Homepage", None), (u"Android", 2), (u"Backend", 2), (u"Ios", None)
+    ]
+
+
+def test_upsert_many(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.upsert_many([
+        {u"id": 1, u"name": u"Site", u"client": 2},
+        {u"id": 4, u"name": u"Api", u"client": 2},
+        {u"id": 3, u"name": u"Server"},
+        {u"id": 5, u"name": u"Admin", u"client": 1}
+    ], batch_size=1)
+
+    documents = list(project.find().sort(u"id"))
+    assert [(document[u"id"], document[u"name"], document[u"client"]) for document in documents] == [
+        (1, u"Site", 2), (2, u"Mobile app", 1), (3, u"Server", 2), (4, u"Api", 2), (5, u"Admin", 1)
+    ]
+
+
+def test__upsert_request_dialects(stubbed_collection, project_table):
+    project_table.append_constraint(PrimaryKeyConstraint(project_table.columns[u"id"]))
+    values = {u"id": 1, u"name": u"Site"}
+    request = stubbed_collection._upsert_request(postgresql.dialect(), [u"id"], [u"name"], values)
+    assert str(request.compile(dialect=postgresql.dialect())) == (
+        u"INSERT INTO project (id, name) VALUES (%(id)s, %(name)s) "
+        u"ON CONFLICT (id) DO UPDATE SET name = excluded.name"
+    )
+
+    request = stubbed_collection._upsert_request(mysql.dialect(), [u"id"], [], values)
+    assert str(request.compile(dialect=mysql.dialect())) == (
+        u"INSERT INTO project (id, name) VALUES (%s, %s) ON DUPLICATE KEY UPDATE id = VALUES(id)"
+    )
+
+    where = project_table.columns[u"client"] > 5
+    request = stubbed_collection._upsert_request(postgresql.dialect(), [u"id"], [u"name"], values, where)
+    assert str(request.compile(dialect=postgresql.dialect())).endswith(
+        u"ON CONFLICT (id) DO UPDATE SET name = excluded.name WHERE project.client > %(client_1)s"
+    )
+    with raises(NotImplementedError):
+        stubbed_collection._upsert_request(mysql.dialect(), [u"id"], [u"name"], values, where)
+
+    with raises(NotImplementedError):
+        stubbed_collection._upsert_request(oracle.dialect(), [u"id"], [u"name"], values)
+
+
+def test_write_explain(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    explanation = hour.update_many({u"id": 3}, {u"$set": {u"minutes": 0}}, explain=True)
+    assert explanation.statement.startswith(u"UPDATE hour")
+    assert explanation.steps[0][u"access"] == u"index"
+
+    explanation = hour.delete_many({u"minutes": 30}, explain=True)
+    assert explanation.sequential_scans == [u"hour"]
+    assert len(list(hour.find())) == 10
+
+
+def test_find_one(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hour._get_where = Mock(side_effect=hour._get_where)
+
+    document = hour.find_one({u"id": 2}, auto_lookup=2)
+    assert document[u"project"][u"client"][u"name"] == u"World inc"
+    assert hour.find_one({u"id": {u"$eq": 42}}) is None
+    assert hour._get_where.call_count == 0
+
+    document = hour.find_one({u"minutes": {u"$gt": 50}}, projection={u"id": 1})
+    assert document == {u"id": 6}
+    assert hour.find_one() is not None
+
+
+def test_get(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    assert hour.get(3, auto_lookup=1)[u"project"][u"name"] == u"Website"
+    assert hour.get(42) is None
+
+    plan = hour.get_plan(auto_lookup=1)
+    assert list(plan.statements) == [(u"get", False)]
+    request = plan.statements[(u"get", False)]
+    hour.get(4, auto_lookup=1)
+    assert plan.statements[(u"get", False)] is request
+
+
+def test_get_many(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    documents = hour.get_many([5, 42, 1, 5], projection={u"id": 1, u"minutes": 1})
+    assert documents == [{u"id": 5, u"minutes": 50}, None, {u"id": 1, u"minutes": 10}, {u"id": 5, u"minutes": 50}]
+    assert hour.get_many([]) == []
+
+    ids = list(range(-5000, 4))
+    assert [document[u"id"] for document in hour.get_many(ids)[-3:]] == [1, 2, 3]
+    assert (u"get_many", True) in hour.get_plan().statements
+
+    log = Collection(hours_count_sqlite, Table(u"log", MetaData(), Column(u"message", String(50))))
+    with raises(ValueError):
+        log.get_many([1])
+
+
+def test_get_with_string_keys(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    documents = hour.get_many([u"1", 2, u"5", u"nope"], projection={u"id": 1})
+    assert documents == [{u"id": 1}, {u"id": 2}, {u"id": 5}, None]
+    assert hour.get(u"3", projection={u"id": 1}) == {u"id": 3}
+    assert hour.find_one({u"id": u"4"}, projection={u"id": 1}) == {u"id": 4}
+
+    loader = hour.loader(projection={u"id": 1})
+    assert [document.result() for document in loader.load_many([u"6", 7])] == [{u"id": 6}, {u"id": 7}]
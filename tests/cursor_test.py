@@ -3,16 +3,24 @@
 Cursor class tests
 """
 
+import io
+import csv
+import json
+import datetime
 from mock import Mock
-from pytest import fixture
+from pytest import fixture, importorskip, raises
+from sqlcollection.compatibility import UNICODE_TYPE
 from sqlcollection.cursor import Cursor
 from sqlalchemy.sql.expression import Label
+from sqlalchemy.schema import PrimaryKeyConstraint
+from sqlalchemy.dialects import sqlite, postgresql
 from .collection_test import (
     stubbed_collection,
     project_client_lookup,
     client_table,
     project_table,
-    hours_count_db
+    hours_count_db,
+    hours_count_sqlite
 )
 
 
@@ -56,3 +64,284 @@ def test_count(stubbed_cursor):
     assert count == 36
     stubbed_cursor._serialize_count.assert_called_with(True)
     fake_connection.execute.assert_called_with(fake_request)
+
+
+def test_count_ignores_the_sort(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    cursor = hour.find({u"minutes": {u"$gt": 20}}).sort(u"minutes", -1)
+    assert u"ORDER BY" not in str(cursor._serialize_count())
+    assert cursor.count() == 8
+
+    cursor = hour.find().sort(u"minutes").after({u"id": 3, u"minutes": 30}).limit(2)
+    assert u"ORDER BY" not in str(cursor._serialize_count())
+    assert cursor.count() == 7
+    assert cursor.count(with_limit_and_skip=True) == 2
+
+
+def test_iteration_releases_connection(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.release_connection = Mock(side_effect=project.release_connection)
+    cursor = project.find()
+    documents = list(cursor)
+    assert len(documents) == 3
+    assert cursor._connection is None
+    assert project.release_connection.call_count == 1
+
+
+def test_close_releases_connection(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    project.release_connection = Mock(side_effect=project.release_connection)
+    with project.find() as cursor:
+        documents = iter(cursor)
+        next(documents)
+        assert cursor._connection is not None
+    assert cursor._connection is None
+    assert project.release_connection.call_count == 1
+
+
+def test_iteration_builds_nested_documents(hours_count_sqlite):
+    documents = list(hours_count_sqlite.hour.find({u"id": 1}, auto_lookup=2))
+    assert documents[0][u"project"] == {
+        u"id": 2,
+        u"name": u"Mobile app",
+        u"client": {u"id": 1, u"name": u"Hello inc"}
+    }
+
+
+def test_batch_size_streams_results(stubbed_cursor):
+    fake_result = Mock()
+    fake_result.fetchmany = Mock(side_effect=[[(1, u"a", 2, u"b")], [(3, u"c", 4, u"d")], []])
+    streaming_connection = Mock()
+    streaming_connection.execute = Mock(return_value=fake_result)
+    fake_connection = Mock()
+    fake_connection.execution_options = Mock(return_value=streaming_connection)
+    fake_collection = Mock()
+    fake_collection.get_connection = Mock(return_value=fake_connection)
+    stubbed_cursor._collection_ref = fake_collection
+    stubbed_cursor._serialize = Mock()
+
+    documents = list(stubbed_cursor.batch_size(1))
+
+    assert [document[u"id"] for document in documents] == [1, 3]
+    fake_connection.execution_options.assert_called_with(stream_results=True)
+    fake_result.fetchmany.assert_called_with(1)
+    fake_collection.release_connection.assert_called_with(fake_connection)
+
+
+def test_batch_size_on_sqlite(hours_count_sqlite):
+    documents = list(hours_count_sqlite.hour.find().sort(u"id").batch_size(3))
+    assert [document[u"id"] for document in documents] == list(range(1, 11))
+
+
+def test_after_paginates_with_ties(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    pages = []
+    last = None
+    while True:
+        page = list(hour.find(auto_lookup=2).sort(u"project.client.name", -1).after(last).limit(3))
+        if not page:
+            break
+        pages.append([document[u"id"] for document in page])
+        last = page[-1]
+
+    assert pages == [[2, 5, 8], [1, 3, 4], [6, 7, 9], [10]]
+
+
+def test_after_with_continuation_token(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    cursor = hour.find({u"minutes": {u"$gt": 10}}).sort(u"started_at").after().limit(4)
+    page = list(cursor)
+    token = cursor.continuation_token(page[-1])
+
+    next_page = list(hour.find({u"minutes": {u"$gt": 10}}).sort(u"started_at").after(token).limit(4))
+
+    assert [document[u"id"] for document in page] == [2, 3, 4, 5]
+    assert [document[u"id"] for document in next_page] == [6, 7, 8, 9]
+
+
+def test_after_with_filter_on_the_sort_key(hours_count_sqlite):
+    documents = list(hours_count_sqlite.hour.find({u"id": {u"$gt": 2}}).after({u"id": 7}))
+    assert [document[u"id"] for document in documents] == [8, 9, 10]
+
+
+def test_after_where_clause(stubbed_cursor, project_table):
+    stubbed_cursor._collection_ref._table = project_table
+    project_table.append_constraint(PrimaryKeyConstraint(project_table.columns[u"id"]))
+    stubbed_cursor._collection_ref._db_ref.get_engine = Mock(return_value=Mock(dialect=sqlite.dialect()))
+    stubbed_cursor.sort(u"name").after({u"id": 4, u"name": u"test"})
+    seek_where, order_by = stubbed_cursor._serialize_seek()
+    assert str(seek_where) == u"project.name > :seek_1 OR project.name = :seek_1 AND project.id > :seek_2"
+    assert [str(clause) for clause in order_by] == [u"project.name ASC", u"project.id ASC"]
+
+
+def test_after_where_clause_with_nulls(stubbed_cursor, project_table):
+    stubbed_cursor._collection_ref._table = project_table
+    project_table.append_constraint(PrimaryKeyConstraint(project_table.columns[u"id"]))
+    stubbed_cursor._collection_ref._db_ref.get_engine = Mock(return_value=Mock(dialect=postgresql.dialect()))
+
+    stubbed_cursor.sort(u"name").after({u"id": 4, u"name": u"test"})
+    seek_where, _ = stubbed_cursor._serialize_seek()
+    assert str(seek_where) == (
+        u"project.name > :seek_1 OR project.name IS NULL OR project.name = :seek_1 AND project.id > :seek_2"
+    )
+
+    stubbed_cursor.after({u"id": 4, u"name": None})
+    seek_where, _ = stubbed_cursor._serialize_seek()
+    assert str(seek_where) == u"project.name IS NULL AND project.id > :seek_2"
+
+    stubbed_cursor.sort(u"name", -1)
+    seek_where, _ = stubbed_cursor._serialize_seek()
+    assert str(seek_where) == (
+        u"project.name IS NOT NULL OR project.name IS NULL AND project.id > :seek_2"
+    )
+
+
+def test_after_paginates_across_nulls(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hours_count_sqlite.get_engine().execute(u"UPDATE hour SET minutes = NULL WHERE id IN (3, 7)")
+
+    for direction, expected in [(1, [3, 7, 1, 2, 4, 5, 6, 8, 9, 10]), (-1, [10, 9, 8, 6, 5, 4, 2, 1, 3, 7])]:
+        ids = []
+        token = None
+        while True:
+            cursor = hour.find().sort(u"minutes", direction).after(token).limit(3)
+            page = list(cursor)
+            if not page:
+                break
+            ids.extend(document[u"id"] for document in page)
+            token = cursor.continuation_token(page[-1])
+        assert ids == expected
+
+
+def test_with_total(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hour.release_connection = Mock(side_effect=hour.release_connection)
+    documents, total = hour.find({u"minutes": {u"$gt": 20}}).sort(u"id").limit(3).with_total()
+    assert [document[u"id"] for document in documents] == [3, 4, 5]
+    assert u"_total" not in documents[0]
+    assert total == 8
+    assert hour.release_connection.call_count == 1
+
+
+def test_with_total_past_the_end(hours_count_sqlite):
+    documents, total = hours_count_sqlite.hour.find().skip(20).limit(3).with_total()
+    assert documents == []
+    assert total == 10
+
+
+def test_with_total_without_window_functions(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    cursor = hour.find({u"minutes": {u"$lt": 50}}).limit(2)
+    cursor._supports_window_functions = Mock(return_value=False)
+    documents, total = cursor.with_total()
+    assert len(documents) == 2
+    assert total == 4
+
+
+def test_to_columns(hours_count_sqlite):
+    cursor = hours_count_sqlite.hour.find({u"id": {u"$lte": 3}}, auto_lookup=1).sort(u"id")
+    columns = cursor.to_columns(batch_size=2)
+    assert list(columns) == [label.name for label in cursor._fields]
+    assert columns[u"id"] == [1, 2, 3]
+    assert columns[u"minutes"] == [10, 20, 30]
+    assert columns[u"project.name"] == [u"Mobile app", u"Backend", u"Website"]
+    assert columns[u"started_at"][0] == datetime.datetime(2017, 1, 1)
+
+
+def test_to_columns_empty(hours_count_sqlite):
+    columns = hours_count_sqlite.hour.find({u"id": 0}).to_columns()
+    assert columns[u"id"] == []
+
+
+def test_to_numpy(hours_count_sqlite):
+    numpy = importorskip(u"numpy")
+    hour = hours_count_sqlite.hour
+    hour.update_many({u"id": 10}, {u"$set": {u"minutes": None}})
+
+    arrays = hour.find().sort(u"id").to_numpy(batch_size=4)
+    assert arrays[u"id"].dtype == numpy.int64
+    assert arrays[u"id"].tolist() == list(range(1, 11))
+    assert arrays[u"minutes"].dtype == numpy.float64
+    assert numpy.isnan(arrays[u"minutes"][-1])
+    assert arrays[u"started_at"].dtype == numpy.dtype(u"datetime64[us]")
+    assert arrays[u"started_at"][0] == numpy.datetime64(u"2017-01-01")
+
+    empty = hour.find({u"id": 0}).to_numpy()
+    assert empty[u"id"].dtype == numpy.int64 and len(empty[u"id"]) == 0
+
+
+def test_export_jsonl(hours_count_sqlite, tmpdir):
+    path = UNICODE_TYPE(tmpdir.join(u"hours.jsonl"))
+    cursor = hours_count_sqlite.hour.find({u"id": {u"$lte": 3}}, auto_lookup=2).sort(u"id")
+    assert cursor.export(path, batch_size=2) == 3
+
+    with io.open(path, encoding=u"utf-8") as export_file:
+        documents = [json.loads(line) for line in export_file]
+    assert [document[u"id"] for document in documents] == [1, 2, 3]
+    assert documents[0][u"started_at"] == u"2017-01-01T00:00:00"
+    assert documents[0][u"project"][u"client"] == {u"id": 1, u"name": u"Hello inc"}
+
+
+def test_export_csv(hours_count_sqlite):
+    output = io.StringIO()
+    cursor = hours_count_sqlite.hour.find({u"id": {u"$lte": 2}}, auto_lookup=1).sort(u"id")
+    assert cursor.export(output, format=u"csv") == 2
+
+    rows = list(csv.reader(io.StringIO(output.getvalue())))
+    assert rows[0] == [label.name for label in cursor._fields]
+    assert rows[1][rows[0].index(u"project.name")] == u"Mobile app"
+    assert rows[1][rows[0].index(u"started_at")] == u"2017-01-01T00:00:00"
+    assert len(rows) == 3
+
+
+def test_export_unknown_format(hours_count_sqlite):
+    with raises(ValueError):
+        hours_count_sqlite.hour.find().export(io.StringIO(), format=u"xml")
+
+
+def test_parallel_unordered(hours_count_sqlite):
+    documents = list(hours_count_sqlite.hour.find({u"id": {u"$gt": 2}}, auto_lookup=1).parallel(3))
+    assert sorted(document[u"id"] for document in documents) == list(range(3, 11))
+    assert all(u"name" in document[u"project"] for document in documents)
+
+
+def test_parallel_ordered(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hour.update_many({u"id": {u"$in": [4, 9]}}, {u"$set": {u"project": None}})
+    expected = [document[u"id"] for document in hour.find().sort([u"project", u"id"], [-1, 1])]
+
+    documents = list(hour.find().sort([u"project", u"id"], [-1, 1]).batch_size(2).parallel(4))
+    assert [document[u"id"] for document in documents] == expected
+
+    documents = list(hour.find().sort(u"minutes", -1).skip(2).limit(3).parallel(3))
+    assert [document[u"id"] for document in documents] == [8, 7, 6]
+
+
+def test_parallel_empty(hours_count_sqlite):
+    assert list(hours_count_sqlite.hour.find({u"id": 0}).parallel(2)) == []
+    with raises(ValueError):
+        hours_count_sqlite.hour.find().parallel(0)
+
+
+def test_parallel_stops_when_closed(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    hour.release_connection = Mock(side_effect=hour.release_connection)
+    cursor = hour.find().batch_size(1).parallel(2)
+    iterator = iter(cursor)
+    next(iterator)
+    cursor.close()
+    # The bounds query and each partition released their connection.
+    assert hour.release_connection.call_count == 3
+
+
+def test_explain(hours_count_sqlite):
+    explanation = hours_count_sqlite.hour.find({u"minutes": {u"$in": [10, 20]}}, auto_lookup=2).explain()
+    assert explanation.dialect == u"sqlite"
+    assert explanation.statement.startswith(u"SELECT")
+    assert u"IN (?, ?)" in explanation.statement
+    assert explanation.sequential_scans == [u"hour"]
+    assert {u"table": u"hour", u"column": u"project", u"as": u"hour"} in explanation.missing_indexes
+    assert {u"table": u"project", u"column": u"client", u"as": u"project"} in explanation.missing_indexes
+
+    with raises(NotImplementedError):
+        hours_count_sqlite.hour.find().explain(analyze=True)
@@ -0,0 +1,109 @@
+# coding utf-8
+"""
+DB class tests
+"""
+import time
+from mock import Mock
+from pytest import raises
+from sqlcollection.db import DB
+from sqlcollection.result_cache import ResultCache
+from sqlcollection.collection import Collection
+from .collection_test import hours_count_sqlite
+
+
+def test_reflection_loads_only_requested_tables(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    assert isinstance(project, Collection)
+    assert sorted(hours_count_sqlite.get_metadata().tables) == [u"client", u"project"]
+    assert u"hour" not in hours_count_sqlite.__dict__
+
+
+def test_foreign_key_targets_are_available(hours_count_sqlite):
+    lookup = hours_count_sqlite.hour.generate_lookup(hours_count_sqlite.hour._table, 2)
+    assert [relation[u"as"] for relation in lookup] == [u"project", u"project.client"]
+    assert isinstance(hours_count_sqlite.__dict__[u"client"], Collection)
+
+
+def test_metadata_cache(hours_count_sqlite, tmpdir):
+    url = hours_count_sqlite._url
+    DB(url, metadata_cache=str(tmpdir)).project
+
+    db = DB(url, metadata_cache=str(tmpdir))
+    db.get_engine = Mock(side_effect=AssertionError(u"Should not reflect"))
+    assert db.project._table.c.client.foreign_keys
+    assert isinstance(db.client, Collection)
+
+
+def test_metadata_cache_ttl(hours_count_sqlite, tmpdir):
+    url = hours_count_sqlite._url
+    DB(url, metadata_cache=str(tmpdir), metadata_cache_ttl=60).project
+
+    db = DB(url, metadata_cache=str(tmpdir), metadata_cache_ttl=60)
+    db._metadata_cache._ttl = -1
+    assert len(db.get_metadata().tables) == 0
+
+
+def test_refresh_schema(hours_count_sqlite, tmpdir):
+    cache_dir = tmpdir.mkdir(u"cache")
+    db = DB(hours_count_sqlite._url, metadata_cache=str(cache_dir))
+    project = db.project
+    assert len(cache_dir.listdir()) == 1
+    db.refresh_schema()
+    assert u"project" not in db.__dict__
+    assert len(cache_dir.listdir()) == 0
+    assert db.project is not project
+
+
+def test_missing_table(hours_count_sqlite):
+    db = DB(hours_count_sqlite._url)
+    with raises(KeyError):
+        db.nothing
+    db._reflect = Mock()
+    with raises(KeyError):
+        db.nothing
+    assert db._reflect.call_count == 0
+
+    db.refresh_schema()
+    with raises(KeyError):
+        db.nothing
+    assert db._reflect.call_count == 1
+
+
+def test_transaction_commits_once(hours_count_sqlite):
+    with hours_count_sqlite.transaction() as tx:
+        connection = tx.get_transaction_connection()
+        tx.project.insert_one({u"id": 4, u"name": u"Api", u"client": 2})
+        tx.project.update_many({u"id": 4}, {u"$set": {u"name": u"Public api"}})
+        tx.project.insert_many([{u"id": 5, u"name": u"Admin", u"client": 2}])
+        assert [document[u"name"] for document in tx.project.find({u"client": 2}).sort(u"id")] == [
+            u"Backend", u"Public api", u"Admin"
+        ]
+        assert not connection.closed
+
+    assert connection.closed
+    assert hours_count_sqlite.get_transaction_connection() is None
+    assert hours_count_sqlite.project.find({u"client": 2}).count() == 3
+
+
+def test_transaction_rolls_back(hours_count_sqlite):
+    project = hours_count_sqlite.project
+    with raises(ValueError):
+        with hours_count_sqlite.transaction():
+            project.delete_many({u"client": 1})
+            with hours_count_sqlite.transaction():
+                project.insert_one({u"id": 4, u"name": u"Api", u"client": 2})
+            raise ValueError(u"Abort")
+
+    assert sorted(document[u"id"] for document in project.find()) == [1, 2, 3]
+
+
+def test_transaction_invalidates_results_at_commit(hours_count_sqlite):
+    db = DB(hours_count_sqlite._url, result_cache=ResultCache())
+    project = db.project
+    assert project.find({u"client": 2}).count() == 1
+
+    with db.transaction():
+        project.insert_one({u"id": 4, u"name": u"Api", u"client": 2})
+        assert project.find({u"client": 2}).count() == 2
+
+    assert project.find({u"client": 2}).count() == 2
@@ -0,0 +1,58 @@
+# coding utf-8
+"""
+RowDecoder class tests
+"""
+import decimal
+from sqlcollection.decoder import RowDecoder
+from sqlalchemy.sql.expression import Label
+from sqlalchemy.types import Integer, String, Numeric, Float, NullType
+from sqlalchemy.schema import Column
+from sqlalchemy import func
+
+
+def make_label(name, type_):
+    return Label(name, Column(name.split(u".")[-1], type_))
+
+
+def test_decode_nested_paths():
+    decoder = RowDecoder([
+        make_label(u"id", Integer()),
+        make_label(u"project.name", String()),
+        make_label(u"project.client.name", String()),
+        make_label(u"project.id", Integer())
+    ])
+    document = decoder.decode((1, u"Website", u"Hello inc", 3))
+    assert document == {
+        u"id": 1,
+        u"project": {
+            u"name": u"Website",
+            u"client": {
+                u"name": u"Hello inc"
+            },
+            u"id": 3
+        }
+    }
+    assert list(document[u"project"]) == [u"name", u"client", u"id"]
+
+
+def test_decode_converts_numeric():
+    decoder = RowDecoder([
+        make_label(u"price", Numeric()),
+        make_label(u"ratio", Float()),
+        make_label(u"unknown", NullType()),
+        make_label(u"missing", Numeric())
+    ])
+    document = decoder.decode((decimal.Decimal(u"1.5"), 0.5, decimal.Decimal(u"2"), None))
+    assert document == {u"price": 1.5, u"ratio": 0.5, u"unknown": 2.0, u"missing": None}
+    assert type(document[u"price"]) is float
+    assert type(document[u"unknown"]) is float
+
+
+def test_decode_converts_decimal_aggregates():
+    minutes = Column(u"minutes", Integer())
+    decoder = RowDecoder([Label(u"total", func.sum(minutes)), Label(u"minutes", minutes)])
+    assert decoder.converters[1] is None
+
+    document = decoder.decode((decimal.Decimal(u"550"), 10))
+    assert document == {u"total": 550.0, u"minutes": 10}
+    assert type(document[u"total"]) is float
@@ -0,0 +1,35 @@
+# coding utf-8
+"""
+Engine registry tests
+"""
+from sqlcollection import Client
+from sqlcollection.db import DB
+from sqlcollection.engine import get_engine, dispose_engines
+
+
+def test_get_engine_is_shared():
+    dispose_engines()
+    engine = get_engine(u"sqlite://", pool_recycle=3600)
+    assert get_engine(u"sqlite://", pool_recycle=3600) is engine
+    assert get_engine(u"sqlite://", pool_recycle=60) is not engine
+
+
+def test_get_engine_ignores_unset_options():
+    dispose_engines()
+    assert get_engine(u"sqlite://", pool_size=None) is get_engine(u"sqlite://")
+
+
+def test_db_objects_share_engine():
+    dispose_engines()
+    first = DB(u"sqlite://", engine_options={u"pool_pre_ping": True})
+    second = DB(u"sqlite://", engine_options={u"pool_pre_ping": True})
+    assert first.get_engine() is second.get_engine()
+
+
+def test_client_passes_pool_options(tmpdir):
+    dispose_engines()
+    client = Client(url=u"sqlite:///{}".format(tmpdir), pool_recycle=120, pool_pre_ping=True)
+    engine = client.hours_count.get_engine()
+    assert engine.pool._recycle == 120
+    assert engine.pool._pre_ping is True
+    assert client.hours_count.get_engine() is engine
@@ -0,0 +1,86 @@
+# coding utf-8
+"""
+Query plan normalization tests
+"""
+from pytest import raises
+from sqlalchemy.dialects import sqlite, postgresql, mysql, oracle
+from sqlcollection.explain import (
+    get_explain_prefix,
+    parse_sqlite_plan,
+    parse_postgresql_plan,
+    parse_mysql_plan,
+    parse_mysql_tree
+)
+
+
+def test_get_explain_prefix():
+    assert get_explain_prefix(sqlite.dialect()) == u"EXPLAIN QUERY PLAN"
+    assert get_explain_prefix(postgresql.dialect(), True) == u"EXPLAIN (ANALYZE, FORMAT JSON)"
+    assert get_explain_prefix(mysql.dialect()) == u"EXPLAIN FORMAT=JSON"
+    with raises(NotImplementedError):
+        get_explain_prefix(sqlite.dialect(), True)
+    with raises(NotImplementedError):
+        get_explain_prefix(oracle.dialect())
+
+
+def test_parse_sqlite_plan():
+    steps = parse_sqlite_plan([
+        (3, 0, 0, u"SCAN TABLE hour AS h"),
+        (5, 0, 0, u"SEARCH project USING INTEGER PRIMARY KEY (rowid=?)"),
+        (7, 0, 0, u"SEARCH project.client USING AUTOMATIC COVERING INDEX (id=?)"),
+        (9, 0, 0, u"SCAN client USING COVERING INDEX ix_name"),
+        (18, 0, 0, u"USE TEMP B-TREE FOR ORDER BY")
+    ])
+    assert [(step[u"table"], step[u"access"], step[u"index"]) for step in steps] == [
+        (u"h", u"scan", None),
+        (u"project", u"index", u"PRIMARY KEY"),
+        (u"project.client", u"scan", None),
+        (u"client", u"index_scan", u"ix_name"),
+        (None, None, None)
+    ]
+
+
+def test_parse_postgresql_plan():
+    steps = parse_postgresql_plan([{u"Plan": {
+        u"Node Type": u"Hash Join", u"Plan Rows": 10, u"Plans": [
+            {u"Node Type": u"Seq Scan", u"Relation Name": u"hour", u"Alias": u"hour", u"Plan Rows": 1000,
+             u"Actual Rows": 998},
+            {u"Node Type": u"Hash", u"Plans": [
+                {u"Node Type": u"Index Scan", u"Relation Name": u"project", u"Alias": u"project",
+                 u"Index Name": u"project_pkey", u"Plan Rows": 10}
+            ]}
+        ]
+    }}])
+    assert [(step[u"table"], step[u"access"], step[u"index"], step[u"rows"]) for step in steps] == [
+        (None, None, None, 10),
+        (u"hour", u"scan", None, 1000),
+        (None, None, None, None),
+        (u"project", u"index", u"project_pkey", 10)
+    ]
+    assert steps[1][u"actual_rows"] == 998
+
+
+def test_parse_mysql_plan():
+    steps = parse_mysql_plan({u"query_block": {u"select_id": 1, u"ordering_operation": {u"nested_loop": [
+        {u"table": {u"table_name": u"hour", u"access_type": u"ALL", u"rows_examined_per_scan": 1000}},
+        {u"table": {u"table_name": u"project", u"access_type": u"eq_ref", u"key": u"PRIMARY",
+                    u"rows_examined_per_scan": 1}}
+    ]}}})
+    assert [(step[u"table"], step[u"access"], step[u"index"], step[u"rows"]) for step in steps] == [
+        (u"hour", u"scan", None, 1000),
+        (u"project", u"index", u"PRIMARY", 1)
+    ]
+
+
+def test_parse_mysql_tree():
+    steps = parse_mysql_tree(
+        u"-> Nested loop inner join  (cost=450.25 rows=1000) (actual time=0.1..2.5 rows=1000 loops=1)\n"
+        u"    -> Table scan on hour  (cost=100.25 rows=1000) (actual time=0.05..1.1 rows=1000 loops=1)\n"
+        u"    -> Single-row index lookup on project using PRIMARY (id=hour.project)  (cost=0.25 rows=1)\n"
+    )
+    assert [(step[u"table"], step[u"access"], step[u"index"]) for step in steps] == [
+        (None, None, None),
+        (u"hour", u"scan", None),
+        (u"project", u"index", u"PRIMARY")
+    ]
+    assert (steps[1][u"rows"], steps[1][u"actual_rows"]) == (1000, 1000)
@@ -0,0 +1,54 @@
+# coding utf-8
+"""
+Index advisor tests
+"""
+from sqlalchemy.dialects import postgresql
+from sqlcollection.index_advisor import FieldUsage, get_index_ddl
+from .collection_test import hours_count_sqlite
+
+
+def test_field_usage():
+    usage = FieldUsage()
+    usage.record(u"filter", [(u"hour", u"minutes"), (u"project", u"name")])
+    usage.record(u"filter", [(u"hour", u"minutes")])
+    assert usage.get(u"hour", u"minutes", u"filter") == 2
+    assert usage.get(u"hour", u"minutes", u"sort") == 0
+
+    usage.clear()
+    assert usage.get(u"hour", u"minutes", u"filter") == 0
+
+
+def test_suggest_indexes(hours_count_sqlite):
+    hour = hours_count_sqlite.hour
+    assert [suggestion[u"columns"] for suggestion in hour.suggest_indexes()] == [[u"project"]]
+
+    for minutes in [10, 20, 30]:
+        list(hour.find({u"minutes": {u"$gte": minutes}, u"project.client.name": u"Hello inc"}, auto_lookup=2)
+             .sort(u"started_at"))
+
+    suggestions = hour.suggest_indexes(ddl=True)
+    assert [(suggestion[u"columns"], suggestion[u"score"]) for suggestion in suggestions] == [
+        ([u"project"], 3), ([u"minutes"], 3), ([u"started_at"], 1.5)
+    ]
+    assert suggestions[0][u"foreign_key"]
+    assert suggestions[1][u"ddl"] == u"CREATE INDEX ix_hour_minutes ON hour (minutes);"
+
+
+def test_index_report(hours_count_sqlite):
+    hours_count_sqlite.hour.find({u"project.client.name": u"Hello inc"}, auto_lookup=2)
+    report = hours_count_sqlite.index_report()
+    assert report[u"indexes"][u"hour"] == [
+        {u"name": None, u"columns": [u"id"], u"unique": True, u"primary_key": True}
+    ]
+    assert [(suggestion[u"table"], suggestion[u"columns"]) for suggestion in report[u"suggestions"]] == [
+        (u"hour", [u"project"]), (u"project", [u"client"]), (u"client", [u"name"])
+    ]
+
+    hours_count_sqlite.reset_field_usage()
+    assert [suggestion[u"score"] for suggestion in hours_count_sqlite.index_report()[u"suggestions"]] == [0, 0]
+
+
+def test_get_index_ddl(hours_count_sqlite):
+    table = hours_count_sqlite.hour._table
+    assert get_index_ddl(table, u"minutes", postgresql.dialect()) == u"CREATE INDEX ix_hour_minutes ON hour (minutes);"
+    assert len(table.indexes) == 0
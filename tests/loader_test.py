@@ -0,0 +1,67 @@
+# coding utf-8
+"""
+Loader class tests
+"""
+from mock import Mock
+from pytest import raises
+from sqlcollection.loader import Loader
+from .collection_test import hours_count_sqlite
+
+
+def collection_mock(documents):
+    collection = Mock()
+    collection.get_many.side_effect = lambda keys, *args: [documents.get(key) for key in keys]
+    return collection
+
+
+def test_load():
+    collection = collection_mock({1: {u"id": 1}, 2: {u"id": 2}})
+    loader = Loader(collection, projection={u"id": 1})
+    pending = loader.load_many([1, 2, 1])
+    pending.append(loader.load(42))
+    assert collection.get_many.call_count == 0
+
+    assert [document.result() for document in pending] == [{u"id": 1}, {u"id": 2}, {u"id": 1}, None]
+    collection.get_many.assert_called_once_with([1, 2, 42], {u"id": 1}, None, 0)
+    assert pending[0].result() is pending[2].result()
+
+    assert loader.get_many([2, 3]) == [{u"id": 2}, None]
+    assert collection.get_many.call_args[0][0] == [3]
+    loader.load(1).result()
+    assert collection.get_many.call_count == 2
+
+
+def test_dispatch():
+    collection = collection_mock({key: {u"id": key} for key in range(5)})
+    loader = Loader(collection, batch_size=2)
+    loader.load_many(range(5))
+    loader.dispatch()
+    assert [call[0][0] for call in collection.get_many.call_args_list] == [[0, 1], [2, 3], [4]]
+
+    collection.get_many.side_effect = ValueError
+    loader.load_many([5, 6, 7])
+    with raises(ValueError):
+        loader.dispatch()
+    collection.get_many.side_effect = lambda keys, *args: [{u"id": key} for key in keys]
+    assert loader.get(7) == {u"id": 7}
+    assert [call[0][0] for call in collection.get_many.call_args_list[-2:]] == [[5, 6], [7]]
+
+
+def test_prime_clear():
+    collection = collection_mock({1: {u"id": 1}, 2: {u"id": 2}})
+    loader = Loader(collection)
+    loader.prime(1, {u"id": 1, u"primed": True})
+    assert loader.get_many([1, 2]) == [{u"id": 1, u"primed": True}, {u"id": 2}]
+    assert collection.get_many.call_args[0][0] == [2]
+
+    loader.clear(1)
+    assert loader.get(1) == {u"id": 1}
+    loader.clear()
+    loader.get_many([1, 2])
+    assert collection.get_many.call_args[0][0] == [1, 2]
+
+
+def test_collection_loader(hours_count_sqlite):
+    loader = hours_count_sqlite.hour.loader(projection={u"id": 1, u"minutes": 1})
+    pending = loader.load_many([5, 42, 1])
+    assert [document.result() for document in pending] == [{u"id": 5, u"minutes": 50}, None, {u"id": 1, u"minutes": 10}]
@@ -0,0 +1,95 @@
+# coding utf-8
+"""
+Profiler class tests
+"""
+from mock import Mock
+from sqlcollection.db import DB
+from sqlcollection.profiling import Profiler
+from .collection_test import hours_count_sqlite
+
+
+def profiled_db(hours_count_sqlite, **kwargs):
+    operations = []
+    profiler = Profiler(listeners=[operations.append], **kwargs)
+    return DB(hours_count_sqlite._url, profiler=profiler), operations
+
+
+def test_find_is_profiled(hours_count_sqlite):
+    db, operations = profiled_db(hours_count_sqlite)
+    cursor = db.hour.find({u"minutes": {u"$gt": 50}}, auto_lookup=2)
+    assert operations == []
+
+    assert len(list(cursor)) == 5
+    stats = operations[0]
+    assert (stats.collection, stats.operation, stats.rows) == (u"hour", u"find", 5)
+    assert set(stats.phases) == {u"plan", u"parse", u"compile", u"execute", u"decode"}
+    assert stats.statements[0].startswith(u"SELECT")
+    assert stats.duration >= sum(stats.phases.values()) - stats.phases[u"plan"] - stats.phases[u"parse"]
+
+    assert cursor.count() == 5
+    assert operations[1].operation == u"count"
+    assert u"plan" in operations[1].phases
+
+
+def test_closed_cursor_is_profiled(hours_count_sqlite):
+    db, operations = profiled_db(hours_count_sqlite)
+    cursor = db.hour.find({u"minutes": {u"$gt": 50}})
+    iterator = iter(cursor)
+    next(iterator)
+    assert operations == []
+
+    cursor.close()
+    assert len(operations) == 1
+    assert (operations[0].operation, operations[0].rows) == (u"find", 1)
+    assert operations[0].duration is not None
+
+    iter(cursor)
+    cursor.close()
+    assert len(operations) == 2
+
+
+def test_single_row_reads_count_rows(hours_count_sqlite):
+    db, operations = profiled_db(hours_count_sqlite)
+    db.project.find_one({u"id": 1})
+    db.project.get(1)
+    db.project.get_many([1, 2, 99])
+    assert [(stats.operation, stats.rows) for stats in operations] == [
+        (u"find_one", 1), (u"get", 1), (u"get_many", 2)
+    ]
+
+
+def test_writes_are_profiled(hours_count_sqlite):
+    db, operations = profiled_db(hours_count_sqlite)
+    db.project.update_many({u"id": 3}, {u"$set": {u"name": u"Server"}}, upsert=True)
+    db.project.insert_many([{u"name": u"Api", u"client": 2}])
+
+    assert [stats.operation for stats in operations] == [u"update_many", u"insert_many"]
+    assert operations[0].statements[0].startswith(u"UPDATE project")
+    assert operations[0].to_dict()[u"error"] is None
+
+
+def test_errors_are_recorded(hours_count_sqlite):
+    db, operations = profiled_db(hours_count_sqlite)
+    try:
+        db.project.delete_many({})
+    except ValueError:
+        pass
+    assert isinstance(operations[0].error, ValueError)
+
+
+def test_slow_query_log(hours_count_sqlite):
+    logger = Mock()
+    db, operations = profiled_db(hours_count_sqlite, slow_query_threshold=0, logger=logger)
+    list(db.project.find())
+    assert logger.warning.call_count == 1
+    assert logger.warning.call_args[0][1:3] == (u"find", u"project")
+
+    db._profiler._slow_query_threshold = 60
+    list(db.project.find())
+    assert logger.warning.call_count == 1
+
+
+def test_without_profiler(hours_count_sqlite):
+    cursor = hours_count_sqlite.hour.find()
+    assert cursor._stats is None
+    assert len(list(cursor)) == 10
@@ -0,0 +1,95 @@
+# coding utf-8
+"""
+Result cache tests
+"""
+import io
+from mock import Mock
+from sqlcollection import Client
+from sqlcollection.result_cache import ResultCache, MemoryCacheBackend
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.sql import select, literal_column
+from .collection_test import hours_count_sqlite
+
+
+def test_memory_backend():
+    backend = MemoryCacheBackend(max_size=2)
+    backend.set(u"a", 1)
+    backend.set(u"b", 2)
+    backend.get(u"a")
+    backend.set(u"c", 3)
+    assert backend.get(u"b") is None
+    assert backend.get(u"a") == 1
+
+    backend.set(u"d", 4, ttl=-1)
+    assert backend.get(u"d") is None
+
+
+def test_invalidate_changes_keys():
+    cache = ResultCache()
+    request = select([literal_column(u"1")])
+    key = cache.make_key(request, {u"id_1": 1}, sqlite.dialect(), [u"project", u"client"])
+    assert cache.make_key(request, {u"id_1": 1}, sqlite.dialect(), [u"client", u"project"]) == key
+    assert cache.make_key(request, {u"id_1": 2}, sqlite.dialect(), [u"project", u"client"]) != key
+
+    cache.invalidate(u"client")
+    assert cache.make_key(request, {u"id_1": 1}, sqlite.dialect(), [u"project", u"client"]) != key
+
+
+def test_statements_are_compiled_once_per_structure():
+    cache = ResultCache()
+    column = literal_column(u"id")
+    keys = set(
+        cache.make_key(select([column]).where(column == value).limit(5), {}, sqlite.dialect(), [u"project"])
+        for value in (1, 2, 2)
+    )
+    assert len(keys) == 2
+    assert len(cache._statements) == 1
+
+
+def cached_db(hours_count_sqlite):
+    db = Client(url=hours_count_sqlite._url.rsplit(u"/", 1)[0], result_cache=ResultCache()).hours_count
+    for name in [u"hour", u"project"]:
+        collection = getattr(db, name)
+        collection.get_connection = Mock(side_effect=collection.get_connection)
+    return db
+
+
+def test_find_and_count_are_cached(hours_count_sqlite):
+    hour = cached_db(hours_count_sqlite).hour
+    for _ in range(2):
+        assert len(list(hour.find({u"minutes": {u"$gt": 50}}))) == 5
+        assert hour.find({u"minutes": {u"$gt": 50}}).count() == 5
+    assert hour.get_connection.call_count == 2
+
+    assert len(list(hour.find({u"minutes": {u"$gt": 60}}))) == 4
+    assert hour.get_connection.call_count == 3
+
+
+def test_writes_invalidate_joined_results(hours_count_sqlite):
+    db = cached_db(hours_count_sqlite)
+    hour, project = db.hour, db.project
+
+    assert list(hour.find({u"id": 1}, auto_lookup=1))[0][u"project"][u"name"] == u"Mobile app"
+    project.update_many({u"id": 2}, {u"$set": {u"name": u"Android app"}})
+    assert list(hour.find({u"id": 1}, auto_lookup=1))[0][u"project"][u"name"] == u"Android app"
+    assert hour.get_connection.call_count == 2
+
+    hour.insert_one({u"minutes": 5})
+    assert hour.find().count() == 11
+
+
+def test_batches_bypass_the_cache(hours_count_sqlite):
+    db = cached_db(hours_count_sqlite)
+    db._result_cache.set = Mock(side_effect=db._result_cache.set)
+    columns = db.hour.find().sort(u"id").to_columns(batch_size=2)
+    assert columns[u"id"] == list(range(1, 11))
+    assert db._result_cache.set.call_count == 0
+
+
+def test_export_bypasses_the_cache(hours_count_sqlite):
+    db = cached_db(hours_count_sqlite)
+    db._result_cache.set = Mock(side_effect=db._result_cache.set)
+    output = io.StringIO()
+    assert db.hour.find(auto_lookup=1).export(output, batch_size=3) == 10
+    assert len(output.getvalue().splitlines()) == 10
+    assert db._result_cache.set.call_count == 0